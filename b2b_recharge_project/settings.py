@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -74,11 +77,71 @@ WSGI_APPLICATION = 'b2b_recharge_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# The profile is picked with the RECHARGE_DB_PROFILE environment variable:
+#   sqlite   (default) WAL journal, a busy timeout instead of immediate
+#            "database is locked" errors, synchronous=NORMAL, and write
+#            transactions that take the write lock up front (BEGIN IMMEDIATE)
+#            so two writers never deadlock upgrading a read lock.
+#   postgres persistent, health-checked connections; or, with
+#            RECHARGE_DB_POOL=1, a psycopg connection pool (needs
+#            `psycopg[pool]`), which Django does not combine with
+#            CONN_MAX_AGE.
+DB_PROFILE = os.environ.get('RECHARGE_DB_PROFILE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('RECHARGE_DB_CONN_MAX_AGE', 60))
+
+DB_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('RECHARGE_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'OPTIONS': {
+            'timeout': int(os.environ.get('RECHARGE_DB_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+            ),
+        },
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('RECHARGE_DB_NAME', 'recharge'),
+        'USER': os.environ.get('RECHARGE_DB_USER', 'recharge'),
+        'PASSWORD': os.environ.get('RECHARGE_DB_PASSWORD', ''),
+        'HOST': os.environ.get('RECHARGE_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('RECHARGE_DB_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    },
+}
+
+if DB_PROFILE not in DB_PROFILES:
+    raise ImproperlyConfigured(
+        f"RECHARGE_DB_PROFILE must be one of {', '.join(DB_PROFILES)}, not {DB_PROFILE!r}."
+    )
+
+if DB_PROFILE == 'postgres' and os.environ.get('RECHARGE_DB_POOL') == '1':
+    DB_PROFILES['postgres']['CONN_MAX_AGE'] = 0
+    DB_PROFILES['postgres']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('RECHARGE_DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('RECHARGE_DB_POOL_MAX_SIZE', 10)),
+        'timeout': int(os.environ.get('RECHARGE_DB_POOL_TIMEOUT', 10)),
+    }
+
 DATABASES = {
+    'default': DB_PROFILES[DB_PROFILE],
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Per-process memory by default; point this at Redis or Memcached in
+# production so all workers share the cached seller balances.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -123,3 +186,147 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Recharge
+
+# Serve plain JSON requests to /api/top-up/ without DRF's serializer and
+# renderer (recharge.fast_views). Responses are identical; anything the fast
+# checks do not accept still goes through TopUpAPIView.
+RECHARGE_FAST_TOP_UP = False
+
+# Seconds after which a worker reloads the operator prefix table it keeps in
+# memory. Changes made through the ORM reload it at once in the process that
+# made them.
+RECHARGE_OPERATOR_PREFIX_REFRESH = 60
+
+# Maximum number of items accepted by /api/top-up/batch/ in a single request.
+RECHARGE_BATCH_MAX_ITEMS = 1000
+
+# How a sale picks the CreditBucket of a sharded seller: 'random' or 'round_robin'.
+RECHARGE_BUCKET_PICK = 'random'
+
+# How TopUpAPIView takes credit from a seller: 'row_lock' (SELECT ... FOR
+# UPDATE), 'conditional_update' (single UPDATE ... WHERE credit >= amount) or
+# 'optimistic' (version column with bounded retries). May also be a dotted path
+# to a ledger.DebitStrategy subclass, or a dict keyed by database vendor, e.g.
+# {'sqlite': 'conditional_update', 'default': 'row_lock'}.
+RECHARGE_DEBIT_STRATEGY = 'row_lock'
+RECHARGE_OPTIMISTIC_RETRIES = 5
+
+# Seconds an Idempotency-Key sent to /api/top-up/ is honoured. Expired keys are
+# removed by `manage.py purge_idempotency_keys`.
+RECHARGE_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Operator client used by /api/top-up/async/. BACKEND is a dotted path to a
+# recharge.gateways.OperatorGateway subclass, OPTIONS its keyword arguments.
+RECHARGE_OPERATOR_GATEWAY = {
+    'BACKEND': 'recharge.gateways.FakeOperatorGateway',
+    'OPTIONS': {},
+}
+# Seconds to wait for the operator before the sale's outcome is treated as
+# unknown; its reservation then keeps the credit until it is checked.
+RECHARGE_OPERATOR_TIMEOUT = 10
+# Seconds a reservation holds credit before it may be reclaimed, and how often
+# the async view sweeps expired reservations (`manage.py
+# release_expired_reservations` does the same from cron).
+RECHARGE_RESERVATION_TTL = 120
+RECHARGE_RESERVATION_SWEEP_INTERVAL = 30
+
+# Group commit for /api/top-up/: concurrent sales of one worker process are
+# queued and settled together, at most MAX_BATCH per transaction and waiting at
+# most MAX_WAIT_MS for a batch to fill. RESULT_TIMEOUT is how many seconds a
+# request waits for its batch before it is answered 504 with the outcome
+# unknown. Requests with an Idempotency-Key are never grouped.
+RECHARGE_GROUP_COMMIT = {
+    'ENABLED': False,
+    'MAX_BATCH': 100,
+    'MAX_WAIT_MS': 5,
+    'RESULT_TIMEOUT': 10,
+}
+
+# With ENABLED, every ledger row also writes an event to the outbox table in
+# the same transaction; only enable it together with a RECHARGE_OUTBOX_SINK
+# and a running `manage.py run_outbox`, or the table only grows. run_outbox
+# claims up to BATCH_SIZE due events at a time, hides them from other workers
+# for LEASE_SECONDS while it delivers them, retries failures with exponential
+# backoff and marks an event FAILED after MAX_ATTEMPTS. POLL_INTERVAL is the
+# pause in seconds when nothing is due.
+RECHARGE_OUTBOX = {
+    'ENABLED': False,
+    'BATCH_SIZE': 100,
+    'LEASE_SECONDS': 60,
+    'MAX_ATTEMPTS': 20,
+    'POLL_INTERVAL': 1,
+}
+
+# Where run_outbox delivers events; it refuses to run without one. BACKEND is
+# a dotted path to a recharge.outbox.Sink subclass: WebhookSink (OPTIONS: url,
+# timeout, headers) or FileSink (OPTIONS: path). MemorySink keeps events in
+# process memory and is only meant for tests.
+# RECHARGE_OUTBOX_SINK = {
+#     'BACKEND': 'recharge.outbox.WebhookSink',
+#     'OPTIONS': {'url': 'https://billing.example.com/ledger-events'},
+# }
+
+# Credit leases for /api/top-up/: each worker process moves up to a seller's
+# `credit_lease` (set per seller in the admin; 0 keeps the seller on the
+# normal path) onto a lease and sells from it without locking the seller.
+# Sales are written MAX_BATCH at a time, waiting at most MAX_WAIT_MS for a
+# batch to fill, and answered once written. A lease is topped up when it
+# falls below LOW_WATERMARK of what it was given, renewed every TTL / 2
+# seconds while used and returned when idle that long or when the process
+# exits; leases of dead processes expire after TTL seconds (see `manage.py
+# release_expired_leases`). REFRESH is how long a seller without a lease
+# size stays on the normal path before it is checked again.
+RECHARGE_CREDIT_LEASES = {
+    'ENABLED': False,
+    'TTL': 300,
+    'LOW_WATERMARK': 0.25,
+    'MAX_BATCH': 100,
+    'MAX_WAIT_MS': 5,
+    'RESULT_TIMEOUT': 10,
+    'REFRESH': 60,
+}
+
+# Per-seller admission control for /api/top-up/ and /api/top-up/async/: a
+# seller may have at most MAX_IN_FLIGHT top-ups running and may start RATE a
+# second with bursts of up to BURST; further requests get 429 with a
+# Retry-After header (RETRY_AFTER seconds when over MAX_IN_FLIGHT) instead of
+# queueing on the seller's row lock. Limits are per worker process; None
+# disables MAX_IN_FLIGHT, a RATE of None or 0 disables the token bucket.
+RECHARGE_ADMISSION = {
+    'ENABLED': False,
+    'MAX_IN_FLIGHT': 4,
+    'RATE': 50,
+    'BURST': 100,
+    'RETRY_AFTER': 1,
+}
+
+# Rows validated and applied per transaction by `manage.py import_credits`
+# and the seller admin's CSV upload.
+RECHARGE_IMPORT_CHUNK_SIZE = 1000
+
+# Page size of /api/sellers/<id>/transactions/ and the largest `limit` a client may ask for.
+RECHARGE_HISTORY_PAGE_SIZE = 50
+RECHARGE_HISTORY_MAX_PAGE_SIZE = 500
+
+# Credit requests approved per transaction by the admin "approve" action.
+RECHARGE_APPROVAL_BATCH_SIZE = 500
+
+# Cache alias that serves /api/sellers/<id>/balance/, and the longest time in
+# seconds a cached balance may be served after it changed.
+RECHARGE_BALANCE_CACHE = 'default'
+RECHARGE_BALANCE_CACHE_TIMEOUT = 5
+
+# Days (today included) recomputed by `manage.py rebuild_daily_stats --days`
+# when no number is given to daily_stats.refresh(); run it from cron every few
+# minutes to keep /api/reports/daily-sales/ current.
+RECHARGE_DAILY_STATS_REFRESH_DAYS = 2
+
+# Longest date range, in days, that /api/reports/daily-sales/ answers at once.
+RECHARGE_REPORT_MAX_DAYS = 366
+
+# Ledger rows older than this many days are moved to the archive table by
+# `manage.py archive_transactions`.
+RECHARGE_ARCHIVE_AFTER_DAYS = 90
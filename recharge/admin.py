@@ -1,62 +1,294 @@
-from django.contrib import admin
+import codecs
+from decimal import Decimal
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from .models import Seller, Transaction, CreditRequest
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from . import balance_cache, buckets, imports, ledger
+from .exceptions import InsufficientCredit
+from .models import (
+    ArchivedLedgerSummary,
+    ArchivedTransaction,
+    CreditLease,
+    CreditRequest,
+    CreditBucket,
+    Operator,
+    OperatorPrefix,
+    OutboxEvent,
+    Reservation,
+    Seller,
+    SellerDailyStats,
+    Transaction,
+)
+
+class CreditImportForm(forms.Form):
+    file = forms.FileField(label="فایل CSV")
+    create_sellers = forms.BooleanField(label="ایجاد فروشنده‌های جدید", required=False, initial=True)
+    description = forms.CharField(label="توضیحات تراکنش‌ها", required=False, initial=imports.DESCRIPTION)
 
 @admin.register(Seller)
 class SellerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'credit')
+    list_display = ('name', 'total_credit', 'credit_buckets', 'credit_lease', 'sales_today', 'sales_amount_today')
     search_fields = ('name',)
+    change_list_template = 'admin/recharge/seller/change_list.html'
+
+    def get_urls(self):
+        return [
+            path(
+                'import-credits/',
+                self.admin_site.admin_view(self.import_credits_view),
+                name='recharge_seller_import_credits'
+            ),
+            *super().get_urls(),
+        ]
+
+    def import_credits_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        form = CreditImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                # Read line by line from the upload, which Django keeps on
+                # disk once it is large.
+                result = imports.import_credits(
+                    codecs.iterdecode(form.cleaned_data['file'], 'utf-8-sig'),
+                    create_sellers=form.cleaned_data['create_sellers'],
+                    description=form.cleaned_data['description'] or imports.DESCRIPTION,
+                    max_errors=20
+                )
+            except imports.InvalidImportFile:
+                form.add_error('file', "سطر اول فایل باید عنوان ستون‌ها و شامل name و amount باشد.")
+            except UnicodeDecodeError:
+                form.add_error('file', "فایل باید با کدگذاری UTF-8 ذخیره شده باشد.")
+            else:
+                self.message_user(
+                    request,
+                    f"{result.imported} سطر از {result.rows} سطر ثبت شد (جمع {result.total_amount})"
+                    f" و {result.created_sellers} فروشنده‌ی جدید ایجاد شد."
+                )
+                for line, message in result.errors:
+                    self.message_user(request, f"سطر {line}: {message}", level=messages.WARNING)
+                if result.error_count > len(result.errors):
+                    self.message_user(
+                        request,
+                        f"و {result.error_count - len(result.errors)} سطر نادرست دیگر.",
+                        level=messages.WARNING
+                    )
+                return redirect('admin:recharge_seller_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': "بارگذاری اعتبار از فایل CSV",
+        }
+        return TemplateResponse(request, 'admin/recharge/seller/import_credits.html', context)
+
+    def get_queryset(self, request):
+        # Today's figures come from the daily stats, not from the ledger, and
+        # lag behind it until the next stats refresh.
+        today = SellerDailyStats.objects.filter(
+            seller=OuterRef('pk'), date=timezone.localdate(), transaction_type='TOPUP_SALE'
+        )
+        bucketed = (
+            CreditBucket.objects.filter(seller=OuterRef('pk'))
+            .values('seller').annotate(total=Sum('balance')).values('total')
+        )
+        leased = (
+            CreditLease.objects.filter(seller=OuterRef('pk'), status='ACTIVE')
+            .values('seller').annotate(total=Sum('amount')).values('total')
+        )
+        money = DecimalField(max_digits=12, decimal_places=2)
+        return super().get_queryset(request).annotate(
+            sales_today=Subquery(today.values('transaction_count')[:1]),
+            sales_amount_today=Subquery(today.values('total_amount')[:1]),
+            balance=F('credit')
+            + Coalesce(Subquery(bucketed), Value(0), output_field=money)
+            + Coalesce(Subquery(leased), Value(0), output_field=money),
+        )
+
+    @admin.display(description='اعتبار', ordering='balance')
+    def total_credit(self, obj):
+        # SQLite sums decimals as floats, so round back to the field's cents.
+        return Decimal(str(obj.balance)).quantize(Decimal('0.01'))
+
+    @admin.display(description='فروش امروز', ordering='sales_today')
+    def sales_today(self, obj):
+        return obj.sales_today or 0
+
+    @admin.display(description='مبلغ فروش امروز', ordering='sales_amount_today')
+    def sales_amount_today(self, obj):
+        # Sales are stored as negative ledger amounts.
+        return -(obj.sales_amount_today or 0)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            if obj.credit_buckets:
+                with transaction.atomic():
+                    buckets.configure(obj.pk, obj.credit_buckets)
+            return
+
+        # The form's credit and version were read when the page was opened;
+        # saving the whole object would undo every sale made since. Only the
+        # fields the admin changed are written.
+        changed = set(form.changed_data)
+        with transaction.atomic():
+            other_fields = changed - {'credit', 'credit_buckets'}
+            if other_fields:
+                obj.save(update_fields=other_fields)
+            if 'credit' in changed:
+                Seller.objects.filter(pk=obj.pk).update(credit=obj.credit, version=F('version') + 1)
+                # Dropped only once the new credit is visible, or a concurrent
+                # read could cache the old one again.
+                transaction.on_commit(lambda: balance_cache.invalidate(obj.pk))
+            if changed & {'credit_lease', 'credit_buckets'} and (obj.credit_lease <= 0 or obj.credit_buckets):
+                # The seller stops leasing: what is left on its leases goes
+                # back onto its credit, and sales still queued on them are
+                # settled from there.
+                for lease_id in CreditLease.objects.filter(seller=obj, status='ACTIVE').values_list('pk', flat=True):
+                    ledger.return_lease(lease_id)
+            if 'credit_buckets' in changed:
+                buckets.configure(obj.pk, obj.credit_buckets)
+
+class OperatorPrefixInline(admin.TabularInline):
+    model = OperatorPrefix
+    extra = 1
+
+@admin.register(Operator)
+class OperatorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code')
+    search_fields = ('name', 'code', 'prefixes__prefix')
+    inlines = [OperatorPrefixInline]
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('seller', 'transaction_type', 'amount', 'timestamp')
-    list_filter = ('transaction_type', 'seller')
+    list_display = ('seller', 'transaction_type', 'amount', 'operator', 'timestamp')
+    list_filter = ('transaction_type', 'operator', 'seller')
     search_fields = ('seller__name',)
 
-@admin.register(CreditRequest)
-class CreditRequestAdmin(admin.ModelAdmin):
-    list_display = ('seller', 'amount', 'status', 'created_at')
-    list_filter = ('status',)
-    actions = ['approve_requests']
+class ReadOnlyAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
 
-    @admin.action(description='تایید درخواست‌های انتخاب شده و افزایش اعتبار')
-    def approve_requests(self, request, queryset):
-        
-        pending_requests = queryset.filter(status='PENDING')
-        
-        for req in pending_requests:
-            try:
-                
-                with transaction.atomic():
-                    
-                    seller = Seller.objects.select_for_update().get(pk=req.seller.pk)
-                    
-                    seller.credit += req.amount
-                    seller.save()
-                    
-                    Transaction.objects.create(
-                        seller=seller,
-                        amount=req.amount,
-                        transaction_type='CREDIT_INCREASE',
-                        description=f'Approved request ID: {req.id}'
-                    )
-                    
-                    req.status = 'APPROVED'
-                    req.save()
+    def has_change_permission(self, request, obj=None):
+        return False
 
-            except Exception as e:
-                self.message_user(request, f"خطا در پردازش درخواست {req.id}: {e}", level='error')
-        
-        self.message_user(request, f"{pending_requests.count()} درخواست با موفقیت تایید شد.")
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'seller', 'transaction_type', 'amount', 'operator', 'timestamp')
+    list_filter = ('transaction_type', 'operator', 'period')
+    search_fields = ('seller__name',)
+    list_select_related = ('seller',)
 
+@admin.register(SellerDailyStats)
+class SellerDailyStatsAdmin(ReadOnlyAdmin):
+    list_display = ('date', 'seller', 'transaction_type', 'transaction_count', 'total_amount')
+    list_filter = ('transaction_type',)
+    date_hierarchy = 'date'
+    search_fields = ('seller__name',)
+    list_select_related = ('seller',)
 
+@admin.register(ArchivedLedgerSummary)
+class ArchivedLedgerSummaryAdmin(ReadOnlyAdmin):
+    list_display = ('seller', 'period', 'transaction_count', 'total_amount')
+    list_filter = ('period',)
+    search_fields = ('seller__name',)
+    list_select_related = ('seller',)
 
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'event_type', 'status', 'attempts', 'created_at', 'available_at', 'delivered_at')
+    list_filter = ('status', 'event_type')
+    date_hierarchy = 'created_at'
 
+@admin.register(CreditLease)
+class CreditLeaseAdmin(ReadOnlyAdmin):
+    list_display = ('seller', 'holder', 'amount', 'status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('seller__name', 'holder')
+    list_select_related = ('seller',)
 
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'amount', 'phone_number', 'status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('seller__name', 'phone_number', 'operator_reference')
+    actions = ['commit_unknown', 'release_unknown']
 
+    @admin.action(description='ثبت فروش رزروهای نامعلومی که اپراتور انجام داده است')
+    def commit_unknown(self, request, queryset):
+        committed = 0
+        for reservation in queryset.filter(status='UNKNOWN'):
+            try:
+                ledger.commit_reservation(reservation, reservation.operator_reference)
+            except InsufficientCredit:
+                self.message_user(request, f"اعتبار فروشنده برای رزرو {reservation.pk} کافی نیست.", level=messages.ERROR)
+            else:
+                committed += 1
+        self.message_user(request, f"{committed} رزرو نهایی شد.")
 
+    @admin.action(description='آزاد کردن اعتبار رزروهای نامعلومی که اپراتور انجام نداده است')
+    def release_unknown(self, request, queryset):
+        released = sum(ledger.release_reservation(reservation) for reservation in queryset.filter(status='UNKNOWN'))
+        self.message_user(request, f"اعتبار {released} رزرو آزاد شد.")
 
+@admin.register(CreditRequest)
+class CreditRequestAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'amount', 'status', 'created_at')
+    list_filter = ('status',)
+    actions = ['approve_requests']
 
+    @admin.action(description='تایید درخواست‌های انتخاب شده و افزایش اعتبار')
+    def approve_requests(self, request, queryset):
+        batch_size = getattr(settings, 'RECHARGE_APPROVAL_BATCH_SIZE', 500)
+        pending_ids = list(
+            queryset.filter(status='PENDING').order_by('pk').values_list('pk', flat=True)
+        )
 
+        approved = failed = 0
+        for start in range(0, len(pending_ids), batch_size):
+            batch_ids = pending_ids[start:start + batch_size]
+            try:
+                with transaction.atomic():
+                    # Rows approved by someone else since the selection was
+                    # made are skipped instead of being credited twice.
+                    pending = list(
+                        CreditRequest.objects.select_for_update()
+                        .filter(pk__in=batch_ids, status='PENDING')
+                        .only('pk', 'seller_id', 'amount')
+                    )
+                    ledger.add_credit_batch(
+                        (req.seller_id, req.amount, f'Approved request ID: {req.id}')
+                        for req in pending
+                    )
+                    CreditRequest.objects.filter(pk__in=[req.pk for req in pending]).update(
+                        status='APPROVED', updated_at=timezone.now()
+                    )
+                approved += len(pending)
 
+            except Exception as e:
+                failed += len(batch_ids)
+                self.message_user(
+                    request,
+                    f"خطا در پردازش درخواست‌های {batch_ids[0]} تا {batch_ids[-1]}: {e}",
+                    level='error'
+                )
 
+        skipped = len(pending_ids) - approved - failed
+        message = f"{approved} درخواست با موفقیت تایید شد."
+        if skipped:
+            message += f" {skipped} درخواست پیش‌تر بررسی شده بود."
+        self.message_user(request, message)
@@ -0,0 +1,112 @@
+"""Per-seller admission control in front of the seller's credit lock.
+
+A request is turned away before it queues on the seller row when the seller
+already has MAX_IN_FLIGHT top-ups running, or when its token bucket (RATE
+tokens a second, up to BURST) is empty. The counts live in this worker
+process, so the limits apply per process, like the group committer. Only
+sellers with requests running or a bucket that is not full yet are kept in
+memory; a full bucket is the same as no bucket and is dropped.
+"""
+import contextlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import metrics
+from .exceptions import TooManyRequests
+
+_lock = threading.Lock()
+_in_flight = {}
+# seller id -> [tokens, monotonic time of the last refill]
+_buckets = {}
+_PRUNE_INTERVAL = 60
+_pruned_at = 0.0
+
+
+def config():
+    return {
+        'ENABLED': False,
+        'MAX_IN_FLIGHT': 4,
+        'RATE': 50,
+        'BURST': 100,
+        'RETRY_AFTER': 1,
+        **getattr(settings, 'RECHARGE_ADMISSION', {}),
+    }
+
+
+def _take_token(seller_id, rate, burst, now):
+    # Returns 0 when a token was taken, else the seconds until one is available.
+    tokens, updated = _buckets.get(seller_id, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        _buckets[seller_id] = [tokens, now]
+        return (1 - tokens) / rate
+    _buckets[seller_id] = [tokens - 1, now]
+    return 0
+
+
+def _prune(rate, burst, now):
+    # Seller ids are not checked against the database, so without this every
+    # id ever sent would keep a bucket.
+    global _pruned_at
+    if now - _pruned_at < _PRUNE_INTERVAL:
+        return
+    _pruned_at = now
+    full = [
+        seller_id for seller_id, (tokens, updated) in _buckets.items()
+        if tokens + (now - updated) * rate >= burst
+    ]
+    for seller_id in full:
+        del _buckets[seller_id]
+
+
+def _reject(reason, retry_after):
+    metrics.ADMISSION_REJECTED.inc(reason)
+    raise TooManyRequests(max(1, math.ceil(retry_after)))
+
+
+@contextlib.contextmanager
+def admit(seller_id):
+    """Hold one of the seller's in-flight slots for the duration of the block, or raise TooManyRequests."""
+    options = config()
+    if not options['ENABLED']:
+        yield
+        return
+
+    max_in_flight = options['MAX_IN_FLIGHT']
+    rate = options['RATE']
+    with _lock:
+        if max_in_flight is not None and _in_flight.get(seller_id, 0) >= max_in_flight:
+            _reject('in_flight', options['RETRY_AFTER'])
+        if rate:
+            now = time.monotonic()
+            _prune(rate, options['BURST'], now)
+            wait = _take_token(seller_id, rate, options['BURST'], now)
+            if wait:
+                _reject('rate', wait)
+        _in_flight[seller_id] = _in_flight.get(seller_id, 0) + 1
+
+    try:
+        yield
+    finally:
+        with _lock:
+            if _in_flight[seller_id] == 1:
+                del _in_flight[seller_id]
+            else:
+                _in_flight[seller_id] -= 1
+
+
+def in_flight(seller_id):
+    with _lock:
+        return _in_flight.get(seller_id, 0)
+
+
+@receiver(setting_changed)
+def _reset_buckets(setting, **kwargs):
+    if setting == 'RECHARGE_ADMISSION':
+        with _lock:
+            _buckets.clear()
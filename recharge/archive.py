@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedLedgerSummary, ArchivedTransaction, Transaction
+
+FIELDS = ('id', 'seller_id', 'amount', 'transaction_type', 'timestamp', 'description', 'operator_id')
+
+
+def period_of(timestamp):
+    return timezone.localtime(timestamp).date().replace(day=1)
+
+
+def archive_before(cutoff, batch_size=5000):
+    """Move ledger rows older than `cutoff` to the archive table, oldest first.
+
+    Each batch is one transaction: the rows are copied with their original
+    ids, the per-seller monthly summaries are updated and the hot rows are
+    deleted, so every row is in exactly one of the two tables at any time.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Transaction.objects.filter(timestamp__lt=cutoff)
+                .order_by('timestamp', 'id')
+                .values(*FIELDS)[:batch_size]
+            )
+            if not rows:
+                return moved
+
+            archived = [ArchivedTransaction(period=period_of(row['timestamp']), **row) for row in rows]
+            ArchivedTransaction.objects.bulk_create(archived)
+            _add_to_summaries(archived)
+            Transaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+def _add_to_summaries(archived):
+    totals = {}
+    for row in archived:
+        key = (row.seller_id, row.period)
+        count, amount, first_id, last_id = totals.get(key, (0, 0, row.id, row.id))
+        totals[key] = (count + 1, amount + row.amount, min(first_id, row.id), max(last_id, row.id))
+
+    lookup = Q()
+    for seller_id, period in totals:
+        lookup |= Q(seller_id=seller_id, period=period)
+    existing = {
+        (summary.seller_id, summary.period): summary
+        for summary in ArchivedLedgerSummary.objects.select_for_update().filter(lookup)
+    }
+
+    changed, created = [], []
+    for (seller_id, period), (count, amount, first_id, last_id) in totals.items():
+        summary = existing.get((seller_id, period))
+        if summary is None:
+            created.append(ArchivedLedgerSummary(
+                seller_id=seller_id,
+                period=period,
+                transaction_count=count,
+                total_amount=amount,
+                first_transaction_id=first_id,
+                last_transaction_id=last_id
+            ))
+            continue
+        summary.transaction_count += count
+        summary.total_amount += amount
+        summary.first_transaction_id = min(summary.first_transaction_id, first_id)
+        summary.last_transaction_id = max(summary.last_transaction_id, last_id)
+        changed.append(summary)
+
+    ArchivedLedgerSummary.objects.bulk_update(
+        changed, ['transaction_count', 'total_amount', 'first_transaction_id', 'last_transaction_id']
+    )
+    ArchivedLedgerSummary.objects.bulk_create(created)
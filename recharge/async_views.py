@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import admission, gateways, ledger
+from .exceptions import ConcurrentUpdate, InsufficientCredit, TooManyRequests
+from .models import Seller
+from .serializers import TopUpSerializer
+
+logger = logging.getLogger(__name__)
+
+_last_sweep = 0.0
+
+
+def _json(body, status_code):
+    return JsonResponse(
+        body,
+        status=status_code,
+        encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+async def _release_expired_reservations():
+    # Reservations left behind by crashed or timed-out requests are reclaimed
+    # by whichever request comes along once the sweep interval has passed.
+    global _last_sweep
+    interval = getattr(settings, 'RECHARGE_RESERVATION_SWEEP_INTERVAL', 30)
+    now = time.monotonic()
+    if now - _last_sweep < interval:
+        return
+    _last_sweep = now
+    await sync_to_async(ledger.release_expired_reservations)()
+
+
+@csrf_exempt
+@require_POST
+async def async_top_up(request):
+    """Top-up that calls the operator between two short DB transactions.
+
+    1. reserve: debit the seller and hold the amount on a Reservation
+    2. call the operator gateway with no transaction open
+    3. commit the reservation into a ledger row, or release it on failure
+
+    When the operator does not answer in time the top-up may still have been
+    made, so the reservation keeps holding the credit as UNKNOWN until it is
+    committed or released by hand.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError as e:
+        return _json({"detail": f"JSON parse error - {e}"}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = TopUpSerializer(data=data)
+    if not serializer.is_valid():
+        return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    validated_data = serializer.validated_data
+    phone_number = validated_data['phone_number']
+    amount = validated_data['amount']
+
+    await _release_expired_reservations()
+
+    try:
+        with admission.admit(validated_data['seller_id']):
+            seller, reservation = await sync_to_async(ledger.reserve)(
+                validated_data['seller_id'], amount, phone_number
+            )
+    except TooManyRequests as e:
+        response = _json(
+            {"error": "تعداد درخواست‌های این فروشنده بیش از حد مجاز است، کمی بعد دوباره تلاش کنید."},
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except InsufficientCredit:
+        return _json({"error": "اعتبار کافی نیست."}, status.HTTP_400_BAD_REQUEST)
+    except ConcurrentUpdate:
+        return _json(
+            {"error": "اعتبار فروشنده همزمان در حال تغییر است، دوباره تلاش کنید."},
+            status.HTTP_409_CONFLICT
+        )
+    except Seller.DoesNotExist:
+        return _json({"error": "فروشنده یافت نشد."}, status.HTTP_404_NOT_FOUND)
+
+    timeout = getattr(settings, 'RECHARGE_OPERATOR_TIMEOUT', 10)
+    try:
+        operator_reference = await asyncio.wait_for(
+            gateways.get_gateway().top_up(phone_number, amount, reservation.pk),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        await sync_to_async(ledger.mark_reservation_unknown)(reservation)
+        return _json(
+            {
+                "error": "پاسخ اپراتور به موقع دریافت نشد؛ نتیجه‌ی شارژ نامعلوم است و اعتبار تا بررسی نگه داشته می‌شود.",
+                "reservation_id": reservation.pk,
+            },
+            status.HTTP_504_GATEWAY_TIMEOUT
+        )
+    except gateways.OperatorError as e:
+        await sync_to_async(ledger.release_reservation)(reservation)
+        return _json({"error": f"اپراتور شارژ را انجام نداد: {e}"}, status.HTTP_502_BAD_GATEWAY)
+
+    try:
+        await sync_to_async(ledger.commit_reservation)(reservation, operator_reference)
+    except InsufficientCredit:
+        # The reservation expired and its credit was spent before the
+        # operator answered: the top-up was made but cannot be charged.
+        logger.error(
+            "Reservation %s was topped up by the operator (%s) after it expired and cannot be charged",
+            reservation.pk, operator_reference
+        )
+        return _json(
+            {
+                "error": "شارژ انجام شد اما رزرو منقضی شده بود و اعتبار فروشنده برای ثبت آن کافی نیست.",
+                "reservation_id": reservation.pk,
+                "operator_reference": operator_reference,
+            },
+            status.HTTP_409_CONFLICT
+        )
+    remaining_credit = await sync_to_async(lambda: seller.total_credit)()
+
+    return _json(
+        {
+            "message": "شارژ با موفقیت انجام شد.",
+            "remaining_credit": remaining_credit,
+            "reservation_id": reservation.pk,
+            "operator_reference": operator_reference,
+        },
+        status.HTTP_200_OK
+    )
@@ -0,0 +1,45 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY = 'recharge:balance:{}'
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'writes': 0, 'invalidations': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'RECHARGE_BALANCE_CACHE', 'default')]
+
+
+def _timeout():
+    # Entries expire after this many seconds, which bounds how stale a
+    # balance can get if a write-through update is ever missed or reordered.
+    return getattr(settings, 'RECHARGE_BALANCE_CACHE_TIMEOUT', 5)
+
+
+def _count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def get(seller_id):
+    balance = _cache().get(KEY.format(seller_id))
+    _count('misses' if balance is None else 'hits')
+    return balance
+
+
+def store(seller_id, balance):
+    _cache().set(KEY.format(seller_id), balance, _timeout())
+    _count('writes')
+
+
+def invalidate(*seller_ids):
+    _cache().delete_many([KEY.format(seller_id) for seller_id in seller_ids])
+    _count('invalidations', len(seller_ids))
+
+
+def stats():
+    with _lock:
+        return dict(_counters)
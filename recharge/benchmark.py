@@ -0,0 +1,278 @@
+"""Load and contention benchmark for the top-up path, driven by `manage.py bench_topup`."""
+import contextlib
+import math
+import multiprocessing
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from . import fast_views, ledger, outbox
+from .exceptions import ConcurrentUpdate
+from .models import Seller, Transaction
+
+SELLER_NAME_PREFIX = 'bench-topup-'
+PHONE_NUMBER = '09120000000'
+
+
+@dataclass
+class BenchConfig:
+    requests: int = 1000
+    sellers: int = 10
+    # `hot_share` of the requests go to the first `hot_sellers` sellers, the
+    # rest are spread evenly over the others.
+    hot_sellers: int = 1
+    hot_share: float = 0.9
+    workers: int = 8
+    mode: str = 'thread'
+    target: str = 'ledger'
+    database: str = DEFAULT_DB_ALIAS
+    amount: Decimal = Decimal('1000.00')
+    credit: Decimal = Decimal('1000000000.00')
+    retries: int = 3
+    seed: int = 0
+
+
+@dataclass
+class WorkerResult:
+    latencies: list = field(default_factory=list)
+    lock_wait: float = 0.0
+    succeeded: int = 0
+    retries: int = 0
+    failures: Counter = field(default_factory=Counter)
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.lock_wait += other.lock_wait
+        self.succeeded += other.succeeded
+        self.retries += other.retries
+        self.failures.update(other.failures)
+
+
+class _Retry(Exception):
+    pass
+
+
+class _Failed(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def use_database(alias):
+    # The ledger writes through the default connection; pointing this
+    # thread's default at another alias runs it against that database.
+    if alias == DEFAULT_DB_ALIAS:
+        yield
+        return
+    default = connections[DEFAULT_DB_ALIAS]
+    connections[DEFAULT_DB_ALIAS] = connections[alias]
+    try:
+        yield
+    finally:
+        connections[DEFAULT_DB_ALIAS] = default
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def plan(config, seller_ids):
+    """Return the seller id of every request, drawn with the configured hot/cold skew."""
+    rng = random.Random(config.seed)
+    hot, cold = seller_ids[:config.hot_sellers], seller_ids[config.hot_sellers:]
+    if not cold:
+        return [rng.choice(hot) for _ in range(config.requests)]
+    return [
+        rng.choice(hot) if rng.random() < config.hot_share else rng.choice(cold)
+        for _ in range(config.requests)
+    ]
+
+
+def create_sellers(config):
+    Seller.objects.filter(name__startswith=SELLER_NAME_PREFIX).delete()
+    Seller.objects.bulk_create([
+        Seller(name=f'{SELLER_NAME_PREFIX}{index}', credit=config.credit)
+        for index in range(config.sellers)
+    ])
+    return list(
+        Seller.objects.filter(name__startswith=SELLER_NAME_PREFIX).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def delete_sellers():
+    Seller.objects.filter(name__startswith=SELLER_NAME_PREFIX).delete()
+
+
+def _top_up_ledger(seller_id, amount):
+    try:
+        ledger.sell(seller_id, amount, PHONE_NUMBER)
+    except (ConcurrentUpdate, OperationalError) as e:
+        # OperationalError covers "database is locked", deadlocks and
+        # serialization failures, all of which a client would retry.
+        raise _Retry(type(e).__name__) from e
+
+
+def _through(view):
+    def top_up(seller_id, amount):
+        request = APIRequestFactory().post(
+            '/api/top-up/',
+            {'seller_id': seller_id, 'phone_number': PHONE_NUMBER, 'amount': str(amount)},
+            format='json'
+        )
+        response = view(request)
+        if response.status_code == 409:
+            raise _Retry('HTTP 409')
+        if response.status_code != 200:
+            raise _Failed(f'HTTP {response.status_code}')
+    return top_up
+
+
+TARGETS = {
+    'ledger': _top_up_ledger,
+    'api': _through(fast_views.drf_top_up),
+    'fast_api': _through(fast_views.fast_top_up),
+}
+
+
+def run_requests(config, seller_ids):
+    """Send the given requests one after another and time each of them."""
+    result = WorkerResult()
+    top_up = TARGETS[config.target]
+
+    def timed(execute, sql, params, many, context):
+        # Row locks are taken by SELECT ... FOR UPDATE and UPDATE; on SQLite
+        # an UPDATE also waits here for the database write lock.
+        statement = sql.lstrip()[:6].upper()
+        if statement != 'UPDATE' and 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            result.lock_wait += time.perf_counter() - started
+
+    with use_database(config.database):
+        with connection.execute_wrapper(timed):
+            for seller_id in seller_ids:
+                started = time.perf_counter()
+                for attempt in range(config.retries + 1):
+                    try:
+                        top_up(seller_id, config.amount)
+                    except _Retry as e:
+                        if attempt < config.retries:
+                            result.retries += 1
+                            continue
+                        result.failures[str(e)] += 1
+                    except _Failed as e:
+                        result.failures[str(e)] += 1
+                    except Exception as e:
+                        result.failures[type(e).__name__] += 1
+                    else:
+                        result.succeeded += 1
+                    break
+                result.latencies.append(time.perf_counter() - started)
+        connection.close()
+    return result
+
+
+def run(config):
+    """Run the benchmark and return its report as a JSON-serializable dict.
+
+    Benchmark sellers are created before the run and removed afterwards, and
+    their sales write no outbox events, which would outlive them. The report
+    ends with a ledger check: every seller's credit must equal its starting
+    credit plus its ledger rows.
+    """
+    with outbox.suspended():
+        return _run(config)
+
+
+def _run(config):
+    with use_database(config.database):
+        seller_ids = create_sellers(config)
+        requests = plan(config, seller_ids)
+        vendor = connection.vendor
+    # Nothing may be left open for the forked workers to inherit.
+    connections.close_all()
+
+    # Round-robin split, so every worker sees the same hot/cold mix.
+    shares = [requests[index::config.workers] for index in range(config.workers)]
+    result = WorkerResult()
+    started_at = timezone.now()
+    started = time.perf_counter()
+    if config.mode == 'process':
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(config.workers, mp_context=context) as pool:
+            for worker_result in pool.map(run_requests, [config] * config.workers, shares):
+                result.merge(worker_result)
+    else:
+        with ThreadPoolExecutor(config.workers) as pool:
+            for worker_result in pool.map(run_requests, [config] * config.workers, shares):
+                result.merge(worker_result)
+    elapsed = time.perf_counter() - started
+
+    with use_database(config.database):
+        consistent = ledger_matches(seller_ids, config.credit)
+        delete_sellers()
+
+    return report(config, result, elapsed, started_at, vendor, consistent)
+
+
+def ledger_matches(seller_ids, opening_credit):
+    sums = dict(
+        Transaction.objects.filter(seller_id__in=seller_ids)
+        .values('seller_id').annotate(total=Sum('amount')).values_list('seller_id', 'total')
+    )
+    for seller in Seller.objects.filter(pk__in=seller_ids):
+        expected = (opening_credit + Decimal(sums.get(seller.pk) or 0)).quantize(Decimal('0.01'))
+        if seller.total_credit != expected:
+            return False
+    return True
+
+
+def to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def report(config, result, elapsed, started_at, vendor, consistent):
+    latencies = sorted(result.latencies)
+    options = asdict(config)
+    options['amount'] = str(config.amount)
+    options['credit'] = str(config.credit)
+    return {
+        'started_at': started_at.isoformat(),
+        'config': options,
+        'vendor': vendor,
+        'debit_strategy': getattr(settings, 'RECHARGE_DEBIT_STRATEGY', 'row_lock'),
+        'requests': len(latencies),
+        'succeeded': result.succeeded,
+        'failed': sum(result.failures.values()),
+        'failures': dict(result.failures),
+        'retries': result.retries,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(result.succeeded / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': to_ms(percentile(latencies, 50)),
+            'p95': to_ms(percentile(latencies, 95)),
+            'p99': to_ms(percentile(latencies, 99)),
+            'max': to_ms(latencies[-1] if latencies else None),
+        },
+        'lock_wait_ms': {
+            'total': to_ms(result.lock_wait),
+            'per_request': to_ms(result.lock_wait / len(latencies)) if latencies else None,
+        },
+        'ledger_consistent': consistent,
+    }
@@ -0,0 +1,111 @@
+import itertools
+import random
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db.models import F
+
+from .exceptions import InsufficientCredit
+from .models import CreditBucket, Seller
+
+CENT = Decimal('0.01')
+
+_round_robin = itertools.count()
+
+
+def pick_bucket(seller):
+    if getattr(settings, 'RECHARGE_BUCKET_PICK', 'random') == 'round_robin':
+        return next(_round_robin) % seller.credit_buckets
+    return random.randrange(seller.credit_buckets)
+
+
+def absorb(seller):
+    """Lock all buckets of an already locked seller and pool their balance into `seller.credit`.
+
+    Only the in-memory objects are changed; `spread` writes them back.
+    """
+    buckets = list(
+        CreditBucket.objects.select_for_update().filter(seller=seller).order_by('index')
+    )
+    for bucket in buckets:
+        seller.credit += bucket.balance
+        bucket.balance = Decimal('0.00')
+    return buckets
+
+
+def spread(seller, buckets):
+    """Split `seller.credit` evenly over `seller.credit_buckets` buckets.
+
+    Surplus buckets are removed, missing ones are created, and the cents that
+    do not divide evenly stay on `seller.credit`. The caller saves `seller`.
+    """
+    count = seller.credit_buckets
+    keep = [bucket for bucket in buckets if bucket.index < count]
+    surplus = [bucket.pk for bucket in buckets if bucket.index >= count]
+    if surplus:
+        CreditBucket.objects.filter(pk__in=surplus).delete()
+    if not count:
+        return
+
+    share = (seller.credit / count).quantize(CENT, rounding=ROUND_DOWN)
+    if share < 0:
+        share = Decimal('0.00')
+    existing = {bucket.index for bucket in keep}
+    for bucket in keep:
+        bucket.balance = share
+    CreditBucket.objects.bulk_update(keep, ['balance'])
+    CreditBucket.objects.bulk_create([
+        CreditBucket(seller=seller, index=index, balance=share)
+        for index in range(count) if index not in existing
+    ])
+    seller.credit -= share * count
+
+
+def rebalance(seller_id):
+    seller = Seller.objects.select_for_update(no_key=True).get(pk=seller_id)
+    buckets = absorb(seller)
+    spread(seller, buckets)
+    seller.version += 1
+    seller.save(update_fields=['credit', 'version'])
+    return seller
+
+
+def configure(seller_id, count):
+    """Change the number of buckets of a seller and redistribute its credit. Must run inside a transaction."""
+    seller = Seller.objects.select_for_update(no_key=True).get(pk=seller_id)
+    buckets = absorb(seller)
+    seller.credit_buckets = count
+    spread(seller, buckets)
+    seller.version += 1
+    seller.save(update_fields=['credit', 'credit_buckets', 'version'])
+    return seller
+
+
+def debit(seller, amount):
+    """Take `amount` from one bucket of `seller`, falling back to a full rebalance.
+
+    Must run inside a transaction. The fast path is a conditional UPDATE that
+    only locks the chosen bucket row, so concurrent sales of the same seller
+    spread over `credit_buckets` rows instead of queueing on the Seller row.
+    """
+    index = pick_bucket(seller)
+    updated = CreditBucket.objects.filter(
+        seller_id=seller.pk, index=index, balance__gte=amount
+    ).update(balance=F('balance') - amount)
+    if updated:
+        return
+
+    # The chosen bucket is short (or missing): pool everything under the
+    # seller lock, take the amount from the pool and spread the rest again.
+    # The lock is FOR NO KEY UPDATE, and so are the other seller locks taken
+    # before the buckets: a sale on the fast path holds its bucket row while
+    # its ledger row's foreign key takes FOR KEY SHARE on the seller, which a
+    # plain FOR UPDATE would block, deadlocking the two on PostgreSQL.
+    locked = Seller.objects.select_for_update(no_key=True).get(pk=seller.pk)
+    buckets = absorb(locked)
+    if locked.credit < amount:
+        raise InsufficientCredit()
+    locked.credit -= amount
+    spread(locked, buckets)
+    locked.version += 1
+    locked.save(update_fields=['credit', 'version'])
@@ -0,0 +1,70 @@
+"""Per-seller daily ledger totals, folded from the ledger by a periodic job.
+
+Ledger writes do not touch the stats table: one stats row per seller and day
+would be a second hot row on every sale, locked until the sale commits.
+Instead `manage.py rebuild_daily_stats --days 2`, run from cron every few
+minutes, recomputes the recent days; the reports and the admin lag behind
+the ledger by that interval.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import period_of
+from .models import ArchivedTransaction, SellerDailyStats, Transaction
+
+
+def rebuild(date_from=None):
+    """Recompute the stats from the ledger (hot and archived rows), from `date_from` on or for all days.
+
+    The stats of those days are replaced in one transaction, so running it
+    again (or alongside ledger writes) never counts a row twice.
+    """
+    with transaction.atomic():
+        stats = SellerDailyStats.objects.all()
+        if date_from is not None:
+            stats = stats.filter(date__gte=date_from)
+        stats.delete()
+
+        totals = {}
+        for model in (Transaction, ArchivedTransaction):
+            rows = model.objects.annotate(date=TruncDate('timestamp'))
+            if date_from is not None:
+                # A range on the column itself, so the timestamp index is used.
+                start = timezone.make_aware(datetime.combine(date_from, time.min))
+                rows = rows.filter(timestamp__gte=start)
+                if model is ArchivedTransaction:
+                    # The archive has no timestamp index; its period index
+                    # narrows the scan to the months the range touches.
+                    rows = rows.filter(period__gte=period_of(start))
+            grouped = (
+                rows.order_by().values('seller_id', 'date', 'transaction_type')
+                .annotate(count=Count('id'), amount=Sum('amount'))
+            )
+            for row in grouped:
+                key = (row['seller_id'], row['date'], row['transaction_type'])
+                count, amount = totals.get(key, (0, 0))
+                totals[key] = (count + row['count'], amount + row['amount'])
+
+        SellerDailyStats.objects.bulk_create([
+            SellerDailyStats(
+                seller_id=seller_id,
+                date=date,
+                transaction_type=transaction_type,
+                transaction_count=count,
+                total_amount=amount
+            )
+            for (seller_id, date, transaction_type), (count, amount) in totals.items()
+        ], batch_size=1000)
+        return len(totals)
+
+
+def refresh(days=None):
+    """Recompute the last `days` days (today included), RECHARGE_DAILY_STATS_REFRESH_DAYS by default."""
+    if days is None:
+        days = getattr(settings, 'RECHARGE_DAILY_STATS_REFRESH_DAYS', 2)
+    return rebuild(timezone.localdate() - timedelta(days=days - 1))
@@ -0,0 +1,12 @@
+class InsufficientCredit(Exception):
+    pass
+
+
+class ConcurrentUpdate(Exception):
+    pass
+
+
+class TooManyRequests(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
@@ -0,0 +1,132 @@
+import json
+import re
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import idempotency, metrics
+from .operators import normalize_phone_number
+from .views import TopUpAPIView, perform_top_up
+
+CENT = Decimal('0.01')
+
+# Only values that TopUpSerializer accepts unchanged are taken on the fast
+# path; anything else (including every invalid request) is handed to
+# TopUpAPIView, so error messages and edge cases stay exactly as DRF has them.
+_SELLER_ID = re.compile(r'[1-9][0-9]{0,17}')
+# TopUpSerializer.amount is max_digits=10, decimal_places=2.
+_AMOUNT = re.compile(r'[0-9]{1,8}(?:\.[0-9]{1,2})?')
+_PHONE_NUMBER_MAX_LENGTH = 20
+_MAX_SELLER_ID = 10 ** 18
+
+_ACCEPT = {'', '*/*', 'application/json'}
+
+drf_top_up = TopUpAPIView.as_view()
+
+
+def _reject_constant(name):
+    # DRF's JSONParser is strict: NaN and Infinity are not JSON.
+    raise ValueError(name)
+
+
+_decode = json.JSONDecoder(parse_constant=_reject_constant).decode
+
+
+def _encode_default(obj):
+    # The same representation as DRF's JSONEncoder.
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_encode_default).encode
+
+
+def _is_plain(request):
+    # Requests DRF might treat differently (other media types, browsable API,
+    # authentication and the CSRF check that comes with a session) keep
+    # going through it.
+    return (
+        request.method == 'POST'
+        and request.content_type == 'application/json'
+        and request.content_params.get('charset', 'utf-8').lower() == 'utf-8'
+        and request.META.get('HTTP_ACCEPT', '') in _ACCEPT
+        and 'format' not in request.GET
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def parse_top_up(body):
+    """Return (seller_id, amount, phone_number) if TopUpSerializer would accept `body` as is, else None."""
+    try:
+        data = _decode(body.decode('utf-8'))
+    except ValueError:
+        return None
+    if type(data) is not dict:
+        return None
+
+    seller_id = data.get('seller_id')
+    if type(seller_id) is str and _SELLER_ID.fullmatch(seller_id):
+        seller_id = int(seller_id)
+    elif type(seller_id) is not int or not 0 < seller_id < _MAX_SELLER_ID:
+        return None
+
+    amount = data.get('amount')
+    if type(amount) is str and _AMOUNT.fullmatch(amount):
+        amount = Decimal(amount).quantize(CENT)
+    elif type(amount) is int and 0 < amount < 10 ** 8:
+        amount = Decimal(amount).quantize(CENT)
+    else:
+        return None
+    if amount <= 0:
+        return None
+
+    phone_number = data.get('phone_number')
+    if type(phone_number) is not str:
+        return None
+    phone_number = phone_number.strip()
+    # isprintable() also rules out the NUL and surrogate characters DRF rejects.
+    if not 0 < len(phone_number) <= _PHONE_NUMBER_MAX_LENGTH or not phone_number.isprintable():
+        return None
+    phone_number = normalize_phone_number(phone_number)
+    if not phone_number:
+        return None
+
+    return seller_id, amount, phone_number
+
+
+@csrf_exempt
+def fast_top_up(request):
+    """/api/top-up/ without DRF's parsing, serializer, content negotiation and rendering.
+
+    Answers with the same status codes and JSON bytes as TopUpAPIView, which
+    still handles every request the fast checks do not accept.
+    """
+    started = time.perf_counter()
+    parsed = parse_top_up(request.body) if _is_plain(request) else None
+    if parsed is None:
+        return drf_top_up(request)
+
+    with metrics.top_up_probe() as probe:
+        probe.record('validate', time.perf_counter() - started)
+        body, status_code, headers = perform_top_up(probe, *parsed, request.headers.get(idempotency.HEADER))
+
+    # DRF escapes these two so the output is also valid JavaScript.
+    content = _encode(body).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    response = HttpResponse(content.encode(), status=status_code, content_type='application/json')
+    response['Vary'] = 'Accept'
+    response['Allow'] = 'POST, OPTIONS'
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+@csrf_exempt
+def top_up(request):
+    if getattr(settings, 'RECHARGE_FAST_TOP_UP', False):
+        return fast_top_up(request)
+    return drf_top_up(request)
@@ -0,0 +1,64 @@
+import asyncio
+import itertools
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class OperatorError(Exception):
+    pass
+
+
+class OperatorGateway:
+    """Client for the mobile operator's top-up API.
+
+    Subclasses implement `top_up` as a coroutine so many operator calls can be
+    in flight at once without holding a worker thread or a database lock.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    async def top_up(self, phone_number, amount, reference):
+        """Charge `phone_number` and return the operator's reference, or raise OperatorError."""
+        raise NotImplementedError
+
+
+class FakeOperatorGateway(OperatorGateway):
+    """In-process gateway for development and tests. Numbers in `fail_numbers` are refused."""
+
+    def __init__(self, delay=0, fail_numbers=(), **options):
+        super().__init__(**options)
+        self.delay = delay
+        self.fail_numbers = set(fail_numbers)
+        self.calls = []
+        self._references = itertools.count(1)
+
+    async def top_up(self, phone_number, amount, reference):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.calls.append((phone_number, amount, reference))
+        if phone_number in self.fail_numbers:
+            raise OperatorError(f"Operator refused {phone_number}")
+        return f"FAKE-{next(self._references)}"
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        config = getattr(settings, 'RECHARGE_OPERATOR_GATEWAY', {})
+        gateway_class = import_string(config.get('BACKEND', 'recharge.gateways.FakeOperatorGateway'))
+        _gateway = gateway_class(**config.get('OPTIONS', {}))
+    return _gateway
+
+
+@receiver(setting_changed)
+def _reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting == 'RECHARGE_OPERATOR_GATEWAY':
+        _gateway = None
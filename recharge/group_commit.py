@@ -0,0 +1,165 @@
+import bisect
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from . import ledger
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class GroupCommitter:
+    """Coalesces concurrent top-ups of one worker process into shared DB transactions.
+
+    Request threads `submit` a sale and wait on the returned Future. A single
+    committer thread takes up to `max_batch` queued sales, waiting at most
+    `max_wait` seconds for the batch to fill, and settles them together with
+    `ledger.sell_batch`: one lock and balance update per seller, one bulk
+    insert of ledger rows and one commit for the whole batch.
+    """
+
+    def __init__(self, max_batch=100, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        # batch_size_counts[i] counts batches no larger than
+        # BATCH_SIZE_BUCKETS[i] (and larger than the bucket before it); the
+        # last slot counts anything bigger.
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def submit(self, seller_id, amount, phone_number):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, seller_id, amount, phone_number))
+        return future
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'largest_batch': self.largest_batch,
+                'batch_size_buckets': BATCH_SIZE_BUCKETS,
+                'batch_size_counts': list(self.batch_size_counts),
+                'queued': self._queue.qsize(),
+            }
+
+    def _ensure_started(self):
+        # A forked worker does not inherit the parent's thread, so the pid is
+        # checked as well as the thread itself.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='recharge-group-commit', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            self._commit(batch)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Sales already queued are always taken; only waiting for more
+            # is bounded by max_wait.
+            remaining = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch):
+        sales_by_seller = {}
+        for key, (_, seller_id, amount, phone_number) in enumerate(batch):
+            sales_by_seller.setdefault(seller_id, []).append((key, amount, phone_number))
+
+        try:
+            outcomes = ledger.sell_batch(sales_by_seller)
+        except Exception as e:
+            for future, *_ in batch:
+                future.set_exception(e)
+        else:
+            for key, (future, *_) in enumerate(batch):
+                outcome = outcomes[key]
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.batch_size_counts[bisect.bisect_left(BATCH_SIZE_BUCKETS, len(batch))] += 1
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def config():
+    return {
+        'ENABLED': False,
+        'MAX_BATCH': 100,
+        'MAX_WAIT_MS': 5,
+        'RESULT_TIMEOUT': 10,
+        **getattr(settings, 'RECHARGE_GROUP_COMMIT', {}),
+    }
+
+
+def is_enabled():
+    return config()['ENABLED']
+
+
+def get_committer():
+    global _committer
+    if _committer is None:
+        with _committer_lock:
+            if _committer is None:
+                options = config()
+                _committer = GroupCommitter(
+                    max_batch=options['MAX_BATCH'],
+                    max_wait=options['MAX_WAIT_MS'] / 1000,
+                )
+    return _committer
+
+
+def sell(seller_id, amount, phone_number):
+    """Queue a sale for the next group commit and wait for its own outcome.
+
+    Returns the seller's remaining credit, or raises the InsufficientCredit /
+    Seller.DoesNotExist that rejected this sale. Raises TimeoutError after
+    RESULT_TIMEOUT seconds; the sale may still be committed after that.
+    """
+    future = get_committer().submit(seller_id, amount, phone_number)
+    return future.result(timeout=config()['RESULT_TIMEOUT'])
+
+
+@receiver(setting_changed)
+def _reset_committer(setting, **kwargs):
+    global _committer
+    if setting == 'RECHARGE_GROUP_COMMIT':
+        _committer = None
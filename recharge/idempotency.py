@@ -0,0 +1,60 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'RECHARGE_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def fingerprint(amount, phone_number):
+    """Digest of the payload a key is used with, so a reuse with another amount or number can be told apart."""
+    return hashlib.sha256(f"{amount:.2f}|{phone_number}".encode()).hexdigest()
+
+
+def matches(stored, fingerprint):
+    # Keys stored before fingerprints were recorded match any payload.
+    return not stored.fingerprint or stored.fingerprint == fingerprint
+
+
+def lookup(seller_id, key):
+    """Return the stored response for (seller, key), or None. An expired entry is dropped so the key can be reused."""
+    stored = IdempotencyKey.objects.filter(seller_id=seller_id, key=key).first()
+    if stored is not None and stored.created_at < timezone.now() - ttl():
+        stored.delete()
+        return None
+    return stored
+
+
+def remember(seller_id, key, fingerprint, status_code, body):
+    # Store the body exactly as the JSON renderer sends it (e.g. Decimal as a
+    # number), so a replay is byte-for-byte the same as the first answer.
+    return IdempotencyKey.objects.create(
+        seller_id=seller_id,
+        key=key,
+        fingerprint=fingerprint,
+        status_code=status_code,
+        response=json.loads(json.dumps(body, cls=JSONEncoder)),
+    )
+
+
+def purge(batch_size=1000):
+    cutoff = timezone.now() - ttl()
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,148 @@
+"""Bulk import of seller credits (and new sellers with their opening balance) from CSV.
+
+The file needs a header row with `name` and `amount` columns and may have a
+`description` column. It is read as a stream and applied in chunks: every
+chunk costs one seller lookup, one bulk insert of any missing sellers and
+one `ledger.add_credit_batch`, in one transaction. A bad row is reported and
+skipped, and a chunk the database rejects is reported row by row, without
+stopping the rest of the file.
+"""
+import csv
+import itertools
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import ledger
+from .models import Seller
+
+CENT = Decimal('0.01')
+# Seller.credit is max_digits=12, decimal_places=2.
+MAX_AMOUNT = Decimal('9999999999.99')
+NAME_MAX_LENGTH = Seller._meta.get_field('name').max_length
+DESCRIPTION = 'Imported credit'
+
+
+class InvalidImportFile(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    imported: int = 0
+    created_sellers: int = 0
+    total_amount: Decimal = Decimal('0.00')
+    error_count: int = 0
+    # The first `max_errors` bad rows as (line number, message); every one
+    # also goes to the `on_error` callback with the row itself.
+    errors: list = field(default_factory=list)
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal((value or '').strip())
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount <= 0 or amount > MAX_AMOUNT or amount != amount.quantize(CENT):
+        return None
+    return amount.quantize(CENT)
+
+
+def _check_row(row):
+    """Return (name, amount, description) or an error message."""
+    if None in row:
+        return "تعداد ستون‌ها بیش از سرستون‌هاست."
+    name = (row.get('name') or '').strip()
+    if not name:
+        return "نام فروشنده خالی است."
+    if len(name) > NAME_MAX_LENGTH:
+        return f"نام فروشنده بیش از {NAME_MAX_LENGTH} کاراکتر است."
+    amount = parse_amount(row.get('amount'))
+    if amount is None:
+        return "مبلغ باید عددی مثبت با حداکثر دو رقم اعشار باشد."
+    return name, amount, (row.get('description') or '').strip()
+
+
+def import_credits(lines, chunk_size=None, create_sellers=True, description=DESCRIPTION,
+                   max_errors=100, on_error=None):
+    """Apply the credits in the CSV `lines` (any iterable of text lines, e.g. an open file).
+
+    Sellers missing from the database are created with a zero credit before
+    their first credit is applied, unless `create_sellers` is False, in which
+    case their rows are reported as errors. Rows without a description get
+    `description`. `on_error(line, row, message)` is called for each bad row.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'RECHARGE_IMPORT_CHUNK_SIZE', 1000)
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or not {'name', 'amount'} <= {name.strip() for name in reader.fieldnames}:
+        raise InvalidImportFile("The file must start with a header row containing `name` and `amount`.")
+    reader.fieldnames = [name.strip() for name in reader.fieldnames]
+
+    result = ImportResult()
+
+    def report(line, row, message):
+        result.error_count += 1
+        if len(result.errors) < max_errors:
+            result.errors.append((line, message))
+        if on_error is not None:
+            on_error(line, row, message)
+
+    numbered = ((reader.line_num, row) for row in reader)
+    while True:
+        chunk = list(itertools.islice(numbered, chunk_size))
+        if not chunk:
+            return result
+        result.rows += len(chunk)
+
+        valid = []
+        for line, row in chunk:
+            checked = _check_row(row)
+            if isinstance(checked, str):
+                report(line, row, checked)
+            else:
+                valid.append((line, row, *checked))
+        if valid:
+            _apply_chunk(valid, create_sellers, description, result, report)
+
+
+def _apply_chunk(rows, create_sellers, description, result, report):
+    names = {name for _, _, name, _, _ in rows}
+    try:
+        with transaction.atomic():
+            sellers = Seller.objects.in_bulk(names, field_name='name')
+            created = 0
+            missing = names - sellers.keys()
+            if missing and create_sellers:
+                try:
+                    with transaction.atomic():
+                        created = len(Seller.objects.bulk_create([Seller(name=name) for name in sorted(missing)]))
+                except IntegrityError:
+                    # Someone else created some of them meanwhile; only the
+                    # ones this import inserts are counted as created.
+                    created = sum(Seller.objects.get_or_create(name=name)[1] for name in sorted(missing))
+                sellers.update(Seller.objects.in_bulk(missing, field_name='name'))
+
+            credits = []
+            unknown = []
+            for line, row, name, amount, row_description in rows:
+                seller = sellers.get(name)
+                if seller is None:
+                    unknown.append((line, row))
+                    continue
+                credits.append((seller.pk, amount, row_description or description))
+            if credits:
+                ledger.add_credit_batch(credits)
+    except Exception as e:
+        for line, row, *_ in rows:
+            report(line, row, f"ثبت این بخش از فایل ناموفق بود: {e}")
+        return
+
+    for line, row in unknown:
+        report(line, row, "فروشنده یافت نشد.")
+    result.imported += len(credits)
+    result.created_sellers += created
+    result.total_amount += sum((amount for _, amount, _ in credits), Decimal('0.00'))
@@ -0,0 +1,352 @@
+"""Per-process credit leases for high-volume sellers.
+
+A worker process moves a slice of a seller's credit (up to
+`Seller.credit_lease`) onto a CreditLease in one locked transaction and then
+takes sales from that allowance in memory. A flusher thread writes the
+sales' ledger rows in batches with `ledger.sell_from_leases`, which touches
+only the process's own lease rows, never the seller's; each request is
+answered once its ledger row is committed. A lease is topped up when it runs
+low, its expiry is pushed back on every flush, and it is returned when the
+process exits or stops using it. `manage.py release_expired_leases` returns
+the leases of processes that died.
+
+A sale the allowance cannot cover goes through the normal locked path, so a
+seller never sells more than its real balance; it may be refused while some
+credit still sits on other processes' leases.
+"""
+import atexit
+import contextlib
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from . import ledger
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Lease:
+    __slots__ = ('lease_id', 'allowance', 'refill_below', 'renew_at', 'used_at')
+
+    def __init__(self, lease_id):
+        self.lease_id = lease_id
+        self.allowance = Decimal('0.00')
+        self.refill_below = Decimal('0.00')
+        self.renew_at = 0.0
+        self.used_at = time.monotonic()
+
+
+class LeaseManager:
+    """The credit leases of one worker process and the thread that writes their sales out."""
+
+    def __init__(self, ttl=300, low_watermark=0.25, max_batch=100, max_wait=0.005, result_timeout=10, refresh=60):
+        self.ttl = ttl
+        self.low_watermark = Decimal(str(low_watermark))
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.result_timeout = result_timeout
+        self.refresh = refresh
+        self.holder = None
+        self._leases = {}
+        # seller id -> monotonic time until which the seller is known not to use leases
+        self._unleased = {}
+        self._seller_locks = {}
+        self._locks_lock = threading.Lock()
+        self._upkeep_at = 0.0
+        # Held while sales are written out or leases returned, so that
+        # release_all() sees everything flushed before it returns the leases.
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+
+    def sell(self, seller_id, amount, phone_number):
+        """Take a sale from this process's lease on the seller and wait until its ledger row is committed.
+
+        Returns the seller's remaining credit (what is left on the seller and
+        on all its active leases once the sale is written), or None when the
+        sale has to go through the normal path. Raises InsufficientCredit if the lease had been returned and
+        the seller's credit no longer covers the sale, and TimeoutError if
+        the sale is not written within `result_timeout`; it may still be
+        written after that.
+        """
+        self._ensure_started()
+        now = time.monotonic()
+        if self._unleased.get(seller_id, 0) > now:
+            return None
+
+        with self._seller_lock(seller_id):
+            lease = self._leases.get(seller_id)
+            if lease is None or lease.allowance < amount or lease.renew_at <= now:
+                lease = self._renew(seller_id, amount)
+                if lease is None or lease.allowance < amount:
+                    return None
+            lease.allowance -= amount
+            lease.used_at = now
+            future = Future()
+            self._queue.put((future, seller_id, lease.lease_id, amount, phone_number))
+
+        return future.result(timeout=self.result_timeout)
+
+    def release_all(self):
+        """Write out the queued sales and return every lease of this process."""
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                self._queue.put(_STOP)
+                batch = [item for item in batch if item is not _STOP]
+            if batch:
+                self._flush(batch)
+            for seller_id in list(self._leases):
+                self._return(seller_id)
+
+    def stop(self):
+        self._queue.put(_STOP)
+
+    @contextlib.contextmanager
+    def _seller_lock(self, seller_id):
+        while True:
+            lock = self._seller_locks.get(seller_id)
+            if lock is None:
+                with self._locks_lock:
+                    lock = self._seller_locks.setdefault(seller_id, threading.Lock())
+            with lock:
+                # The lock may have been pruned while we waited for it.
+                if self._seller_locks.get(seller_id) is lock:
+                    yield
+                    return
+
+    def _renew(self, seller_id, want=Decimal('0.00')):
+        # Called with the seller's lock held.
+        lease = self._leases.get(seller_id)
+        result = ledger.lease_credit(
+            seller_id,
+            self.holder,
+            lease_id=lease.lease_id if lease else None,
+            allowance=lease.allowance if lease else Decimal('0.00'),
+            want=want,
+            ttl=self.ttl
+        )
+        if result is None:
+            # The seller does not use leases (any more).
+            if self._leases.pop(seller_id, None) is not None:
+                ledger.return_lease(lease.lease_id)
+            self._unleased[seller_id] = time.monotonic() + self.refresh
+            return None
+
+        row, granted, _ = result
+        if row is None:
+            # No lease and no credit to open one with.
+            self._leases.pop(seller_id, None)
+            return None
+        if lease is None or lease.lease_id != row.pk:
+            lease = self._leases[seller_id] = _Lease(row.pk)
+        lease.allowance += granted
+        lease.refill_below = (lease.allowance * self.low_watermark).quantize(Decimal('0.01'))
+        # Renewed well before the lease expires in the database.
+        lease.renew_at = time.monotonic() + self.ttl / 2
+        return lease
+
+    def _return(self, seller_id):
+        with self._seller_lock(seller_id):
+            lease = self._leases.pop(seller_id, None)
+            if lease is not None:
+                ledger.return_lease(lease.lease_id)
+
+    def _ensure_started(self):
+        # A forked worker does not inherit the parent's thread, and the
+        # parent's leases are not its own.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._leases = {}
+                self._unleased = {}
+                self._seller_locks = {}
+                atexit.register(self._shutdown, os.getpid())
+            self._pid = os.getpid()
+            self.holder = f"{socket.gethostname()}:{self._pid}"[:100]
+            self._thread = threading.Thread(target=self._run, name='recharge-credit-leases', daemon=True)
+            self._thread.start()
+
+    def _shutdown(self, pid):
+        if pid != os.getpid():
+            return
+        try:
+            self.release_all()
+        except Exception:
+            logger.exception("Could not return the credit leases of %s", self.holder)
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                close_old_connections()
+                self._guard(self._return_idle)
+                continue
+            stop = _STOP in batch
+            batch = [item for item in batch if item is not _STOP]
+            close_old_connections()
+            if batch:
+                with self._flush_lock:
+                    self._flush(batch)
+                self._guard(self._refill, {seller_id for _, seller_id, *_ in batch})
+                # A steady stream of sales must not keep idle leases and stale state around.
+                if time.monotonic() >= self._upkeep_at:
+                    self._guard(self._return_idle)
+            if stop:
+                return
+
+    def _guard(self, function, *args):
+        try:
+            function(*args)
+        except Exception:
+            logger.exception("Credit lease upkeep failed")
+
+    def _next_batch(self):
+        # Waking up now and then without sales is what returns idle leases.
+        batch = [self._queue.get(timeout=self.ttl / 4)]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            remaining = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        sales_by_lease = {}
+        for key, (_, seller_id, lease_id, amount, phone_number) in enumerate(batch):
+            sales_by_lease.setdefault(lease_id, (seller_id, []))[1].append((key, amount, phone_number))
+
+        try:
+            orphaned, balances = ledger.sell_from_leases(sales_by_lease, self.ttl)
+        except Exception as e:
+            # Nothing was written; the credit those sales took locally is
+            # still on the lease in the database and comes back with it.
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+
+        orphaned_keys = {key for sales in orphaned.values() for key, _, _ in sales}
+        for key, (future, seller_id, *_) in enumerate(batch):
+            if key not in orphaned_keys:
+                future.set_result(balances[seller_id])
+        if not orphaned:
+            return
+
+        try:
+            outcomes = ledger.sell_batch(orphaned)
+        except Exception as e:
+            outcomes = dict.fromkeys(orphaned_keys, e)
+        for key in orphaned_keys:
+            future = batch[key][0]
+            if isinstance(outcomes[key], Exception):
+                future.set_exception(outcomes[key])
+            else:
+                future.set_result(outcomes[key])
+
+    def _refill(self, seller_ids):
+        for seller_id in seller_ids:
+            with self._seller_lock(seller_id):
+                lease = self._leases.get(seller_id)
+                if lease is not None and lease.allowance < lease.refill_below:
+                    self._renew(seller_id)
+
+    def _return_idle(self):
+        now = time.monotonic()
+        self._upkeep_at = now + self.ttl / 4
+        idle_since = now - self.ttl / 2
+        with self._flush_lock:
+            for seller_id, lease in list(self._leases.items()):
+                if lease.used_at < idle_since:
+                    self._return(seller_id)
+
+        # Every seller id ever sent, real or not, would otherwise stay here for good.
+        for seller_id, until in list(self._unleased.items()):
+            if until <= now:
+                self._unleased.pop(seller_id, None)
+        with self._locks_lock:
+            for seller_id, lock in list(self._seller_locks.items()):
+                if seller_id not in self._leases and lock.acquire(blocking=False):
+                    del self._seller_locks[seller_id]
+                    lock.release()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def config():
+    return {
+        'ENABLED': False,
+        'TTL': 300,
+        'LOW_WATERMARK': 0.25,
+        'MAX_BATCH': 100,
+        'MAX_WAIT_MS': 5,
+        'RESULT_TIMEOUT': 10,
+        'REFRESH': 60,
+        **getattr(settings, 'RECHARGE_CREDIT_LEASES', {}),
+    }
+
+
+def is_enabled():
+    return config()['ENABLED']
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                options = config()
+                _manager = LeaseManager(
+                    ttl=options['TTL'],
+                    low_watermark=options['LOW_WATERMARK'],
+                    max_batch=options['MAX_BATCH'],
+                    max_wait=options['MAX_WAIT_MS'] / 1000,
+                    result_timeout=options['RESULT_TIMEOUT'],
+                    refresh=options['REFRESH'],
+                )
+    return _manager
+
+
+def sell(seller_id, amount, phone_number):
+    """Sell from this process's lease on the seller; None means the sale takes the normal path."""
+    return get_manager().sell(seller_id, amount, phone_number)
+
+
+def release_all():
+    if _manager is not None:
+        _manager.release_all()
+
+
+@receiver(setting_changed)
+def _reset_manager(setting, **kwargs):
+    global _manager
+    if setting == 'RECHARGE_CREDIT_LEASES' and _manager is not None:
+        _manager.stop()
+        _manager = None
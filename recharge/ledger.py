@@ -0,0 +1,545 @@
+import functools
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import balance_cache, buckets, operators, outbox
+from .exceptions import ConcurrentUpdate, InsufficientCredit
+from .models import CreditLease, Reservation, Seller, Transaction
+
+CENT = Decimal('0.01')
+# operator_id default meaning "look it up from the phone number".
+UNRESOLVED = object()
+
+
+class DebitStrategy:
+    """Takes `amount` from a seller's credit inside the caller's transaction and returns the Seller."""
+
+    def debit(self, seller_id, amount):
+        raise NotImplementedError
+
+
+class RowLockStrategy(DebitStrategy):
+    """SELECT ... FOR UPDATE, check the balance in Python, then save()."""
+
+    def debit(self, seller_id, amount):
+        seller = Seller.objects.select_for_update().filter(pk=seller_id, credit_buckets=0).first()
+        if seller is None:
+            # Missing, or its credit is spread over buckets.
+            seller = Seller.objects.get(pk=seller_id)
+            if seller.credit_buckets:
+                buckets.debit(seller, amount)
+                return seller
+            # The buckets were merged back meanwhile.
+            seller = Seller.objects.select_for_update().get(pk=seller_id)
+
+        if seller.credit < amount:
+            raise InsufficientCredit()
+
+        seller.credit -= amount
+        seller.version += 1
+        seller.save(update_fields=['credit', 'version'])
+        return seller
+
+
+class ConditionalUpdateStrategy(DebitStrategy):
+    """A single `UPDATE ... SET credit = credit - x WHERE credit >= x`.
+
+    The balance check happens in the database, so there is no read before the
+    write and the row lock is held only for the UPDATE itself. The returned
+    Seller has only `pk`, `credit` and `credit_lease` loaded.
+    """
+
+    def debit(self, seller_id, amount):
+        updated = self._update(seller_id, amount)
+        if updated is not None:
+            credit, credit_lease = updated
+            return Seller(pk=seller_id, credit=credit, credit_lease=credit_lease)
+
+        # Nothing matched: find out whether the seller is missing, sharded or short.
+        seller = Seller.objects.get(pk=seller_id)
+        if seller.credit_buckets:
+            buckets.debit(seller, amount)
+            return seller
+        raise InsufficientCredit()
+
+    def _update(self, seller_id, amount):
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            qn = connection.ops.quote_name
+            credit, version = qn('credit'), qn('version')
+            sql = (
+                f"UPDATE {qn(Seller._meta.db_table)} "
+                f"SET {credit} = {credit} - %s, {version} = {version} + 1 "
+                f"WHERE {qn('id')} = %s AND {qn('credit_buckets')} = 0 AND {credit} >= %s "
+                f"RETURNING {credit}, {qn('credit_lease')}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [amount, seller_id, amount])
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            to_decimal = Seller._meta.get_field('credit').to_python
+            return to_decimal(row[0]).quantize(CENT), to_decimal(row[1]).quantize(CENT)
+
+        updated = Seller.objects.filter(
+            pk=seller_id, credit_buckets=0, credit__gte=amount
+        ).update(credit=F('credit') - amount, version=F('version') + 1)
+        if not updated:
+            return None
+        return Seller.objects.values_list('credit', 'credit_lease').get(pk=seller_id)
+
+
+class OptimisticStrategy(DebitStrategy):
+    """Read without locking and write only if `Seller.version` is unchanged, retrying a bounded number of times.
+
+    Meant for backends running READ COMMITTED. On SQLite a retry inside the
+    same transaction keeps reading the same snapshot, so use it there only
+    with IMMEDIATE write transactions, where conflicts cannot happen.
+    """
+
+    def debit(self, seller_id, amount):
+        retries = getattr(settings, 'RECHARGE_OPTIMISTIC_RETRIES', 5)
+        for _ in range(retries + 1):
+            seller = Seller.objects.get(pk=seller_id)
+            if seller.credit_buckets:
+                buckets.debit(seller, amount)
+                return seller
+            if seller.credit < amount:
+                raise InsufficientCredit()
+
+            updated = Seller.objects.filter(pk=seller_id, version=seller.version).update(
+                credit=seller.credit - amount, version=seller.version + 1
+            )
+            if updated:
+                seller.credit -= amount
+                seller.version += 1
+                return seller
+
+        raise ConcurrentUpdate()
+
+
+STRATEGIES = {
+    'row_lock': RowLockStrategy,
+    'conditional_update': ConditionalUpdateStrategy,
+    'optimistic': OptimisticStrategy,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_strategy(name):
+    strategy_class = STRATEGIES.get(name) or import_string(name)
+    return strategy_class()
+
+
+def get_debit_strategy():
+    """Return the strategy named by RECHARGE_DEBIT_STRATEGY.
+
+    The setting is a strategy name or dotted path, or a dict of them keyed by
+    database vendor (with an optional 'default').
+    """
+    name = getattr(settings, 'RECHARGE_DEBIT_STRATEGY', 'row_lock')
+    if isinstance(name, dict):
+        name = name.get(connection.vendor, name.get('default', 'row_lock'))
+    return _load_strategy(name)
+
+
+def _balance_changed(seller):
+    """Update the cached balance once the surrounding transaction commits.
+
+    The new balance is written through when it is known exactly; for sharded
+    or leasing sellers it lives partly in buckets or on leases, so the entry
+    is dropped instead.
+    """
+    if seller.credit_buckets or seller.credit_lease:
+        transaction.on_commit(lambda: balance_cache.invalidate(seller.pk))
+    else:
+        credit = seller.credit
+        transaction.on_commit(lambda: balance_cache.store(seller.pk, credit))
+
+
+def _balances_changed(seller_ids):
+    seller_ids = list(seller_ids)
+    transaction.on_commit(lambda: balance_cache.invalidate(*seller_ids))
+
+
+def leased_credit(seller_ids):
+    """Return {seller id: credit held on its active leases} for the sellers that have any."""
+    rows = (
+        CreditLease.objects.filter(seller_id__in=seller_ids, status='ACTIVE')
+        .values('seller_id').annotate(total=Sum('amount')).values_list('seller_id', 'total')
+    )
+    return {seller_id: Decimal(total).quantize(CENT) for seller_id, total in rows}
+
+
+def _ledger_written(rows):
+    # Runs in the transaction that wrote the rows, so the events commit or roll back with them.
+    outbox.enqueue_transactions(rows)
+
+
+def sale_description(phone_number):
+    return f"شارژ برای شماره {phone_number}"
+
+
+def resolve_operators(phone_numbers):
+    """Map each phone number to its operator id.
+
+    Call it before taking any lock: it may reload the prefix index from the database.
+    """
+    return {phone_number: operators.resolve(phone_number) for phone_number in set(phone_numbers)}
+
+
+def sell(seller_id, amount, phone_number, operator_id=UNRESOLVED):
+    """Sell one top-up. Pass `operator_id` when the caller already holds a transaction open."""
+    if operator_id is UNRESOLVED:
+        operator_id = operators.resolve(phone_number)
+    with transaction.atomic():
+        seller = get_debit_strategy().debit(seller_id, amount)
+        sale = Transaction.objects.create(
+            seller=seller,
+            amount=-amount,
+            transaction_type='TOPUP_SALE',
+            description=sale_description(phone_number),
+            operator_id=operator_id
+        )
+        _ledger_written([sale])
+        _balance_changed(seller)
+    return seller, sale
+
+
+def add_credit(seller_id, amount, description=''):
+    with transaction.atomic():
+        # Credit increases never need a balance check, so a plain UPDATE is enough.
+        updated = Seller.objects.filter(pk=seller_id).update(
+            credit=F('credit') + amount, version=F('version') + 1
+        )
+        if not updated:
+            raise Seller.DoesNotExist()
+        _balances_changed([seller_id])
+        row = Transaction.objects.create(
+            seller_id=seller_id,
+            amount=amount,
+            transaction_type='CREDIT_INCREASE',
+            description=description
+        )
+        _ledger_written([row])
+        return row
+
+
+def add_credit_batch(credits):
+    """Apply many credit increases with one UPDATE per seller and one bulk insert of ledger rows.
+
+    `credits` is an iterable of `(seller_id, amount, description)`.
+    """
+    credits = list(credits)
+    totals = {}
+    for seller_id, amount, _ in credits:
+        totals[seller_id] = totals.get(seller_id, 0) + amount
+
+    with transaction.atomic():
+        # Sellers are updated in primary key order so two concurrent batches cannot deadlock.
+        for seller_id in sorted(totals):
+            updated = Seller.objects.filter(pk=seller_id).update(
+                credit=F('credit') + totals[seller_id], version=F('version') + 1
+            )
+            if not updated:
+                raise Seller.DoesNotExist(f"Seller {seller_id} does not exist.")
+        _balances_changed(totals)
+        rows = Transaction.objects.bulk_create([
+            Transaction(
+                seller_id=seller_id,
+                amount=amount,
+                transaction_type='CREDIT_INCREASE',
+                description=description
+            )
+            for seller_id, amount, description in credits
+        ])
+        _ledger_written(rows)
+        return rows
+
+
+def sell_batch(sales_by_seller):
+    """Settle many sales with one lock per seller, one bulk_update and one bulk_create.
+
+    `sales_by_seller` maps a seller id to a list of `(key, amount, phone_number)`.
+    Returns a dict mapping each key to the seller's remaining credit after the
+    sale, or to the InsufficientCredit / Seller.DoesNotExist that rejected it.
+    """
+    outcomes = {}
+    operator_ids = resolve_operators(phone_number for sales in sales_by_seller.values() for _, _, phone_number in sales)
+    with transaction.atomic():
+        # Lock in primary key order so two concurrent batches cannot deadlock.
+        sellers = {
+            seller.pk: seller
+            for seller in Seller.objects.select_for_update(no_key=True)
+            .filter(pk__in=sales_by_seller.keys())
+            .order_by('pk')
+        }
+        # Credit on leases is still the seller's and counts in what is left.
+        leased = leased_credit(pk for pk, seller in sellers.items() if seller.credit_lease)
+
+        changed_sellers = []
+        ledger_rows = []
+        for seller_id, sales in sales_by_seller.items():
+            seller = sellers.get(seller_id)
+            if seller is None:
+                for key, _, _ in sales:
+                    outcomes[key] = Seller.DoesNotExist()
+                continue
+
+            # A sharded seller is settled from the pool of all its buckets
+            # and the remainder is spread back afterwards.
+            seller_buckets = buckets.absorb(seller) if seller.credit_buckets else None
+
+            credit_before = seller.credit
+            for key, amount, phone_number in sales:
+                if seller.credit < amount:
+                    outcomes[key] = InsufficientCredit()
+                    continue
+
+                seller.credit -= amount
+                ledger_rows.append(Transaction(
+                    seller=seller,
+                    amount=-amount,
+                    transaction_type='TOPUP_SALE',
+                    description=sale_description(phone_number),
+                    operator_id=operator_ids[phone_number]
+                ))
+                outcomes[key] = seller.credit + leased.get(seller_id, Decimal('0.00'))
+
+            if seller_buckets is not None:
+                buckets.spread(seller, seller_buckets)
+            if seller.credit != credit_before or seller_buckets is not None:
+                seller.version += 1
+                changed_sellers.append(seller)
+                _balance_changed(seller)
+
+        if changed_sellers:
+            Seller.objects.bulk_update(changed_sellers, ['credit', 'version'])
+        if ledger_rows:
+            Transaction.objects.bulk_create(ledger_rows)
+            _ledger_written(ledger_rows)
+
+    return outcomes
+
+
+def reserve(seller_id, amount, phone_number):
+    """Phase one of a two-phase sale: take the credit and hold it on a Reservation.
+
+    The held amount is no longer in `Seller.credit` but has no ledger row yet,
+    so while it is held `credit + held == opening balance + ledger`.
+    """
+    ttl = getattr(settings, 'RECHARGE_RESERVATION_TTL', 120)
+    with transaction.atomic():
+        seller = get_debit_strategy().debit(seller_id, amount)
+        reservation = Reservation.objects.create(
+            seller_id=seller_id,
+            amount=amount,
+            phone_number=phone_number,
+            expires_at=timezone.now() + timedelta(seconds=ttl)
+        )
+        _balance_changed(seller)
+    return seller, reservation
+
+
+def commit_reservation(reservation, operator_reference=''):
+    operator_id = operators.resolve(reservation.phone_number)
+    with transaction.atomic():
+        # The reservation row is written before the ledger row so that a
+        # reconciliation snapshot, which locks held reservations, never sees
+        # the sale in both places or in neither.
+        changes = dict(status='COMMITTED', operator_reference=operator_reference)
+        held = Reservation.objects.filter(pk=reservation.pk, status__in=Reservation.HELD_STATUSES)
+        if not held.update(**changes):
+            # The operator answered after the reservation expired and its
+            # credit was handed back, so the sale has to be charged again.
+            get_debit_strategy().debit(reservation.seller_id, reservation.amount)
+            Reservation.objects.filter(pk=reservation.pk).update(**changes)
+            _balances_changed([reservation.seller_id])
+
+        sale = Transaction.objects.create(
+            seller_id=reservation.seller_id,
+            amount=-reservation.amount,
+            transaction_type='TOPUP_SALE',
+            description=sale_description(reservation.phone_number),
+            operator_id=operator_id
+        )
+        Reservation.objects.filter(pk=reservation.pk).update(sale=sale)
+        _ledger_written([sale])
+
+    reservation.status = 'COMMITTED'
+    reservation.operator_reference = operator_reference
+    reservation.sale = sale
+    return sale
+
+
+def release_reservation(reservation):
+    """Hand the held credit back. Returns False if the reservation was no longer held."""
+    with transaction.atomic():
+        released = Reservation.objects.filter(
+            pk=reservation.pk, status__in=Reservation.HELD_STATUSES
+        ).update(status='RELEASED')
+        if released:
+            Seller.objects.filter(pk=reservation.seller_id).update(
+                credit=F('credit') + reservation.amount, version=F('version') + 1
+            )
+            _balances_changed([reservation.seller_id])
+    if released:
+        reservation.status = 'RELEASED'
+    return bool(released)
+
+
+def mark_reservation_unknown(reservation):
+    """Keep holding the credit of a sale the operator may or may not have made, until it is checked.
+
+    Returns False if the reservation was no longer RESERVED.
+    """
+    updated = Reservation.objects.filter(pk=reservation.pk, status='RESERVED').update(status='UNKNOWN')
+    if updated:
+        reservation.status = 'UNKNOWN'
+    return bool(updated)
+
+
+def release_expired_reservations(batch_size=500):
+    released = 0
+    while True:
+        expired = list(
+            Reservation.objects.filter(status='RESERVED', expires_at__lt=timezone.now())
+            .only('pk', 'seller_id', 'amount')[:batch_size]
+        )
+        if not expired:
+            return released
+        for reservation in expired:
+            released += release_reservation(reservation)
+
+
+def lease_credit(seller_id, holder, lease_id=None, allowance=Decimal('0.00'), want=Decimal('0.00'), ttl=300):
+    """Open or top up `holder`'s credit lease on a seller and push its expiry back by `ttl` seconds.
+
+    The lease is filled up to the seller's `credit_lease` (or `want`, if that
+    is larger), counting the `allowance` the holder still has on `lease_id`,
+    as far as the seller's credit allows. Returns None when the seller does
+    not use leases, else (the lease or None, credit granted, credit left on
+    the seller).
+    """
+    with transaction.atomic():
+        # FOR NO KEY UPDATE: a flush holding a lease row of this seller takes
+        # FOR KEY SHARE on it for its ledger rows' foreign key, and must not
+        # wait for us while we wait for its lease row.
+        seller = Seller.objects.select_for_update(no_key=True).filter(pk=seller_id).first()
+        # Bucketed sellers already spread their lock; leases and buckets do not mix.
+        if seller is None or seller.credit_lease <= 0 or seller.credit_buckets:
+            return None
+
+        lease = CreditLease.objects.filter(pk=lease_id, status='ACTIVE').first() if lease_id else None
+        if lease is None:
+            # Whatever was left on a returned lease is back in seller.credit.
+            allowance = Decimal('0.00')
+        granted = max(min(max(seller.credit_lease, want) - allowance, seller.credit), Decimal('0.00'))
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+
+        if lease is not None:
+            CreditLease.objects.filter(pk=lease.pk).update(amount=F('amount') + granted, expires_at=expires_at)
+        elif granted:
+            lease = CreditLease.objects.create(seller=seller, holder=holder, amount=granted, expires_at=expires_at)
+
+        if granted:
+            seller.credit -= granted
+            seller.version += 1
+            seller.save(update_fields=['credit', 'version'])
+            _balance_changed(seller)
+    return lease, granted, seller.credit
+
+
+def sell_from_leases(sales_by_lease, ttl=300):
+    """Write the ledger rows of sales already taken from credit leases, in one transaction.
+
+    `sales_by_lease` maps a lease id to `(seller_id, [(key, amount, phone_number)])`.
+    Each lease is reduced by its sales and its expiry pushed back; no seller
+    row is locked. Returns `(orphaned, balances)`: sales whose lease was
+    returned meanwhile are not written and come back in `orphaned` as
+    `{seller_id: [(key, amount, phone_number)]}`, since their credit is back
+    on the seller and they are settled like any other sale; `balances` maps
+    each seller whose sales were written to its balance afterwards, counting
+    the credit on its active leases.
+    """
+    orphaned = {}
+    balances = {}
+    operator_ids = resolve_operators(
+        phone_number for _, sales in sales_by_lease.values() for _, _, phone_number in sales
+    )
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    with transaction.atomic():
+        rows = []
+        written = set()
+        for lease_id in sorted(sales_by_lease):
+            seller_id, sales = sales_by_lease[lease_id]
+            total = sum(amount for _, amount, _ in sales)
+            # The lease row is written before the ledger rows, so a
+            # reconciliation snapshot, which locks it, sees the sales either
+            # on the lease or in the ledger.
+            updated = CreditLease.objects.filter(pk=lease_id, status='ACTIVE', amount__gte=total).update(
+                amount=F('amount') - total, expires_at=expires_at
+            )
+            if not updated:
+                orphaned.setdefault(seller_id, []).extend(sales)
+                continue
+            written.add(seller_id)
+            rows.extend(
+                Transaction(
+                    seller_id=seller_id,
+                    amount=-amount,
+                    transaction_type='TOPUP_SALE',
+                    description=sale_description(phone_number),
+                    operator_id=operator_ids[phone_number]
+                )
+                for _, amount, phone_number in sales
+            )
+        if rows:
+            Transaction.objects.bulk_create(rows)
+            _ledger_written(rows)
+            leased = leased_credit(written)
+            balances = {
+                seller_id: credit + leased.get(seller_id, Decimal('0.00'))
+                for seller_id, credit in Seller.objects.filter(pk__in=written).values_list('pk', 'credit')
+            }
+            _balances_changed(written)
+    return orphaned, balances
+
+
+def return_lease(lease_id):
+    """Hand what is left on a lease back to its seller. Returns False if it was no longer active."""
+    seller_id = CreditLease.objects.filter(pk=lease_id).values_list('seller_id', flat=True).first()
+    if seller_id is None:
+        return False
+    with transaction.atomic():
+        # The seller is locked before the lease, as in lease_credit, and
+        # without the key lock for the same reason.
+        list(Seller.objects.select_for_update(no_key=True).filter(pk=seller_id))
+        lease = CreditLease.objects.select_for_update().filter(pk=lease_id, status='ACTIVE').first()
+        if lease is None:
+            return False
+        CreditLease.objects.filter(pk=lease_id).update(status='RETURNED', amount=0)
+        Seller.objects.filter(pk=seller_id).update(
+            credit=F('credit') + lease.amount, version=F('version') + 1
+        )
+        _balances_changed([seller_id])
+    return True
+
+
+def release_expired_leases(batch_size=500):
+    """Return the leases of worker processes that stopped renewing them, e.g. because they died."""
+    released = 0
+    while True:
+        expired = list(
+            CreditLease.objects.filter(status='ACTIVE', expires_at__lt=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not expired:
+            return released
+        for lease_id in expired:
+            released += return_lease(lease_id)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recharge import archive
+
+
+class Command(BaseCommand):
+    help = "Move ledger rows older than the archive horizon into the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            default=getattr(settings, 'RECHARGE_ARCHIVE_AFTER_DAYS', 90))
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        moved = archive.archive_before(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{moved} transactions older than {cutoff:%Y-%m-%d} archived."))
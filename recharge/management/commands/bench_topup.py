@@ -0,0 +1,66 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recharge import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent top-ups against throwaway sellers and report throughput, "
+        "latency percentiles, lock wait and failures as JSON."
+    )
+
+    def add_arguments(self, parser):
+        defaults = benchmark.BenchConfig()
+        parser.add_argument('--requests', type=int, default=defaults.requests)
+        parser.add_argument('--sellers', type=int, default=defaults.sellers)
+        parser.add_argument('--hot-sellers', type=int, default=defaults.hot_sellers,
+                            help="How many of the sellers are hot.")
+        parser.add_argument('--hot-share', type=float, default=defaults.hot_share,
+                            help="Share of the requests that go to the hot sellers (0-1).")
+        parser.add_argument('--workers', type=int, default=defaults.workers)
+        parser.add_argument('--mode', choices=['thread', 'process'], default=defaults.mode)
+        parser.add_argument('--target', choices=sorted(benchmark.TARGETS), default=defaults.target,
+                            help="'ledger' calls ledger.sell, 'api' goes through TopUpAPIView "
+                                 "and 'fast_api' through the fast path in recharge.fast_views.")
+        parser.add_argument('--database', choices=sorted(settings.DATABASES), default=defaults.database)
+        parser.add_argument('--amount', type=Decimal, default=defaults.amount)
+        parser.add_argument('--retries', type=int, default=defaults.retries,
+                            help="Retries of a request that hit a lock conflict.")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--output', help="Append the report to this file as one JSON line.")
+
+    def handle(self, *args, **options):
+        if not 1 <= options['hot_sellers'] <= options['sellers']:
+            raise CommandError("--hot-sellers must be between 1 and --sellers.")
+        if not 0 <= options['hot_share'] <= 1:
+            raise CommandError("--hot-share must be between 0 and 1.")
+        if options['workers'] < 1 or options['requests'] < 1:
+            raise CommandError("--workers and --requests must be positive.")
+
+        config = benchmark.BenchConfig(
+            requests=options['requests'],
+            sellers=options['sellers'],
+            hot_sellers=options['hot_sellers'],
+            hot_share=options['hot_share'],
+            workers=options['workers'],
+            mode=options['mode'],
+            target=options['target'],
+            database=options['database'],
+            amount=options['amount'],
+            # Enough for every request, so failures come from contention only.
+            credit=options['amount'] * options['requests'],
+            retries=options['retries'],
+            seed=options['seed'],
+        )
+        result = benchmark.run(config)
+
+        if options['output']:
+            with open(options['output'], 'a') as output:
+                output.write(json.dumps(result) + '\n')
+        self.stdout.write(json.dumps(result, indent=2))
+        if not result['ledger_consistent']:
+            raise CommandError("Seller balances do not match the ledger after the run.")
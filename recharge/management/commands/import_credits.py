@@ -0,0 +1,68 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recharge import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply seller credits from a CSV file with `name` and `amount` columns (and optionally "
+        "`description`), creating missing sellers. Bad rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import, or - for standard input.")
+        parser.add_argument('--chunk-size', type=int,
+                            default=getattr(settings, 'RECHARGE_IMPORT_CHUNK_SIZE', 1000))
+        parser.add_argument('--no-create-sellers', action='store_true',
+                            help="Report rows of unknown sellers instead of creating them.")
+        parser.add_argument('--description', default=imports.DESCRIPTION,
+                            help="Ledger description for rows that have none.")
+        parser.add_argument('--errors', help="Write the rejected rows, with the reason, to this CSV file.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        # utf-8-sig also accepts the byte order mark spreadsheet programs write.
+        try:
+            source = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        errors_file = errors_writer = None
+        if options['errors']:
+            errors_file = open(options['errors'], 'w', newline='', encoding='utf-8')
+            errors_writer = csv.writer(errors_file)
+            errors_writer.writerow(['line', 'name', 'amount', 'description', 'error'])
+
+        def on_error(line, row, message):
+            if errors_writer is not None:
+                errors_writer.writerow([line, row.get('name'), row.get('amount'), row.get('description'), message])
+            else:
+                self.stderr.write(f"line {line}: {message}")
+
+        try:
+            result = imports.import_credits(
+                source,
+                chunk_size=options['chunk_size'],
+                create_sellers=not options['no_create_sellers'],
+                description=options['description'],
+                max_errors=0,
+                on_error=on_error
+            )
+        except imports.InvalidImportFile as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if errors_file is not None:
+                errors_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.imported} of {result.rows} rows imported ({result.total_amount} credited), "
+            f"{result.created_sellers} sellers created, {result.error_count} rows rejected."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recharge import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys older than RECHARGE_IDEMPOTENCY_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired idempotency keys deleted."))
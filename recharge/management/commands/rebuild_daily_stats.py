@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recharge import daily_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-seller daily stats from the ledger, for all days or only recent ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild days from this date on (YYYY-MM-DD).")
+        parser.add_argument('--days', type=int,
+                            help="Only rebuild the last DAYS days, today included; what cron runs to keep the stats current.")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            if options['days'] < 1:
+                raise CommandError("--days must be at least 1.")
+            rows = daily_stats.refresh(options['days'])
+            self.stdout.write(self.style.SUCCESS(f"{rows} daily stats rows rebuilt."))
+            return
+
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date in the form YYYY-MM-DD.")
+        rows = daily_stats.rebuild(since)
+        self.stdout.write(self.style.SUCCESS(f"{rows} daily stats rows rebuilt."))
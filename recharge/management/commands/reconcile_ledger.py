@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recharge import reconciliation
+from recharge.models import BalanceCheckpoint, Seller
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every seller's balance against the ledger rows written since its "
+        "latest balance checkpoint, and optionally record new checkpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seller', type=int, action='append', dest='sellers',
+                            help="Only reconcile this seller id (repeatable).")
+        parser.add_argument('--checkpoint', action='store_true',
+                            help="Record a new checkpoint for every seller that reconciles.")
+        parser.add_argument('--baseline', action='store_true',
+                            help="Adopt the current balance as a checkpoint for sellers that have none, without checking it.")
+
+    def handle(self, *args, **options):
+        seller_ids = Seller.objects.order_by('pk').values_list('pk', flat=True)
+        if options['sellers']:
+            seller_ids = seller_ids.filter(pk__in=options['sellers'])
+
+        checked = drifted = 0
+        for seller_id in seller_ids.iterator():
+            if options['baseline'] and not BalanceCheckpoint.objects.filter(seller_id=seller_id).exists():
+                reconciliation.create_checkpoint(seller_id)
+                continue
+
+            result = reconciliation.reconcile(seller_id, checkpoint=options['checkpoint'])
+            checked += 1
+            if not result.ok:
+                drifted += 1
+                self.stderr.write(
+                    f"Seller {seller_id}: balance {result.actual} != ledger {result.expected} "
+                    f"(drift in transactions {result.drift_after_id} < id <= {result.drift_up_to_id})"
+                )
+
+        if drifted:
+            raise CommandError(f"{drifted} of {checked} sellers do not match the ledger.")
+        self.stdout.write(self.style.SUCCESS(f"{checked} sellers match the ledger."))
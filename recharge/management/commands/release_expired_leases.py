@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recharge import ledger
+
+
+class Command(BaseCommand):
+    help = "Hand the credit of expired leases, left by worker processes that died, back to their sellers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = ledger.release_expired_leases(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{released} expired credit leases returned."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recharge import ledger
+
+
+class Command(BaseCommand):
+    help = "Hand the credit of expired top-up reservations back to their sellers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = ledger.release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{released} expired reservations released."))
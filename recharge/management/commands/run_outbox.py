@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from recharge import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver ledger events from the outbox to the configured sink. Several workers may run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is due now and exit.")
+        parser.add_argument('--purge-after-days', type=int,
+                            help="Delete events delivered or given up on more than this many days ago before starting.")
+
+    def handle(self, *args, **options):
+        if options['purge_after_days'] is not None:
+            purged = outbox.purge(timedelta(days=options['purge_after_days']))
+            self.stdout.write(f"{purged} finished events purged.")
+
+        interval = outbox.config()['POLL_INTERVAL']
+        delivered_total = failed_total = 0
+        try:
+            while True:
+                delivered, failed = outbox.dispatch_once()
+                delivered_total += delivered
+                failed_total += failed
+                if failed:
+                    self.stderr.write(f"{failed} events could not be delivered and will be retried.")
+                if not delivered and not failed:
+                    if options['once']:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"{delivered_total} events delivered, {failed_total} delivery attempts failed."
+        ))
@@ -0,0 +1,222 @@
+"""Process-local metrics of the top-up path, rendered in the Prometheus text format at /metrics.
+
+Each worker process keeps its own numbers, so a multi-process deployment is
+scraped per process (or summed by the scraper), as with the group commit and
+balance cache counters that are exported alongside.
+"""
+import bisect
+import contextlib
+import threading
+import time
+
+from django.db import connection, transaction
+
+from . import balance_cache, group_commit
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+_lock = threading.Lock()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values = {}
+
+    def inc(self, label=None, amount=1):
+        with _lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label=None):
+        with _lock:
+            return self._values.get(label, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with _lock:
+            for label, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                labels = [(self.label_name, label)] if label is not None else []
+                lines.append(f'{self.name}{_labels(labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_name = label_name
+        # label -> [per-bucket counts (last slot is +Inf), sum]
+        self._series = {}
+
+    def observe(self, value, label=None):
+        with _lock:
+            series = self._series.setdefault(label, [[0] * (len(self.buckets) + 1), 0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, label=None):
+        with _lock:
+            series = self._series.get(label)
+            return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with _lock:
+            series = sorted(self._series.items(), key=lambda item: str(item[0]))
+            for label, (counts, total) in series:
+                lines.extend(render_histogram(
+                    self.name, self.buckets, counts, total,
+                    [(self.label_name, label)] if label is not None else []
+                ))
+        return lines
+
+
+def render_histogram(name, buckets, counts, total, labels=()):
+    """Render per-bucket (non-cumulative) counts, the last one being +Inf, as histogram samples."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip([*buckets, '+Inf'], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels([*labels, ("le", bound)])} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return lines
+
+
+TOPUP_REQUESTS = Counter(
+    'recharge_topup_requests_total', 'Top-up requests by outcome.', 'outcome'
+)
+TOPUP_DURATION = Histogram(
+    'recharge_topup_duration_seconds', 'Time spent handling a top-up request.', SECONDS_BUCKETS
+)
+TOPUP_PHASE = Histogram(
+    'recharge_topup_phase_seconds', 'Time spent in each phase of a top-up request.', SECONDS_BUCKETS, 'phase'
+)
+TOPUP_QUERIES = Histogram(
+    'recharge_topup_queries', 'Database queries run by a top-up request.', QUERY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    'recharge_admission_rejected_total', 'Top-ups turned away by per-seller admission control.', 'reason'
+)
+REGISTRY = [TOPUP_REQUESTS, TOPUP_DURATION, TOPUP_PHASE, TOPUP_QUERIES, ADMISSION_REJECTED]
+
+
+class TopUpProbe:
+    """Times the phases of one top-up request and counts its queries.
+
+    Statements are attributed to a phase by kind: SELECT ... FOR UPDATE is
+    `lock`, UPDATE is `update` (which also waits for the row lock under the
+    conditional-update strategy, and for the database lock on SQLite), INSERT
+    is `insert` and anything else `read`. `validate` and `commit` are timed
+    around the serializer and the transaction commit.
+    """
+
+    def __init__(self):
+        self.outcome = 'error'
+        self.queries = 0
+        self.phases = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(self._phase_of(sql), time.perf_counter() - started)
+
+    @staticmethod
+    def _phase_of(sql):
+        if 'FOR UPDATE' in sql:
+            return 'lock'
+        statement = sql.lstrip()[:6].upper()
+        if statement == 'UPDATE':
+            return 'update'
+        if statement == 'INSERT':
+            return 'insert'
+        return 'read'
+
+    def record(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @contextlib.contextmanager
+    def atomic(self):
+        """transaction.atomic() that also times the commit."""
+        with transaction.atomic():
+            yield
+            started = time.perf_counter()
+        self.record('commit', time.perf_counter() - started)
+
+
+@contextlib.contextmanager
+def top_up_probe():
+    probe = TopUpProbe()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(probe):
+            yield probe
+    finally:
+        TOPUP_DURATION.observe(time.perf_counter() - started)
+        TOPUP_REQUESTS.inc(probe.outcome)
+        TOPUP_QUERIES.observe(probe.queries)
+        for phase, seconds in probe.phases.items():
+            TOPUP_PHASE.observe(seconds, phase)
+
+
+def _render_balance_cache():
+    lines = []
+    for name, value in balance_cache.stats().items():
+        metric = f'recharge_balance_cache_{name}_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+    return lines
+
+
+def _render_group_commit():
+    committer = group_commit._committer
+    if committer is None:
+        return []
+    stats = committer.stats()
+    lines = [
+        '# TYPE recharge_group_commit_queued gauge',
+        f'recharge_group_commit_queued {stats["queued"]}',
+        '# TYPE recharge_group_commit_largest_batch gauge',
+        f'recharge_group_commit_largest_batch {stats["largest_batch"]}',
+        '# HELP recharge_group_commit_batch_size Sales settled per group commit.',
+        '# TYPE recharge_group_commit_batch_size histogram',
+    ]
+    # The sum of all batch sizes is the number of items committed.
+    lines += render_histogram(
+        'recharge_group_commit_batch_size', stats['batch_size_buckets'],
+        stats['batch_size_counts'], stats['items']
+    )
+    return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _render_balance_cache()
+    lines += _render_group_commit()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seller',
+            name='credit_buckets',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='تعداد بخش\u200cهای اعتبار'),
+        ),
+        migrations.CreateModel(
+            name='CreditBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(verbose_name='شماره بخش')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='موجودی')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='recharge.seller', verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'بخش اعتبار',
+                'verbose_name_plural': 'بخش\u200cهای اعتبار',
+                'unique_together': {('seller', 'index')},
+            },
+        ),
+    ]
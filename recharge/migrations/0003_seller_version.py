@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0002_seller_credit_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seller',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='نسخه'),
+        ),
+    ]
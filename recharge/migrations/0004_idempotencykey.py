@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0003_seller_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='کلید')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='کد وضعیت پاسخ')),
+                ('response', models.JSONField(verbose_name='پاسخ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='زمان ایجاد')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to='recharge.seller', verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'کلید یکتایی',
+                'verbose_name_plural': 'کلیدهای یکتایی',
+                'unique_together': {('seller', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='مبلغ رزرو')),
+                ('phone_number', models.CharField(max_length=20, verbose_name='شماره تلفن')),
+                ('status', models.CharField(choices=[('RESERVED', 'رزرو شده'), ('COMMITTED', 'نهایی شده'), ('RELEASED', 'آزاد شده')], default='RESERVED', max_length=10, verbose_name='وضعیت')),
+                ('operator_reference', models.CharField(blank=True, max_length=100, verbose_name='شناسه اپراتور')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('expires_at', models.DateTimeField(verbose_name='زمان انقضا')),
+                ('sale', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservation', to='recharge.transaction', verbose_name='تراکنش فروش')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='recharge.seller', verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'رزرو اعتبار',
+                'verbose_name_plural': 'رزروهای اعتبار',
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0005_reservation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='creditrequest',
+            index=models.Index(fields=['status', 'created_at'], name='creditrequest_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['seller', '-timestamp', '-id'], name='transaction_seller_time'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'timestamp'], name='transaction_type_time'),
+        ),
+    ]
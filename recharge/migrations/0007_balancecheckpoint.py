@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0006_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='موجودی')),
+                ('last_transaction_id', models.BigIntegerField(default=0, verbose_name='آخرین شناسه تراکنش')),
+                ('running_sum', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='جمع تراکنش\u200cها')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+            ],
+            options={
+                'verbose_name': 'نقطه کنترل موجودی',
+                'verbose_name_plural': 'نقاط کنترل موجودی',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['seller', 'id'], name='transaction_seller_id'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='recharge.seller', verbose_name='فروشنده'),
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['seller', '-last_transaction_id'], name='checkpoint_seller_last'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0007_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLedgerSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(verbose_name='ماه')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='تعداد تراکنش')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='جمع مبالغ')),
+                ('first_transaction_id', models.BigIntegerField(verbose_name='اولین شناسه تراکنش')),
+                ('last_transaction_id', models.BigIntegerField(verbose_name='آخرین شناسه تراکنش')),
+            ],
+            options={
+                'verbose_name': 'خلاصه بایگانی',
+                'verbose_name_plural': 'خلاصه\u200cهای بایگانی',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='مبلغ تراکنش')),
+                ('transaction_type', models.CharField(choices=[('CREDIT_INCREASE', 'افزایش اعتبار'), ('TOPUP_SALE', 'فروش شارژ')], max_length=20, verbose_name='نوع تراکنش')),
+                ('timestamp', models.DateTimeField(verbose_name='زمان تراکنش')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='توضیحات')),
+                ('period', models.DateField(verbose_name='ماه')),
+            ],
+            options={
+                'verbose_name': 'تراکنش بایگانی\u200cشده',
+                'verbose_name_plural': 'تراکنش\u200cهای بایگانی\u200cشده',
+                'db_table': 'recharge_transaction_archive',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp', 'id'], name='transaction_time'),
+        ),
+        migrations.AddField(
+            model_name='archivedledgersummary',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_summaries', to='recharge.seller', verbose_name='فروشنده'),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='recharge.seller', verbose_name='فروشنده'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedledgersummary',
+            unique_together={('seller', 'period')},
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['seller', '-timestamp', '-id'], name='archive_seller_time'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['seller', 'id'], name='archive_seller_id'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['period'], name='archive_period'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+OPERATORS = {
+    ('mci', 'همراه اول'): [
+        '0910', '0911', '0912', '0913', '0914', '0915', '0916', '0917', '0918', '0919',
+        '0990', '0991', '0992', '0993', '0994',
+    ],
+    ('irancell', 'ایرانسل'): [
+        '0901', '0902', '0903', '0904', '0905', '0930', '0933', '0935', '0936', '0937',
+        '0938', '0939', '0941',
+    ],
+    ('rightel', 'رایتل'): ['0920', '0921', '0922'],
+}
+
+
+def add_operators(apps, schema_editor):
+    Operator = apps.get_model('recharge', 'Operator')
+    OperatorPrefix = apps.get_model('recharge', 'OperatorPrefix')
+    for (code, name), prefixes in OPERATORS.items():
+        operator = Operator.objects.create(code=code, name=name)
+        OperatorPrefix.objects.bulk_create([
+            OperatorPrefix(operator=operator, prefix=prefix) for prefix in prefixes
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0008_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Operator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='نام اپراتور')),
+                ('code', models.SlugField(max_length=30, unique=True, verbose_name='کد اپراتور')),
+            ],
+            options={
+                'verbose_name': 'اپراتور',
+                'verbose_name_plural': 'اپراتورها',
+            },
+        ),
+        migrations.CreateModel(
+            name='OperatorPrefix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True, verbose_name='پیش\u200cشماره')),
+            ],
+            options={
+                'verbose_name': 'پیش\u200cشماره اپراتور',
+                'verbose_name_plural': 'پیش\u200cشماره\u200cهای اپراتور',
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='operator',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_transactions', to='recharge.operator', verbose_name='اپراتور'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='operator',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='recharge.operator', verbose_name='اپراتور'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['operator', 'timestamp'], name='transaction_operator_time'),
+        ),
+        migrations.AddField(
+            model_name='operatorprefix',
+            name='operator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prefixes', to='recharge.operator', verbose_name='اپراتور'),
+        ),
+        migrations.RunPython(add_operators, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    SellerDailyStats = apps.get_model('recharge', 'SellerDailyStats')
+    totals = {}
+    for model_name in ('Transaction', 'ArchivedTransaction'):
+        grouped = (
+            apps.get_model('recharge', model_name).objects
+            .annotate(date=TruncDate('timestamp'))
+            .order_by().values('seller_id', 'date', 'transaction_type')
+            .annotate(count=Count('id'), amount=Sum('amount'))
+        )
+        for row in grouped:
+            key = (row['seller_id'], row['date'], row['transaction_type'])
+            count, amount = totals.get(key, (0, 0))
+            totals[key] = (count + row['count'], amount + row['amount'])
+
+    SellerDailyStats.objects.bulk_create([
+        SellerDailyStats(
+            seller_id=seller_id,
+            date=date,
+            transaction_type=transaction_type,
+            transaction_count=count,
+            total_amount=amount
+        )
+        for (seller_id, date, transaction_type), (count, amount) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0009_operators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='تاریخ')),
+                ('transaction_type', models.CharField(choices=[('CREDIT_INCREASE', 'افزایش اعتبار'), ('TOPUP_SALE', 'فروش شارژ')], max_length=20, verbose_name='نوع تراکنش')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='تعداد تراکنش')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='جمع مبالغ')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='recharge.seller', verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'آمار روزانه فروشنده',
+                'verbose_name_plural': 'آمار روزانه فروشندگان',
+                'indexes': [models.Index(fields=['date', 'transaction_type'], name='dailystats_date_type')],
+                'unique_together': {('seller', 'date', 'transaction_type')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0010_sellerdailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=50, verbose_name='نوع رویداد')),
+                ('payload', models.JSONField(verbose_name='محتوا')),
+                ('status', models.CharField(choices=[('PENDING', 'در انتظار ارسال'), ('DELIVERED', 'ارسال شده'), ('FAILED', 'ناموفق')], default='PENDING', max_length=10, verbose_name='وضعیت')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='تعداد تلاش')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='زمان تلاش بعدی')),
+                ('last_error', models.TextField(blank=True, verbose_name='آخرین خطا')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان ارسال')),
+            ],
+            options={
+                'verbose_name': 'رویداد خروجی',
+                'verbose_name_plural': 'رویدادهای خروجی',
+                'indexes': [models.Index(fields=['status', 'available_at', 'id'], name='outbox_status_available')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0011_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seller',
+            name='credit_lease',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='سقف اعتبار اجاره\u200cای هر پروسه'),
+        ),
+        migrations.CreateModel(
+            name='CreditLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(max_length=100, verbose_name='پروسه')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='مبلغ')),
+                ('status', models.CharField(choices=[('ACTIVE', 'فعال'), ('RETURNED', 'بازگردانده شده')], default='ACTIVE', max_length=10, verbose_name='وضعیت')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('expires_at', models.DateTimeField(verbose_name='زمان انقضا')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='recharge.seller', verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'اجاره\u200cی اعتبار',
+                'verbose_name_plural': 'اجاره\u200cهای اعتبار',
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='lease_status_expiry')],
+            },
+        ),
+    ]
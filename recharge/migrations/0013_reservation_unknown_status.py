@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0012_credit_leases'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('RESERVED', 'رزرو شده'), ('COMMITTED', 'نهایی شده'), ('RELEASED', 'آزاد شده'), ('UNKNOWN', 'نتیجه نامعلوم')], default='RESERVED', max_length=10, verbose_name='وضعیت'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recharge', '0013_reservation_unknown_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='اثر انگشت درخواست'),
+        ),
+    ]
@@ -1,17 +1,76 @@
+from decimal import Decimal
+
 from django.db import models
+from django.utils import timezone
 
 class Seller(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="نام فروشنده")
     credit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="اعتبار")
+    credit_buckets = models.PositiveSmallIntegerField(default=0, verbose_name="تعداد بخش‌های اعتبار")
+    # With RECHARGE_CREDIT_LEASES enabled, each worker process serves this
+    # seller's top-ups from a lease of up to this much credit; 0 disables it.
+    credit_lease = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="سقف اعتبار اجاره‌ای هر پروسه")
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="نسخه")
 
     def __str__(self):
         return f"{self.name} - Credit: {self.credit}"
 
+    @property
+    def total_credit(self):
+        # With buckets enabled, `credit` only holds the part of the balance
+        # that is not spread over the CreditBucket rows yet; with leases, the
+        # credit moved onto active CreditLease rows is still the seller's.
+        total = self.credit
+        if self.credit_buckets:
+            total += self.buckets.aggregate(total=models.Sum('balance'))['total'] or 0
+        if self.credit_lease:
+            total += self.leases.filter(status='ACTIVE').aggregate(total=models.Sum('amount'))['total'] or 0
+        # SQLite sums decimals as floats, so round back to the field's cents.
+        return Decimal(total).quantize(Decimal('0.01'))
+
     class Meta:
         verbose_name = "فروشنده"
         verbose_name_plural = "فروشندگان"
 
 
+class CreditBucket(models.Model):
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='buckets', verbose_name="فروشنده")
+    index = models.PositiveSmallIntegerField(verbose_name="شماره بخش")
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="موجودی")
+
+    def __str__(self):
+        return f"{self.seller_id} | bucket {self.index} | {self.balance}"
+
+    class Meta:
+        verbose_name = "بخش اعتبار"
+        verbose_name_plural = "بخش‌های اعتبار"
+        unique_together = ('seller', 'index')
+
+
+class Operator(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="نام اپراتور")
+    code = models.SlugField(max_length=30, unique=True, verbose_name="کد اپراتور")
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "اپراتور"
+        verbose_name_plural = "اپراتورها"
+
+
+class OperatorPrefix(models.Model):
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='prefixes', verbose_name="اپراتور")
+    prefix = models.CharField(max_length=10, unique=True, verbose_name="پیش‌شماره")
+
+    def __str__(self):
+        return f"{self.prefix} -> {self.operator_id}"
+
+    class Meta:
+        verbose_name = "پیش‌شماره اپراتور"
+        verbose_name_plural = "پیش‌شماره‌های اپراتور"
+
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('CREDIT_INCREASE', 'افزایش اعتبار'),
@@ -23,6 +82,7 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES, verbose_name="نوع تراکنش")
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name="زمان تراکنش")
     description = models.TextField(blank=True, null=True, verbose_name="توضیحات")
+    operator = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions', verbose_name="اپراتور")
 
     def __str__(self):
         return f"{self.seller.name} | {self.get_transaction_type_display()} | {self.amount}"
@@ -31,6 +91,13 @@ class Transaction(models.Model):
         verbose_name = "تراکنش"
         verbose_name_plural = "تراکنش‌ها"
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['seller', '-timestamp', '-id'], name='transaction_seller_time'),
+            models.Index(fields=['transaction_type', 'timestamp'], name='transaction_type_time'),
+            models.Index(fields=['seller', 'id'], name='transaction_seller_id'),
+            models.Index(fields=['timestamp', 'id'], name='transaction_time'),
+            models.Index(fields=['operator', 'timestamp'], name='transaction_operator_time'),
+        ]
 
 
 class CreditRequest(models.Model):
@@ -52,4 +119,198 @@ class CreditRequest(models.Model):
 
     class Meta:
         verbose_name = "درخواست اعتبار"
-        verbose_name_plural = "درخواست‌های اعتبار"
\ No newline at end of file
+        verbose_name_plural = "درخواست‌های اعتبار"
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='creditrequest_status_created'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='idempotency_keys', verbose_name="فروشنده")
+    key = models.CharField(max_length=255, verbose_name="کلید")
+    fingerprint = models.CharField(max_length=64, blank=True, default='', verbose_name="اثر انگشت درخواست")
+    status_code = models.PositiveSmallIntegerField(verbose_name="کد وضعیت پاسخ")
+    response = models.JSONField(verbose_name="پاسخ")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="زمان ایجاد")
+
+    def __str__(self):
+        return f"{self.seller_id} | {self.key} | {self.status_code}"
+
+    class Meta:
+        verbose_name = "کلید یکتایی"
+        verbose_name_plural = "کلیدهای یکتایی"
+        unique_together = ('seller', 'key')
+
+
+class Reservation(models.Model):
+    STATUS_CHOICES = (
+        ('RESERVED', 'رزرو شده'),
+        ('COMMITTED', 'نهایی شده'),
+        ('RELEASED', 'آزاد شده'),
+        ('UNKNOWN', 'نتیجه نامعلوم'),
+    )
+    # Statuses whose amount is still held off the seller's credit. An
+    # UNKNOWN reservation waits for someone to check with the operator and
+    # is never released by the expiry sweep.
+    HELD_STATUSES = ('RESERVED', 'UNKNOWN')
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='reservations', verbose_name="فروشنده")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="مبلغ رزرو")
+    phone_number = models.CharField(max_length=20, verbose_name="شماره تلفن")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='RESERVED', verbose_name="وضعیت")
+    operator_reference = models.CharField(max_length=100, blank=True, verbose_name="شناسه اپراتور")
+    sale = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservation', verbose_name="تراکنش فروش")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+    expires_at = models.DateTimeField(verbose_name="زمان انقضا")
+
+    def __str__(self):
+        return f"Reservation {self.id} by {self.seller_id} for {self.amount} - Status: {self.status}"
+
+    class Meta:
+        verbose_name = "رزرو اعتبار"
+        verbose_name_plural = "رزروهای اعتبار"
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry'),
+        ]
+
+
+class CreditLease(models.Model):
+    """Credit moved out of `Seller.credit` for one worker process to sell from without locking the seller.
+
+    `amount` is what the lease still holds in the database; sales served from
+    it are subtracted when their ledger rows are written.
+    """
+
+    STATUS_CHOICES = (
+        ('ACTIVE', 'فعال'),
+        ('RETURNED', 'بازگردانده شده'),
+    )
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='leases', verbose_name="فروشنده")
+    holder = models.CharField(max_length=100, verbose_name="پروسه")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="مبلغ")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE', verbose_name="وضعیت")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+    expires_at = models.DateTimeField(verbose_name="زمان انقضا")
+
+    def __str__(self):
+        return f"Lease {self.id} of {self.seller_id} by {self.holder} - {self.amount} - Status: {self.status}"
+
+    class Meta:
+        verbose_name = "اجاره‌ی اعتبار"
+        verbose_name_plural = "اجاره‌های اعتبار"
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='lease_status_expiry'),
+        ]
+
+
+class BalanceCheckpoint(models.Model):
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='checkpoints', verbose_name="فروشنده")
+    balance = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="موجودی")
+    last_transaction_id = models.BigIntegerField(default=0, verbose_name="آخرین شناسه تراکنش")
+    running_sum = models.DecimalField(max_digits=16, decimal_places=2, verbose_name="جمع تراکنش‌ها")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+
+    def __str__(self):
+        return f"{self.seller_id} | up to {self.last_transaction_id} | {self.balance}"
+
+    class Meta:
+        verbose_name = "نقطه کنترل موجودی"
+        verbose_name_plural = "نقاط کنترل موجودی"
+        indexes = [
+            models.Index(fields=['seller', '-last_transaction_id'], name='checkpoint_seller_last'),
+        ]
+
+
+class ArchivedTransaction(models.Model):
+    """A Transaction moved out of the hot table by `manage.py archive_transactions`. Keeps its original id."""
+
+    id = models.BigIntegerField(primary_key=True)
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='archived_transactions', verbose_name="فروشنده")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="مبلغ تراکنش")
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES, verbose_name="نوع تراکنش")
+    timestamp = models.DateTimeField(verbose_name="زمان تراکنش")
+    description = models.TextField(blank=True, null=True, verbose_name="توضیحات")
+    operator = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_transactions', verbose_name="اپراتور")
+    period = models.DateField(verbose_name="ماه")
+
+    def __str__(self):
+        return f"{self.seller_id} | {self.get_transaction_type_display()} | {self.amount}"
+
+    class Meta:
+        db_table = 'recharge_transaction_archive'
+        verbose_name = "تراکنش بایگانی‌شده"
+        verbose_name_plural = "تراکنش‌های بایگانی‌شده"
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['seller', '-timestamp', '-id'], name='archive_seller_time'),
+            models.Index(fields=['seller', 'id'], name='archive_seller_id'),
+            models.Index(fields=['period'], name='archive_period'),
+        ]
+
+
+class ArchivedLedgerSummary(models.Model):
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='archive_summaries', verbose_name="فروشنده")
+    period = models.DateField(verbose_name="ماه")
+    transaction_count = models.PositiveIntegerField(default=0, verbose_name="تعداد تراکنش")
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="جمع مبالغ")
+    first_transaction_id = models.BigIntegerField(verbose_name="اولین شناسه تراکنش")
+    last_transaction_id = models.BigIntegerField(verbose_name="آخرین شناسه تراکنش")
+
+    def __str__(self):
+        return f"{self.seller_id} | {self.period:%Y-%m} | {self.total_amount}"
+
+    class Meta:
+        verbose_name = "خلاصه بایگانی"
+        verbose_name_plural = "خلاصه‌های بایگانی"
+        unique_together = ('seller', 'period')
+
+
+class SellerDailyStats(models.Model):
+    """Per-seller, per-day ledger totals, recomputed from the ledger by a periodic job (see daily_stats)."""
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='daily_stats', verbose_name="فروشنده")
+    date = models.DateField(verbose_name="تاریخ")
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES, verbose_name="نوع تراکنش")
+    transaction_count = models.PositiveIntegerField(default=0, verbose_name="تعداد تراکنش")
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="جمع مبالغ")
+
+    def __str__(self):
+        return f"{self.seller_id} | {self.date} | {self.transaction_type} | {self.total_amount}"
+
+    class Meta:
+        verbose_name = "آمار روزانه فروشنده"
+        verbose_name_plural = "آمار روزانه فروشندگان"
+        unique_together = ('seller', 'date', 'transaction_type')
+        indexes = [
+            models.Index(fields=['date', 'transaction_type'], name='dailystats_date_type'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """A ledger event waiting to be delivered by `manage.py run_outbox`. Written in the ledger write's own transaction."""
+
+    STATUS_CHOICES = (
+        ('PENDING', 'در انتظار ارسال'),
+        ('DELIVERED', 'ارسال شده'),
+        ('FAILED', 'ناموفق'),
+    )
+
+    event_type = models.CharField(max_length=50, verbose_name="نوع رویداد")
+    payload = models.JSONField(verbose_name="محتوا")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="وضعیت")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="تعداد تلاش")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="زمان تلاش بعدی")
+    last_error = models.TextField(blank=True, verbose_name="آخرین خطا")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="زمان ارسال")
+
+    def __str__(self):
+        return f"{self.id} | {self.event_type} | {self.status}"
+
+    class Meta:
+        verbose_name = "رویداد خروجی"
+        verbose_name_plural = "رویدادهای خروجی"
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id'], name='outbox_status_available'),
+        ]
@@ -0,0 +1,109 @@
+"""Phone number normalization and operator lookup by number prefix.
+
+The prefixes are loaded once per process into a trie and looked up without
+touching the database. Saving or deleting an Operator or OperatorPrefix
+rebuilds the trie of the process that made the change; other processes
+rebuild it within RECHARGE_OPERATOR_PREFIX_REFRESH seconds.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import Operator, OperatorPrefix
+
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+_SEPARATORS = re.compile(r'[\s\-().]')
+_COUNTRY_CODE = re.compile(r'^(?:\+|00)?98(?=9[0-9]{9}$)')
+
+
+def normalize_phone_number(value):
+    """Return `value` in the national form (09xxxxxxxxx) when it is an Iranian mobile number.
+
+    Persian and Arabic digits become ASCII digits and separators are removed.
+    A +98 / 0098 / 98 country code, or a missing leading zero, is replaced
+    by 0. Anything else is only cleaned up this way and kept.
+    """
+    number = _SEPARATORS.sub('', value.translate(_DIGITS))
+    number = _COUNTRY_CODE.sub('0', number)
+    if len(number) == 10 and number.startswith('9') and number.isdigit():
+        number = '0' + number
+    return number
+
+
+class PrefixIndex:
+    """A trie of number prefixes; `lookup` returns the operator id of the longest matching prefix."""
+
+    _END = None
+
+    def __init__(self, prefixes):
+        self._root = {}
+        for prefix, operator_id in prefixes:
+            node = self._root
+            for digit in prefix:
+                node = node.setdefault(digit, {})
+            node[self._END] = operator_id
+
+    def lookup(self, phone_number):
+        node = self._root
+        operator_id = None
+        for digit in phone_number:
+            node = node.get(digit)
+            if node is None:
+                break
+            operator_id = node.get(self._END, operator_id)
+        return operator_id
+
+
+_lock = threading.Lock()
+_index = None
+_loaded_at = 0.0
+
+
+def _refresh_interval():
+    return getattr(settings, 'RECHARGE_OPERATOR_PREFIX_REFRESH', 60)
+
+
+def get_index():
+    global _index, _loaded_at
+    index = _index
+    if index is not None and time.monotonic() - _loaded_at < _refresh_interval():
+        return index
+    with _lock:
+        if _index is None or time.monotonic() - _loaded_at >= _refresh_interval():
+            _index = PrefixIndex(OperatorPrefix.objects.values_list('prefix', 'operator_id'))
+            _loaded_at = time.monotonic()
+        return _index
+
+
+def resolve(phone_number):
+    """Return the id of the operator serving `phone_number`, or None if no prefix matches."""
+    return get_index().lookup(phone_number)
+
+
+def reset():
+    global _index
+    _index = None
+
+
+@receiver([post_save, post_delete], sender=Operator)
+@receiver([post_save, post_delete], sender=OperatorPrefix)
+def _prefixes_changed(**kwargs):
+    transaction.on_commit(reset)
+
+
+@receiver(post_migrate)
+def _tables_reloaded(**kwargs):
+    # Also sent after `flush`, which empties the tables without row signals.
+    reset()
+
+
+@receiver(setting_changed)
+def _reset_index(setting, **kwargs):
+    if setting == 'RECHARGE_OPERATOR_PREFIX_REFRESH':
+        reset()
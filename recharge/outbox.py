@@ -0,0 +1,232 @@
+"""Transactional outbox for ledger events.
+
+When enabled, every ledger row gets an OutboxEvent written in the same
+transaction, so an event exists if and only if the row committed. `manage.py run_outbox` claims
+pending events in batches and hands them to the configured sink outside any
+database transaction; delivery is at least once, so consumers should dedupe
+on `transaction_id`.
+"""
+import contextlib
+import json
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import OutboxEvent
+
+TRANSACTION_CREATED = 'transaction.created'
+
+_suspended = False
+
+
+def config():
+    return {
+        'ENABLED': False,
+        'BATCH_SIZE': 100,
+        'LEASE_SECONDS': 60,
+        'MAX_ATTEMPTS': 20,
+        'POLL_INTERVAL': 1,
+        **getattr(settings, 'RECHARGE_OUTBOX', {}),
+    }
+
+
+def transaction_payload(row):
+    return {
+        'transaction_id': row.pk,
+        'seller_id': row.seller_id,
+        'amount': str(row.amount),
+        'transaction_type': row.transaction_type,
+        'timestamp': row.timestamp.isoformat(),
+        'description': row.description or '',
+        'operator_id': row.operator_id,
+    }
+
+
+def enqueue_transactions(ledger_rows):
+    """Write one event per ledger row. Must run in the transaction that wrote the rows."""
+    if _suspended or not config()['ENABLED']:
+        return
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(event_type=TRANSACTION_CREATED, payload=transaction_payload(row))
+        for row in ledger_rows
+    ])
+
+
+@contextlib.contextmanager
+def suspended():
+    """Write no events in this process (and the processes it forks) for the duration."""
+    global _suspended
+    previous, _suspended = _suspended, True
+    try:
+        yield
+    finally:
+        _suspended = previous
+
+
+class Sink:
+    """Delivers a batch of events somewhere; raises on failure so the whole batch is retried."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def deliver(self, events):
+        raise NotImplementedError
+
+
+def _event_body(event):
+    return {
+        'id': event.pk,
+        'type': event.event_type,
+        'created_at': event.created_at,
+        'payload': event.payload,
+    }
+
+
+class WebhookSink(Sink):
+    """POSTs each batch as a JSON array to `url`; any non-2xx answer fails the batch."""
+
+    def __init__(self, url, timeout=10, headers=None, **options):
+        super().__init__(**options)
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def deliver(self, events):
+        body = json.dumps([_event_body(event) for event in events], cls=JSONEncoder).encode()
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+        # urlopen raises HTTPError for 4xx/5xx answers.
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class FileSink(Sink):
+    """Appends each event to `path` as one JSON line."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def deliver(self, events):
+        lines = ''.join(
+            json.dumps(_event_body(event), cls=JSONEncoder, ensure_ascii=False) + '\n' for event in events
+        )
+        with open(self.path, 'a', encoding='utf-8') as output:
+            output.write(lines)
+
+
+class MemorySink(Sink):
+    """Keeps delivered events in `events`, for development and tests. Set `fail` to make deliveries raise."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.events = []
+        self.fail = False
+
+    def deliver(self, events):
+        if self.fail:
+            raise ConnectionError("MemorySink is set to fail")
+        self.events.extend(_event_body(event) for event in events)
+
+
+_sink = None
+
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        options = getattr(settings, 'RECHARGE_OUTBOX_SINK', {})
+        if not options.get('BACKEND'):
+            # Delivering to a default in-memory sink would mark events
+            # delivered that nobody received.
+            raise ImproperlyConfigured("RECHARGE_OUTBOX_SINK must name a BACKEND to deliver outbox events to.")
+        sink_class = import_string(options['BACKEND'])
+        _sink = sink_class(**options.get('OPTIONS', {}))
+    return _sink
+
+
+@receiver(setting_changed)
+def _reset_sink(setting, **kwargs):
+    global _sink
+    if setting == 'RECHARGE_OUTBOX_SINK':
+        _sink = None
+
+
+def claim(batch_size, lease_seconds):
+    """Take up to `batch_size` due events, oldest first, and hide them from other workers for the lease.
+
+    The rows are picked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    workers take different events without waiting on each other. The claim
+    commits before delivery; if the worker dies, the events come due again
+    when the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', available_at__lte=now)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxEvent.objects.filter(id__in=ids).update(
+            available_at=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1
+        )
+    return list(OutboxEvent.objects.filter(id__in=ids).order_by('id'))
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def dispatch_once(sink=None):
+    """Claim and deliver one batch. Returns (delivered, failed) event counts."""
+    options = config()
+    # Resolved before claiming, so a missing sink fails the worker instead of the events.
+    sink = sink or get_sink()
+    events = claim(options['BATCH_SIZE'], options['LEASE_SECONDS'])
+    if not events:
+        return 0, 0
+
+    ids = [event.pk for event in events]
+    try:
+        sink.deliver(events)
+    except Exception as e:
+        now = timezone.now()
+        for event in events:
+            given_up = event.attempts >= options['MAX_ATTEMPTS']
+            OutboxEvent.objects.filter(pk=event.pk).update(
+                status='FAILED' if given_up else 'PENDING',
+                available_at=now + _backoff(event.attempts),
+                last_error=f"{type(e).__name__}: {e}"
+            )
+        return 0, len(events)
+
+    OutboxEvent.objects.filter(id__in=ids).update(status='DELIVERED', delivered_at=timezone.now(), last_error='')
+    return len(events), 0
+
+
+def purge(older_than, batch_size=1000):
+    """Delete events delivered, or given up on, longer than `older_than` ago."""
+    cutoff = timezone.now() - older_than
+    finished = (
+        Q(status='DELIVERED', delivered_at__lt=cutoff)
+        # A FAILED event's available_at is when it was given up on.
+        | Q(status='FAILED', available_at__lt=cutoff)
+    )
+    deleted = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(finished).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(pk__in=ids).delete()[0]
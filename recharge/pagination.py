@@ -0,0 +1,49 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def keyset_page(querysets, cursor=None, limit=50):
+    """Return one page of the merged `querysets`, newest first, and the cursor of the next page.
+
+    Pages are cut on (timestamp, id) instead of OFFSET, so every page is an
+    index range scan no matter how deep the client has paged. Several
+    querysets (e.g. the hot ledger and its archive) are read with the same
+    bounds and merged, so callers see a single history.
+    """
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+
+    bound = Q()
+    if cursor is not None:
+        timestamp, pk = decode_cursor(cursor)
+        bound = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+
+    rows = []
+    for queryset in querysets:
+        rows.extend(queryset.filter(bound).order_by('-timestamp', '-id')[:limit + 1])
+    rows.sort(key=lambda row: (row.timestamp, row.pk), reverse=True)
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].pk)
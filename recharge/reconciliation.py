@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import (
+    ArchivedTransaction,
+    BalanceCheckpoint,
+    CreditBucket,
+    CreditLease,
+    Reservation,
+    Seller,
+    Transaction,
+)
+
+CENT = Decimal('0.01')
+
+
+@dataclass
+class ReconciliationResult:
+    seller_id: int
+    expected: Decimal
+    actual: Decimal
+    last_transaction_id: int
+    # When the check fails: the drift lies in the ledger rows with
+    # drift_after_id < id <= drift_up_to_id.
+    drift_after_id: int = None
+    drift_up_to_id: int = None
+
+    @property
+    def ok(self):
+        return self.expected == self.actual
+
+
+def snapshot(seller_id):
+    """Return the seller's ledger balance and the id of its last ledger row, as of one instant.
+
+    The ledger balance is the credit plus anything held in buckets,
+    reservations or credit leases. Every writer touches one of the locked
+    rows before it inserts a ledger row, so no ledger row of this seller can
+    commit in between the two values.
+    """
+    with transaction.atomic():
+        # Without the key lock, so bucket and lease sales holding their own
+        # rows can still take FOR KEY SHARE on the seller for their ledger rows.
+        seller = Seller.objects.select_for_update(no_key=True).get(pk=seller_id)
+        balance = seller.credit
+        balance += sum(
+            CreditBucket.objects.select_for_update().filter(seller_id=seller_id)
+            .values_list('balance', flat=True)
+        )
+        balance += sum(
+            Reservation.objects.select_for_update().filter(seller_id=seller_id, status__in=Reservation.HELD_STATUSES)
+            .values_list('amount', flat=True)
+        )
+        balance += sum(
+            CreditLease.objects.select_for_update().filter(seller_id=seller_id, status='ACTIVE')
+            .values_list('amount', flat=True)
+        )
+        last_id = ledger_aggregate('MAX(id)', seller_id=seller_id) or 0
+    return balance.quantize(CENT), last_id
+
+
+def read_snapshot(seller_id):
+    """Like snapshot(), but without taking any lock, for callers that only read.
+
+    Both values come from one statement, which sees the database as of a
+    single instant; every writer changes the balance and inserts its ledger
+    rows in one transaction, so they still agree. Anything that writes based
+    on the result needs snapshot()'s locks.
+    """
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    def held(queryset, field):
+        total = queryset.filter(seller_id=OuterRef('pk')).values('seller_id').annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(total), Value(0), output_field=money)
+
+    def last_id(model):
+        latest = model.objects.filter(seller_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+        return Coalesce(Subquery(latest), Value(0), output_field=IntegerField())
+
+    balance, last = Seller.objects.filter(pk=seller_id).annotate(
+        balance=F('credit')
+        + held(CreditBucket.objects.all(), 'balance')
+        + held(Reservation.objects.filter(status__in=Reservation.HELD_STATUSES), 'amount')
+        + held(CreditLease.objects.filter(status='ACTIVE'), 'amount'),
+        last=Greatest(last_id(Transaction), last_id(ArchivedTransaction)),
+    ).values_list('balance', 'last').get()
+    # SQLite sums decimals as floats.
+    return Decimal(str(balance)).quantize(CENT), last
+
+
+def ledger_aggregate(expression, **filters):
+    # The hot and archived ledger rows are aggregated in one statement, so a
+    # row being archived at the same moment is counted exactly once.
+    hot = Transaction.objects.filter(**filters).order_by().values('id', 'amount')
+    archived = ArchivedTransaction.objects.filter(**filters).order_by().values('id', 'amount')
+    sql, params = hot.union(archived, all=True).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {expression} FROM ({sql}) ledger", params)
+        return cursor.fetchone()[0]
+
+
+def ledger_sum(seller_id, after_id, up_to_id):
+    total = ledger_aggregate('SUM(amount)', seller_id=seller_id, id__gt=after_id, id__lte=up_to_id) or 0
+    # SQLite sums decimals as floats.
+    return Decimal(total).quantize(CENT)
+
+
+def latest_checkpoint(seller_id):
+    return BalanceCheckpoint.objects.filter(seller_id=seller_id).order_by('-last_transaction_id', '-id').first()
+
+
+def _locate_drift(seller_id, checkpoint, last_id):
+    # Each checkpoint must equal the one before it plus the ledger rows in
+    # between; the first pair that disagrees is where the drift started.
+    previous = None
+    for current in BalanceCheckpoint.objects.filter(seller_id=seller_id).order_by('last_transaction_id', 'id'):
+        if previous is not None:
+            delta = ledger_sum(seller_id, previous.last_transaction_id, current.last_transaction_id)
+            if previous.balance + delta != current.balance:
+                return previous.last_transaction_id, current.last_transaction_id
+        previous = current
+    return (checkpoint.last_transaction_id if checkpoint else 0), last_id
+
+
+def _expected(seller_id, base, last_id):
+    # Returns the expected balance and the running ledger sum up to last_id.
+    if base is None:
+        running_sum = ledger_sum(seller_id, 0, last_id)
+        return running_sum, running_sum
+    delta = ledger_sum(seller_id, base.last_transaction_id, last_id)
+    return base.balance + delta, base.running_sum + delta
+
+
+def reconcile(seller_id, checkpoint=False):
+    """Check the seller's balance against its ledger, summing only rows after the latest checkpoint.
+
+    A seller without a checkpoint is checked against its whole ledger from a
+    zero opening balance. With `checkpoint=True` a new checkpoint is stored
+    when the check passes.
+    """
+    actual, last_id = snapshot(seller_id)
+    base = latest_checkpoint(seller_id)
+    expected, running_sum = _expected(seller_id, base, last_id)
+
+    result = ReconciliationResult(seller_id, expected, actual, last_id)
+    if not result.ok:
+        result.drift_after_id, result.drift_up_to_id = _locate_drift(seller_id, base, last_id)
+    elif checkpoint:
+        BalanceCheckpoint.objects.create(
+            seller_id=seller_id,
+            balance=actual,
+            last_transaction_id=last_id,
+            running_sum=running_sum
+        )
+    return result
+
+
+def create_checkpoint(seller_id):
+    """Record the current balance as a checkpoint without checking it, e.g. to adopt an opening balance."""
+    balance, last_id = snapshot(seller_id)
+    _, running_sum = _expected(seller_id, latest_checkpoint(seller_id), last_id)
+    return BalanceCheckpoint.objects.create(
+        seller_id=seller_id,
+        balance=balance,
+        last_transaction_id=last_id,
+        running_sum=running_sum
+    )
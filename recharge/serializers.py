@@ -1,12 +1,116 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import serializers
 
+from .models import SellerDailyStats, Transaction
+from .operators import normalize_phone_number
+
 class TopUpSerializer(serializers.Serializer):
     
     seller_id = serializers.IntegerField(required=True)
     phone_number = serializers.CharField(max_length=20, required=True)
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=True)
 
+    def validate_phone_number(self, value):
+        value = normalize_phone_number(value)
+        if not value:
+            raise serializers.ValidationError("شماره تلفن نامعتبر است.")
+        return value
+
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("مبلغ شارژ باید بزرگتر از صفر باشد.")
-        return value
\ No newline at end of file
+        return value
+
+
+class TopUpBatchSerializer(serializers.Serializer):
+
+    # Items are validated one by one with TopUpSerializer in the view, so a
+    # single bad item is rejected on its own instead of failing the batch.
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=getattr(settings, 'RECHARGE_BATCH_MAX_ITEMS', 1000),
+    )
+
+
+
+class TransactionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Transaction
+        fields = ('id', 'amount', 'transaction_type', 'timestamp', 'description', 'operator')
+
+
+class TimestampRangeMixin:
+    """Turns the validated `date_from`/`date_to` into ledger `timestamp` filters."""
+
+    def timestamp_filters(self):
+        params = self.validated_data
+        filters = {}
+        if 'date_from' in params:
+            filters['timestamp__gte'] = params['date_from']
+        if 'date_to' in params:
+            day = parse_date(str(self.initial_data.get('date_to')).strip())
+            if day is None:
+                filters['timestamp__lte'] = params['date_to']
+            else:
+                # A bare date parses as its midnight; it has to cover the whole day.
+                filters['timestamp__lt'] = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        return filters
+
+
+class TransactionHistoryQuerySerializer(TimestampRangeMixin, serializers.Serializer):
+
+    transaction_type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPES, required=False)
+    date_from = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+    date_to = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=getattr(settings, 'RECHARGE_HISTORY_MAX_PAGE_SIZE', 500),
+        default=getattr(settings, 'RECHARGE_HISTORY_PAGE_SIZE', 50),
+    )
+
+
+
+class StatementQuerySerializer(TimestampRangeMixin, serializers.Serializer):
+
+    date_from = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'])
+    date_to = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+    format = serializers.ChoiceField(choices=('csv', 'ndjson'), default='csv')
+
+    def validate(self, attrs):
+        if 'date_to' in attrs and attrs['date_to'] < attrs['date_from']:
+            # A bare date_to covers its whole day, so it may be earlier than a date_from on that day.
+            day = parse_date(str(self.initial_data.get('date_to')).strip())
+            if day is None or day < timezone.localtime(attrs['date_from']).date():
+                raise serializers.ValidationError({"date_to": ["نباید پیش از date_from باشد."]})
+        return attrs
+
+
+class SellerDailyStatsSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = SellerDailyStats
+        fields = ('seller_id', 'date', 'transaction_type', 'transaction_count', 'total_amount')
+
+
+class DailyStatsQuerySerializer(serializers.Serializer):
+
+    date_from = serializers.DateField()
+    date_to = serializers.DateField(required=False)
+    seller_id = serializers.IntegerField(required=False)
+    transaction_type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPES, required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('date_to', timezone.localdate())
+        if attrs['date_to'] < attrs['date_from']:
+            raise serializers.ValidationError({"date_to": ["نباید پیش از date_from باشد."]})
+        max_days = getattr(settings, 'RECHARGE_REPORT_MAX_DAYS', 366)
+        if (attrs['date_to'] - attrs['date_from']).days >= max_days:
+            raise serializers.ValidationError({"date_to": [f"بازه‌ی گزارش حداکثر {max_days} روز است."]})
+        return attrs
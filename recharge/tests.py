@@ -1,11 +1,72 @@
 
 
+import io
 import threading
+import time
 import json
+from unittest import mock
+from asgiref.sync import sync_to_async
 from decimal import Decimal
-from django.test import TestCase
+from concurrent.futures import Future
+from datetime import timedelta
+from django.contrib.admin.sites import site as admin_site
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.db import connection, transaction as db_transaction
-from .models import Seller, Transaction
+from django.db.models import F, QuerySet
+from . import (
+    admission,
+    archive,
+    balance_cache,
+    benchmark,
+    buckets,
+    daily_stats,
+    fast_views,
+    gateways,
+    group_commit,
+    imports,
+    leases,
+    ledger,
+    metrics,
+    operators,
+    outbox,
+    reconciliation,
+)
+from .exceptions import ConcurrentUpdate, InsufficientCredit
+from .admin import CreditRequestAdmin, SellerAdmin
+from .models import (
+    ArchivedLedgerSummary,
+    ArchivedTransaction,
+    BalanceCheckpoint,
+    CreditBucket,
+    CreditLease,
+    CreditRequest,
+    IdempotencyKey,
+    Operator,
+    OperatorPrefix,
+    OutboxEvent,
+    Reservation,
+    Seller,
+    SellerDailyStats,
+    Transaction,
+)
+
+
+def post_json(client, path, payload, **extra):
+    """POST `payload` (a dict, or an already encoded string) as a JSON body."""
+    body = payload if isinstance(payload, str) else json.dumps(payload)
+    return client.post(path, data=body, content_type='application/json', **extra)
+
+
+def top_up(client, seller_id, amount, phone_number='09123456789', path='/api/top-up/', **extra):
+    return post_json(
+        client, path, {'seller_id': seller_id, 'phone_number': phone_number, 'amount': str(amount)}, **extra
+    )
+
 
 class AccountingIntegrityTests(TestCase):
     def setUp(self):
@@ -59,17 +120,7 @@ class AccountingIntegrityTests(TestCase):
 
     def _perform_safe_sale(self, seller_id, amount, phone_number):
         try:
-            with db_transaction.atomic():
-                seller = Seller.objects.select_for_update().get(pk=seller_id)
-                if seller.credit >= amount:
-                    seller.credit -= amount
-                    seller.save()
-                    Transaction.objects.create(
-                        seller=seller,
-                        amount=-amount,
-                        transaction_type='TOPUP_SALE',
-                        description=f"Top-up for {phone_number}"
-                    )
+            ledger.sell(seller_id, amount, phone_number)
         except Exception:
             pass
 
@@ -109,4 +160,1371 @@ class AccountingIntegrityTests(TestCase):
 
         self.assertEqual(self.seller2.credit, expected_final_credit)
 
-        print("Parallel Load Test Passed! Final credit is accurate.")
\ No newline at end of file
+        print("Parallel Load Test Passed! Final credit is accurate.")
+
+class BatchTopUpTests(TestCase):
+    def setUp(self):
+        self.seller1 = Seller.objects.create(name='Batch Seller One', credit=Decimal('1000.00'))
+        self.seller2 = Seller.objects.create(name='Batch Seller Two', credit=Decimal('150.00'))
+
+    def _post_batch(self, items):
+        return self.client.post(
+            '/api/top-up/batch/',
+            data=json.dumps({'items': items}),
+            content_type='application/json'
+        )
+
+    def test_batch_settles_items_per_seller(self):
+        items = [
+            {'seller_id': self.seller1.id, 'phone_number': '09120000001', 'amount': '100.00'},
+            {'seller_id': self.seller2.id, 'phone_number': '09120000002', 'amount': '100.00'},
+            {'seller_id': self.seller2.id, 'phone_number': '09120000003', 'amount': '100.00'},
+            {'seller_id': self.seller1.id, 'phone_number': '09120000004', 'amount': '-5'},
+            {'seller_id': 999999, 'phone_number': '09120000005', 'amount': '10.00'},
+            {'seller_id': self.seller1.id, 'phone_number': '09120000006', 'amount': '250.00'},
+        ]
+
+        response = self._post_batch(items)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        body = response.json()
+        statuses = [result['status'] for result in body['results']]
+        self.assertEqual(
+            statuses,
+            ['accepted', 'accepted', 'rejected', 'rejected', 'rejected', 'accepted']
+        )
+        self.assertEqual(body['accepted'], 3)
+        self.assertEqual(body['rejected'], 3)
+        self.assertIn('amount', body['results'][3]['errors'])
+
+        self.seller1.refresh_from_db()
+        self.seller2.refresh_from_db()
+        self.assertEqual(self.seller1.credit, Decimal('650.00'))
+        self.assertEqual(self.seller2.credit, Decimal('50.00'))
+
+        for seller, initial in ((self.seller1, Decimal('1000.00')), (self.seller2, Decimal('150.00'))):
+            transaction_sum = sum(t.amount for t in seller.transactions.all())
+            self.assertEqual(seller.credit, initial + transaction_sum)
+
+    def test_empty_batch_is_rejected(self):
+        response = self._post_batch([])
+        self.assertEqual(response.status_code, 400)
+
+
+
+class CreditBucketTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Bucket Seller', credit=Decimal('1000.05'))
+        with db_transaction.atomic():
+            buckets.configure(self.seller.pk, 4)
+        self.seller.refresh_from_db()
+
+    def test_configure_spreads_credit(self):
+        balances = list(self.seller.buckets.order_by('index').values_list('balance', flat=True))
+        self.assertEqual(balances, [Decimal('250.01')] * 4)
+        self.assertEqual(self.seller.credit, Decimal('0.01'))
+        self.assertEqual(self.seller.total_credit, Decimal('1000.05'))
+
+    def test_sales_drain_buckets_and_keep_ledger_invariant(self):
+        initial_credit = self.seller.total_credit
+        for _ in range(10):
+            response = top_up(self.client, self.seller.id, '100.00')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        response = top_up(self.client, self.seller.id, '0.10')
+        self.assertEqual(response.status_code, 400)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.total_credit, Decimal('0.05'))
+        transaction_sum = sum(t.amount for t in self.seller.transactions.all())
+        self.assertEqual(self.seller.total_credit, initial_credit + transaction_sum)
+
+    def test_short_bucket_falls_back_to_rebalance(self):
+        CreditBucket.objects.filter(seller=self.seller).exclude(index=0).update(balance=0)
+        CreditBucket.objects.filter(seller=self.seller, index=0).update(balance=Decimal('1000.04'))
+
+        with self.settings(RECHARGE_BUCKET_PICK='round_robin'):
+            for _ in range(4):
+                response = top_up(self.client, self.seller.id, '200.00')
+                self.assertEqual(response.status_code, 200, response.content)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.total_credit, Decimal('200.05'))
+
+    def test_admin_changes_buckets_without_undoing_sales(self):
+        with db_transaction.atomic():
+            buckets.configure(self.seller.pk, 0)
+        admin = SellerAdmin(Seller, admin_site)
+        form_class = admin.get_form(None, self.seller)
+        # The page was opened before this sale.
+        opened = Seller.objects.get(pk=self.seller.pk)
+        self.assertEqual(top_up(self.client, self.seller.id, '100.00').status_code, 200)
+
+        data = {field: getattr(opened, field) for field in form_class.base_fields}
+        data['credit_buckets'] = 2
+        form = form_class(data, instance=opened)
+        self.assertTrue(form.is_valid(), form.errors)
+        admin.save_model(None, form.save(commit=False), form, change=True)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit_buckets, 2)
+        self.assertEqual(self.seller.total_credit, Decimal('900.05'))
+        listed = admin.get_queryset(None).get(pk=self.seller.pk)
+        self.assertEqual(admin.total_credit(listed), Decimal('900.05'))
+
+
+
+class DebitStrategyTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Strategy Seller', credit=Decimal('1000.00'))
+
+    def test_every_strategy_keeps_ledger_invariant(self):
+        for strategy in ledger.STRATEGIES:
+            with self.subTest(strategy=strategy), self.settings(RECHARGE_DEBIT_STRATEGY=strategy):
+                self.seller.refresh_from_db()
+                initial_credit = self.seller.credit
+
+                response = top_up(self.client, self.seller.id, '100.50')
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(Decimal(str(response.json()['remaining_credit'])), initial_credit - Decimal('100.50'))
+
+                self.assertEqual(top_up(self.client, self.seller.id, '5000.00').status_code, 400)
+                self.assertEqual(top_up(self.client, 999999, '1.00').status_code, 404)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('698.50'))
+        self.assertEqual(self.seller.version, 3)
+        transaction_sum = sum(t.amount for t in self.seller.transactions.all())
+        self.assertEqual(self.seller.credit, Decimal('1000.00') + transaction_sum)
+
+    def test_row_lock_reads_the_seller_once(self):
+        with self.settings(RECHARGE_DEBIT_STRATEGY='row_lock'), CaptureQueriesContext(connection) as queries:
+            with db_transaction.atomic():
+                ledger.get_debit_strategy().debit(self.seller.id, Decimal('1.00'))
+        selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(len(selects), 1, selects)
+
+    def test_strategy_can_be_chosen_per_backend(self):
+        with self.settings(RECHARGE_DEBIT_STRATEGY={'default': 'optimistic', 'postgresql': 'row_lock'}):
+            self.assertIsInstance(ledger.get_debit_strategy(), ledger.OptimisticStrategy)
+
+    def test_optimistic_strategy_gives_up_after_bounded_retries(self):
+        original_get = Seller.objects.get
+        reads = []
+
+        def get_then_concurrent_write(*args, **kwargs):
+            seller = original_get(*args, **kwargs)
+            reads.append(seller.version)
+            Seller.objects.filter(pk=seller.pk).update(version=F('version') + 1)
+            return seller
+
+        strategy = ledger.OptimisticStrategy()
+        with self.settings(RECHARGE_OPTIMISTIC_RETRIES=2):
+            with mock.patch.object(Seller.objects, 'get', side_effect=get_then_concurrent_write):
+                with self.assertRaises(ConcurrentUpdate):
+                    with db_transaction.atomic():
+                        strategy.debit(self.seller.id, Decimal('1.00'))
+        self.assertEqual(len(reads), 3)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('1000.00'))
+        with self.assertRaises(InsufficientCredit):
+            with db_transaction.atomic():
+                strategy.debit(self.seller.id, Decimal('2000.00'))
+
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Idempotent Seller', credit=Decimal('300.00'))
+
+    def test_retry_returns_stored_response_without_charging_again(self):
+        first = top_up(self.client, self.seller.id, '100.00', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 200, first.content)
+
+        with self.assertNumQueries(1):
+            retry = top_up(self.client, self.seller.id, '100.00', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('200.00'))
+        self.assertEqual(self.seller.transactions.count(), 1)
+
+    def test_reused_key_with_another_payload_is_refused(self):
+        self.assertEqual(top_up(self.client, self.seller.id, '100.00', HTTP_IDEMPOTENCY_KEY='pay-1').status_code, 200)
+        other_amount = top_up(self.client, self.seller.id, '50.00', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(other_amount.status_code, 422, other_amount.content)
+        other_number = top_up(
+            self.client, self.seller.id, '100.00', phone_number='09351234567', HTTP_IDEMPOTENCY_KEY='pay-1'
+        )
+        self.assertEqual(other_number.status_code, 422, other_number.content)
+        self.assertEqual(top_up(self.client, self.seller.id, '100', HTTP_IDEMPOTENCY_KEY='pay-1').status_code, 200)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('200.00'))
+        self.assertEqual(self.seller.transactions.count(), 1)
+
+    def test_rejected_sale_is_replayed_too(self):
+        self.assertEqual(top_up(self.client, self.seller.id, '500.00', HTTP_IDEMPOTENCY_KEY='too-much').status_code, 400)
+        Seller.objects.filter(pk=self.seller.pk).update(credit=Decimal('1000.00'))
+        self.assertEqual(top_up(self.client, self.seller.id, '500.00', HTTP_IDEMPOTENCY_KEY='too-much').status_code, 400)
+        self.assertEqual(top_up(self.client, self.seller.id, '500.00', HTTP_IDEMPOTENCY_KEY='fresh').status_code, 200)
+
+    def test_expired_keys_are_reused_and_purged(self):
+        top_up(self.client, self.seller.id, '10.00', HTTP_IDEMPOTENCY_KEY='old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertNotIn('Idempotent-Replayed', top_up(self.client, self.seller.id, '10.00', HTTP_IDEMPOTENCY_KEY='old'))
+        self.assertEqual(self.seller.transactions.count(), 2)
+
+        top_up(self.client, self.seller.id, '10.00', HTTP_IDEMPOTENCY_KEY='stale')
+        IdempotencyKey.objects.filter(key='stale').update(created_at=timezone.now() - timedelta(days=2))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['old'])
+
+
+
+FAKE_GATEWAY = {
+    'BACKEND': 'recharge.gateways.FakeOperatorGateway',
+    'OPTIONS': {'fail_numbers': ['09129999999']},
+}
+
+
+@override_settings(RECHARGE_OPERATOR_GATEWAY=FAKE_GATEWAY)
+class TwoPhaseTopUpTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Async Seller', credit=Decimal('500.00'))
+
+    def _sell(self, amount, phone_number='09124444444'):
+        return top_up(self.client, self.seller.id, amount, phone_number, path='/api/top-up/async/')
+
+    def test_successful_operator_call_commits_the_reservation(self):
+        response = self._sell('120.00')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['operator_reference'].startswith('FAKE-'))
+
+        reservation = Reservation.objects.get()
+        self.assertEqual(reservation.status, 'COMMITTED')
+        self.assertEqual(reservation.sale.amount, Decimal('-120.00'))
+        self.assertEqual(gateways.get_gateway().calls[-1], ('09124444444', Decimal('120.00'), reservation.pk))
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('380.00'))
+
+    def test_operator_failure_releases_the_credit(self):
+        response = self._sell('120.00', phone_number='09129999999')
+        self.assertEqual(response.status_code, 502)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('500.00'))
+        self.assertEqual(Reservation.objects.get().status, 'RELEASED')
+        self.assertFalse(self.seller.transactions.exists())
+
+        self.assertEqual(self._sell('600.00').status_code, 400)
+
+    def test_expired_reservations_are_reclaimed(self):
+        _, reservation = ledger.reserve(self.seller.id, Decimal('200.00'), '09124444444')
+        ledger.reserve(self.seller.id, Decimal('100.00'), '09124444444')
+        Reservation.objects.filter(pk=reservation.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        call_command('release_expired_reservations', stdout=io.StringIO())
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('400.00'))
+        self.assertEqual(
+            list(Reservation.objects.order_by('pk').values_list('status', flat=True)),
+            ['RELEASED', 'RESERVED']
+        )
+
+        # A late operator answer still charges the sale exactly once.
+        reservation.refresh_from_db()
+        ledger.commit_reservation(reservation, 'LATE-1')
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('200.00'))
+        self.assertEqual(self.seller.transactions.get().amount, Decimal('-200.00'))
+
+    def test_operator_timeout_keeps_the_credit_held(self):
+        # The seller was created with its credit, not through the ledger.
+        reconciliation.create_checkpoint(self.seller.id)
+        gateway = {**FAKE_GATEWAY, 'OPTIONS': {**FAKE_GATEWAY['OPTIONS'], 'delay': 1}}
+        with override_settings(RECHARGE_OPERATOR_GATEWAY=gateway, RECHARGE_OPERATOR_TIMEOUT=0.01):
+            response = self._sell('120.00')
+        self.assertEqual(response.status_code, 504)
+        reservation = Reservation.objects.get()
+        self.assertEqual(response.json()['reservation_id'], reservation.pk)
+        self.assertEqual(reservation.status, 'UNKNOWN')
+
+        # Neither handed back by the sweep nor lost to reconciliation.
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(ledger.release_expired_reservations(), 0)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('380.00'))
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+        # Once the operator confirms it, the sale is charged from the held credit.
+        ledger.commit_reservation(reservation, 'CHECKED-1')
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('380.00'))
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+    def test_late_answer_the_seller_cannot_cover_is_reported_as_json(self):
+        reconciliation.create_checkpoint(self.seller.id)
+        def late_operator(phone_number, amount, reference):
+            # The reservation expires and its credit is sold while the operator works.
+            Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+            ledger.release_expired_reservations()
+            ledger.sell(self.seller.id, Decimal('500.00'), phone_number)
+
+        gateway = gateways.get_gateway()
+        original = gateway.top_up
+
+        async def top_up(phone_number, amount, reference):
+            await sync_to_async(late_operator)(phone_number, amount, reference)
+            return await original(phone_number, amount, reference)
+
+        with mock.patch.object(gateway, 'top_up', top_up):
+            response = self._sell('120.00')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.json()['operator_reference'].startswith('FAKE-'))
+        self.assertEqual(Reservation.objects.get().status, 'RELEASED')
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+
+
+class GroupCommitterTests(TestCase):
+    def test_batches_are_cut_at_max_batch(self):
+        committer = group_commit.GroupCommitter(max_batch=3, max_wait=0)
+        for _ in range(5):
+            committer._queue.put(None)
+        self.assertEqual(len(committer._next_batch()), 3)
+        self.assertEqual(len(committer._next_batch()), 2)
+
+    def test_commit_resolves_each_future_with_its_own_outcome(self):
+        seller = Seller.objects.create(name='Grouped Seller', credit=Decimal('250.00'))
+        committer = group_commit.GroupCommitter()
+        batch = [
+            (Future(), seller.id, Decimal('100.00'), '09125555555'),
+            (Future(), seller.id, Decimal('200.00'), '09125555555'),
+            (Future(), 999999, Decimal('1.00'), '09125555555'),
+            (Future(), seller.id, Decimal('150.00'), '09125555555'),
+        ]
+
+        committer._commit(batch)
+
+        self.assertEqual(batch[0][0].result(), Decimal('150.00'))
+        self.assertIsInstance(batch[1][0].exception(), InsufficientCredit)
+        self.assertIsInstance(batch[2][0].exception(), Seller.DoesNotExist)
+        self.assertEqual(batch[3][0].result(), Decimal('0.00'))
+        self.assertEqual(committer.stats()['batch_size_counts'][2], 1)
+
+        seller.refresh_from_db()
+        self.assertEqual(seller.credit, Decimal('0.00'))
+        self.assertEqual(seller.transactions.count(), 2)
+
+    def test_request_is_answered_504_when_its_batch_is_late(self):
+        seller = Seller.objects.create(name='Late Grouped Seller', credit=Decimal('10.00'))
+        late = Future()
+        with override_settings(RECHARGE_GROUP_COMMIT={'ENABLED': True, 'RESULT_TIMEOUT': 0.01}), \
+                mock.patch.object(group_commit.GroupCommitter, 'submit', return_value=late):
+            response = top_up(self.client, seller.id, '1.00')
+        self.assertEqual(response.status_code, 504)
+        self.assertIn('error', response.json())
+
+
+@override_settings(RECHARGE_GROUP_COMMIT={'ENABLED': True, 'MAX_BATCH': 50, 'MAX_WAIT_MS': 20})
+class GroupCommitTopUpTests(TransactionTestCase):
+    def test_concurrent_requests_share_commits(self):
+        seller = Seller.objects.create(name='Grouped API Seller', credit=Decimal('1000.00'))
+        statuses = []
+
+        def make_request():
+            statuses.append(top_up(self.client, seller.id, '75.00').status_code)
+
+        threads = [threading.Thread(target=make_request) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] * 13 + [400] * 7)
+        seller.refresh_from_db()
+        self.assertEqual(seller.credit, Decimal('25.00'))
+        transaction_sum = sum(t.amount for t in seller.transactions.all())
+        self.assertEqual(seller.credit, Decimal('1000.00') + transaction_sum)
+
+        stats = group_commit.get_committer().stats()
+        self.assertEqual(stats['items'], 20)
+        self.assertEqual(sum(stats['batch_size_counts']), stats['batches'])
+
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='History Seller', credit=Decimal('0.00'))
+        other = Seller.objects.create(name='Other History Seller', credit=Decimal('0.00'))
+        Transaction.objects.create(seller=other, amount=Decimal('1.00'), transaction_type='CREDIT_INCREASE')
+
+        self.base = timezone.now() - timedelta(days=10)
+        # Three rows share day 3, so the id has to break the tie.
+        for i, day in enumerate([0, 1, 3, 3, 3, 5, 6]):
+            row = Transaction.objects.create(
+                seller=self.seller,
+                amount=Decimal(f'{i + 1}.00'),
+                transaction_type='CREDIT_INCREASE' if i % 2 else 'TOPUP_SALE'
+            )
+            Transaction.objects.filter(pk=row.pk).update(timestamp=self.base + timedelta(days=day))
+
+    def _get(self, **params):
+        return self.client.get(f'/api/sellers/{self.seller.id}/transactions/', params)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        params = {'limit': 3}
+        while True:
+            response = self._get(**params)
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            seen.extend(row['id'] for row in body['results'])
+            if body['next_cursor'] is None:
+                break
+            params['cursor'] = body['next_cursor']
+
+        expected = list(
+            self.seller.transactions.order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        sales = self._get(transaction_type='TOPUP_SALE').json()['results']
+        self.assertEqual(len(sales), 4)
+        self.assertTrue(all(row['transaction_type'] == 'TOPUP_SALE' for row in sales))
+
+        window = self._get(
+            date_from=(self.base + timedelta(days=3)).isoformat(),
+            date_to=(self.base + timedelta(days=5)).isoformat()
+        ).json()['results']
+        self.assertEqual(len(window), 4)
+
+    def test_date_to_covers_the_whole_day(self):
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        row = ledger.add_credit(self.seller.id, Decimal('1.00'))
+        Transaction.objects.filter(pk=row.pk).update(timestamp=noon)
+        day = noon.date().isoformat()
+        ids = [result['id'] for result in self._get(date_from=day, date_to=day).json()['results']]
+        self.assertEqual(ids, [row.pk])
+
+    def test_errors(self):
+        self.assertEqual(self._get(cursor='not-a-cursor').status_code, 400)
+        self.assertEqual(self._get(transaction_type='REFUND').status_code, 400)
+        response = self.client.get('/api/sellers/999999/transactions/')
+        self.assertEqual(response.status_code, 404)
+
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Audited Seller', credit=Decimal('0.00'))
+        ledger.add_credit(self.seller.id, Decimal('1000.00'))
+
+    def _sales(self, count):
+        for _ in range(count):
+            ledger.sell(self.seller.id, Decimal('10.00'), '09127777777')
+
+    def test_reconcile_only_sums_rows_after_the_checkpoint(self):
+        self._sales(5)
+        result = reconciliation.reconcile(self.seller.id, checkpoint=True)
+        self.assertTrue(result.ok)
+        checkpoint = BalanceCheckpoint.objects.get()
+        self.assertEqual(checkpoint.balance, Decimal('950.00'))
+        self.assertEqual(checkpoint.running_sum, Decimal('950.00'))
+
+        self._sales(3)
+        ledger.reserve(self.seller.id, Decimal('25.00'), '09127777777')
+        with self.assertNumQueries(9):
+            result = reconciliation.reconcile(self.seller.id)
+        self.assertTrue(result.ok, result)
+        self.assertEqual(result.expected, Decimal('920.00'))
+
+    def test_drift_is_located_between_checkpoints(self):
+        self._sales(2)
+        reconciliation.reconcile(self.seller.id, checkpoint=True)
+        self._sales(2)
+        tampered = self.seller.transactions.order_by('-id').first()
+        reconciliation.reconcile(self.seller.id, checkpoint=True)
+        first, second = BalanceCheckpoint.objects.order_by('id')
+        self._sales(2)
+
+        Transaction.objects.filter(pk=tampered.pk).update(amount=Decimal('-1.00'))
+        Seller.objects.filter(pk=self.seller.pk).update(credit=Decimal('0.00'))
+
+        result = reconciliation.reconcile(self.seller.id, checkpoint=True)
+        self.assertFalse(result.ok)
+        self.assertEqual(
+            (result.drift_after_id, result.drift_up_to_id),
+            (first.last_transaction_id, second.last_transaction_id)
+        )
+        self.assertEqual(BalanceCheckpoint.objects.count(), 2)
+
+    def test_command_reports_drift(self):
+        drifted = Seller.objects.create(name='Opening Balance Seller', credit=Decimal('50.00'))
+        with self.assertRaises(CommandError):
+            call_command('reconcile_ledger', stdout=io.StringIO(), stderr=io.StringIO())
+
+        call_command('reconcile_ledger', '--baseline', stdout=io.StringIO())
+        call_command('reconcile_ledger', '--checkpoint', stdout=io.StringIO())
+        self.assertEqual(drifted.checkpoints.count(), 2)
+
+
+
+class CreditRequestApprovalTests(TestCase):
+    def setUp(self):
+        self.sellers = [
+            Seller.objects.create(name=f'Approval Seller {i}', credit=Decimal('0.00'))
+            for i in range(3)
+        ]
+        CreditRequest.objects.bulk_create([
+            CreditRequest(seller=self.sellers[i % 3], amount=Decimal(f'{i + 1}.00'))
+            for i in range(30)
+        ])
+        self.admin = CreditRequestAdmin(CreditRequest, admin_site)
+        self.messages = []
+        self.admin.message_user = lambda request, message, level='info': self.messages.append((level, message))
+
+    @override_settings(RECHARGE_APPROVAL_BATCH_SIZE=10)
+    def test_batches_credit_each_seller_once(self):
+        already_approved = CreditRequest.objects.order_by('pk').first()
+        already_approved.status = 'APPROVED'
+        already_approved.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.admin.approve_requests(None, CreditRequest.objects.all())
+
+        # Three batches, each with one UPDATE per seller and one bulk insert.
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(sum(sql.startswith('UPDATE "recharge_seller"') for sql in statements), 9)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "recharge_transaction"') for sql in statements), 3)
+
+        self.assertEqual(self.messages, [('info', '29 درخواست با موفقیت تایید شد.')])
+        self.assertFalse(CreditRequest.objects.filter(status='PENDING').exists())
+        for seller in self.sellers:
+            seller.refresh_from_db()
+            approved = seller.credit_requests.exclude(pk=already_approved.pk)
+            self.assertEqual(seller.credit, sum(req.amount for req in approved))
+            self.assertEqual(seller.transactions.count(), approved.count())
+
+        self.messages.clear()
+        self.admin.approve_requests(None, CreditRequest.objects.all())
+        self.assertEqual(self.messages, [('info', '0 درخواست با موفقیت تایید شد.')])
+
+
+
+class SellerBalanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = Seller.objects.create(name='Polled Seller', credit=Decimal('100.00'))
+
+    def _balance(self):
+        response = self.client.get(f'/api/sellers/{self.seller.id}/balance/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_reads_are_served_from_cache(self):
+        before = balance_cache.stats()
+        self.assertFalse(self._balance()['cached'])
+        with self.assertNumQueries(0):
+            body = self._balance()
+        self.assertTrue(body['cached'])
+        self.assertEqual(Decimal(str(body['credit'])), Decimal('100.00'))
+
+        after = balance_cache.stats()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_writes_update_or_invalidate_the_cache(self):
+        self._balance()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.sell(self.seller.id, Decimal('30.00'), '09128888888')
+        body = self._balance()
+        self.assertTrue(body['cached'])
+        self.assertEqual(Decimal(str(body['credit'])), Decimal('70.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.add_credit(self.seller.id, Decimal('5.00'))
+        body = self._balance()
+        self.assertFalse(body['cached'])
+        self.assertEqual(Decimal(str(body['credit'])), Decimal('75.00'))
+
+    def test_admin_credit_edit_invalidates_after_commit(self):
+        self._balance()
+        admin = SellerAdmin(Seller, admin_site)
+        form_class = admin.get_form(None, self.seller)
+        data = {field: getattr(self.seller, field) for field in form_class.base_fields}
+        data['credit'] = Decimal('40.00')
+        form = form_class(data, instance=self.seller)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            admin.save_model(None, form.save(commit=False), form, change=True)
+            # Still cached while the edit is uncommitted.
+            self.assertTrue(self._balance()['cached'])
+        for callback in callbacks:
+            callback()
+        body = self._balance()
+        self.assertFalse(body['cached'])
+        self.assertEqual(Decimal(str(body['credit'])), Decimal('40.00'))
+
+    def test_unknown_seller(self):
+        self.assertEqual(self.client.get('/api/sellers/999999/balance/').status_code, 404)
+
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Archived Seller', credit=Decimal('0.00'))
+        ledger.add_credit(self.seller.id, Decimal('1000.00'))
+        for _ in range(5):
+            ledger.sell(self.seller.id, Decimal('10.00'), '09121212121')
+        reconciliation.reconcile(self.seller.id, checkpoint=True)
+
+        self.old = list(self.seller.transactions.order_by('id')[:4])
+        Transaction.objects.filter(pk__in=[row.pk for row in self.old]).update(
+            timestamp=timezone.now() - timedelta(days=120)
+        )
+        ledger.sell(self.seller.id, Decimal('10.00'), '09121212121')
+
+    def test_archive_moves_rows_and_keeps_reads_working(self):
+        call_command('archive_transactions', '--batch-size', '3', stdout=io.StringIO())
+
+        self.assertEqual(self.seller.transactions.count(), 3)
+        self.assertEqual(ArchivedTransaction.objects.count(), 4)
+        summary = ArchivedLedgerSummary.objects.get()
+        self.assertEqual(summary.transaction_count, 4)
+        self.assertEqual(summary.total_amount, Decimal('970.00'))
+        self.assertEqual(summary.last_transaction_id, self.old[-1].pk)
+
+        response = self.client.get(f'/api/sellers/{self.seller.id}/transactions/', {'limit': 4})
+        body = response.json()
+        second = self.client.get(
+            f'/api/sellers/{self.seller.id}/transactions/', {'limit': 4, 'cursor': body['next_cursor']}
+        ).json()
+        ids = [row['id'] for row in body['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(
+            list(self.seller.transactions.values_list('id', flat=True))
+            + [row.pk for row in self.old]
+        ))
+
+        result = reconciliation.reconcile(self.seller.id)
+        self.assertTrue(result.ok, result)
+        self.assertEqual(result.expected, Decimal('940.00'))
+
+        self.assertEqual(archive.archive_before(timezone.now() - timedelta(days=90)), 0)
+
+
+class StatementExportTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Statement Seller', credit=Decimal('0.00'))
+        self.base = timezone.now() - timedelta(days=10)
+        for day, amount in [(0, '100.00'), (2, '-10.00'), (4, '50.00'), (6, '-5.00')]:
+            row = ledger.add_credit(self.seller.id, Decimal(amount))
+            Transaction.objects.filter(pk=row.pk).update(timestamp=self.base + timedelta(days=day))
+        # The oldest row is archived, so the statement has to merge both tables.
+        archive.archive_before(self.base + timedelta(days=1))
+
+    def _get(self, **params):
+        return self.client.get(f'/api/sellers/{self.seller.id}/statement/', params)
+
+    def test_csv_running_balance(self):
+        response = self._get(date_from=(self.base + timedelta(days=1)).isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['X-Opening-Balance'], '100.00')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,transaction_type,amount,balance,description')
+        balances = [line.split(',')[4] for line in lines[1:]]
+        self.assertEqual(balances, ['90.00', '140.00', '135.00'])
+
+    def test_ndjson_includes_archived_rows(self):
+        response = self._get(
+            date_from=(self.base - timedelta(days=1)).isoformat(),
+            date_to=(self.base + timedelta(days=3)).isoformat(),
+            format='ndjson'
+        )
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response['X-Opening-Balance'], '0.00')
+        self.assertEqual([row['balance'] for row in rows], ['100.00', '90.00'])
+
+    def test_opening_balance_takes_no_locks(self):
+        Seller.objects.filter(pk=self.seller.pk).update(credit_lease=Decimal('30.00'))
+        ledger.lease_credit(self.seller.id, 'worker-1')
+        with mock.patch.object(QuerySet, 'select_for_update', side_effect=AssertionError("statement took a lock")):
+            response = self._get(date_from=(self.base + timedelta(days=1)).isoformat())
+            b''.join(response.streaming_content)
+        self.assertEqual(response['X-Opening-Balance'], '100.00')
+        self.assertEqual(reconciliation.read_snapshot(self.seller.id), reconciliation.snapshot(self.seller.id))
+
+    def test_date_to_covers_the_whole_day(self):
+        day = timezone.localtime(self.base + timedelta(days=4)).date().isoformat()
+        response = self._get(date_from=day, date_to=day, format='ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['50.00'])
+        self.assertEqual(response['X-Opening-Balance'], '90.00')
+        self.assertIn(f'-{day.replace("-", "")}.ndjson', response['Content-Disposition'])
+
+    def test_errors(self):
+        self.assertEqual(self._get().status_code, 400)
+        response = self._get(date_from=self.base.isoformat(), date_to=(self.base - timedelta(days=1)).isoformat())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date_to', response.json())
+        response = self.client.get('/api/sellers/999999/statement/', {'date_from': self.base.isoformat()})
+        self.assertEqual(response.status_code, 404)
+
+
+class TopUpBenchmarkTests(TransactionTestCase):
+    @override_settings(RECHARGE_OUTBOX={'ENABLED': True})
+    def test_report(self):
+        config = benchmark.BenchConfig(requests=30, sellers=3, workers=1, amount=Decimal('10.00'), credit=Decimal('200.00'))
+        result = benchmark.run(config)
+
+        # The hot seller runs out of credit after 20 sales; nothing else may fail.
+        self.assertEqual(result['requests'], 30)
+        self.assertEqual(result['succeeded'] + result['failed'], 30)
+        self.assertEqual(set(result['failures']), {'InsufficientCredit'})
+        self.assertTrue(result['ledger_consistent'])
+        self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+        self.assertFalse(Seller.objects.filter(name__startswith=benchmark.SELLER_NAME_PREFIX).exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        json.dumps(result)
+
+    def test_plan_skew(self):
+        config = benchmark.BenchConfig(requests=1000, hot_sellers=1, hot_share=0.8)
+        requests = benchmark.plan(config, [1, 2, 3, 4, 5])
+        self.assertTrue(700 < requests.count(1) < 900)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 99), 4)
+
+
+class TopUpMetricsTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Metrics Seller', credit=Decimal('100.00'))
+
+    def test_outcomes_phases_and_queries(self):
+        before = {
+            outcome: metrics.TOPUP_REQUESTS.value(outcome)
+            for outcome in ('success', 'insufficient_credit', 'seller_not_found', 'invalid')
+        }
+        queries_before = metrics.TOPUP_QUERIES.count()
+        inserts_before = metrics.TOPUP_PHASE.count('insert')
+
+        top_up(self.client, self.seller.id, '60.00')
+        top_up(self.client, self.seller.id, '60.00')
+        top_up(self.client, 999999, '1.00')
+        top_up(self.client, self.seller.id, 'abc')
+
+        for outcome in before:
+            self.assertEqual(metrics.TOPUP_REQUESTS.value(outcome), before[outcome] + 1, outcome)
+        self.assertEqual(metrics.TOPUP_QUERIES.count(), queries_before + 4)
+        self.assertEqual(metrics.TOPUP_PHASE.count('insert'), inserts_before + 1)
+
+    def test_endpoint(self):
+        top_up(self.client, self.seller.id, '1.00')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('recharge_topup_requests_total{outcome="success"}', body)
+        self.assertIn('recharge_topup_phase_seconds_bucket{phase="validate",le="+Inf"}', body)
+        self.assertIn('recharge_topup_queries_count', body)
+        self.assertIn('recharge_balance_cache_hits_total', body)
+
+
+class FastTopUpTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Fast Seller', credit=Decimal('100.00'))
+
+    def _both(self, payload, **extra):
+        # Each request runs inside a rolled-back savepoint, so both paths see the same seller.
+        responses = []
+        for fast in (False, True):
+            with override_settings(RECHARGE_FAST_TOP_UP=fast):
+                sid = db_transaction.savepoint()
+                responses.append(post_json(self.client, '/api/top-up/', payload, **extra))
+                db_transaction.savepoint_rollback(sid)
+        return responses
+
+    def test_same_answers_as_drf(self):
+        seller_id = self.seller.id
+        payloads = [
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '12.5'},
+            {'seller_id': str(seller_id), 'phone_number': ' 0912 ', 'amount': 7},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '500.00'},
+            {'seller_id': 999999, 'phone_number': '09123456789', 'amount': '1.00'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '0'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '-3'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '1.234'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': '123456789'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': 'abc'},
+            {'seller_id': seller_id, 'phone_number': '09123456789', 'amount': 1.5},
+            {'seller_id': 'x', 'phone_number': '', 'amount': None},
+            {'seller_id': True, 'phone_number': 'a' * 21, 'amount': '1'},
+            {'seller_id': seller_id, 'phone_number': 12345, 'amount': '1'},
+            {'phone_number': '09123456789'},
+            [1, 2],
+            '{"seller_id": ',
+            '{"seller_id": 1, "phone_number": "0912", "amount": NaN}',
+        ]
+        for payload in payloads:
+            drf, fast = self._both(payload)
+            self.assertEqual(drf.status_code, fast.status_code, payload)
+            self.assertEqual(drf.content, fast.content, payload)
+            self.assertEqual(drf['Content-Type'], fast['Content-Type'], payload)
+
+    def test_idempotent_replay(self):
+        payload = {'seller_id': self.seller.id, 'phone_number': '09123456789', 'amount': '10.00'}
+        with override_settings(RECHARGE_FAST_TOP_UP=True):
+            first = post_json(self.client, '/api/top-up/', payload, HTTP_IDEMPOTENCY_KEY='fast-1')
+            replay = post_json(self.client, '/api/top-up/', payload, HTTP_IDEMPOTENCY_KEY='fast-1')
+        self.assertEqual(first.content, replay.content)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('90.00'))
+
+    def test_parse_accepts_only_what_the_serializer_accepts_unchanged(self):
+        body = json.dumps({'seller_id': 5, 'phone_number': ' 0912 ', 'amount': '3.5'}).encode()
+        self.assertEqual(fast_views.parse_top_up(body), (5, Decimal('3.50'), '0912'))
+        self.assertIsNone(fast_views.parse_top_up(b'{"seller_id": 5, "phone_number": "0912", "amount": "3.555"}'))
+        self.assertIsNone(fast_views.parse_top_up(b'{"seller_id": 5, "phone_number": "09\\u0000", "amount": "3"}'))
+
+
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Bursting Seller', credit=Decimal('100.00'))
+        self.other = Seller.objects.create(name='Quiet Seller', credit=Decimal('100.00'))
+
+    @override_settings(RECHARGE_ADMISSION={'ENABLED': True, 'MAX_IN_FLIGHT': 1, 'RATE': None})
+    def test_in_flight_limit(self):
+        with admission.admit(self.seller.id):
+            response = top_up(self.client, self.seller.id, '1.00')
+            self.assertEqual(top_up(self.client, self.other.id, '1.00').status_code, 200)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(admission.in_flight(self.seller.id), 0)
+
+        self.assertEqual(top_up(self.client, self.seller.id, '1.00').status_code, 200)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('99.00'))
+
+    @override_settings(RECHARGE_ADMISSION={'ENABLED': True, 'MAX_IN_FLIGHT': None, 'RATE': 0.1, 'BURST': 2})
+    def test_token_bucket(self):
+        statuses = [top_up(self.client, self.seller.id, '1.00').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = top_up(self.client, self.seller.id, '1.00')
+        # One token takes ten seconds to refill.
+        self.assertTrue(9 <= int(response['Retry-After']) <= 10)
+        self.assertEqual(top_up(self.client, self.other.id, '1.00').status_code, 200)
+
+        with override_settings(RECHARGE_FAST_TOP_UP=True):
+            self.assertEqual(top_up(self.client, self.seller.id, '1.00').status_code, 429)
+
+    @override_settings(RECHARGE_ADMISSION={'ENABLED': True, 'MAX_IN_FLIGHT': 2, 'RATE': 10, 'BURST': 5})
+    def test_idle_sellers_are_forgotten(self):
+        for seller_id in range(1000, 1100):
+            with admission.admit(seller_id):
+                pass
+        self.assertEqual(admission.in_flight(1000), 0)
+        self.assertNotIn(1000, admission._in_flight)
+        self.assertGreaterEqual(len(admission._buckets), 100)
+
+        # By the next sweep every bucket has refilled and is dropped.
+        later = time.monotonic() + admission._PRUNE_INTERVAL + 1
+        with mock.patch('recharge.admission.time.monotonic', return_value=later):
+            with admission.admit(self.seller.id):
+                pass
+        self.assertEqual(list(admission._buckets), [self.seller.id])
+
+    def test_disabled_by_default(self):
+        for _ in range(5):
+            with admission.admit(self.seller.id):
+                pass
+        self.assertEqual(admission.in_flight(self.seller.id), 0)
+
+
+class OperatorRoutingTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Routing Seller', credit=Decimal('100.00'))
+        operators.reset()
+
+    def test_normalize_phone_number(self):
+        for raw in ('09123456789', '+989123456789', '00989123456789', '989123456789',
+                    '9123456789', '0912 345 6789', '۰۹۱۲-۳۴۵-۶۷۸۹', '(0912) 345.6789'):
+            self.assertEqual(operators.normalize_phone_number(raw), '09123456789', raw)
+        self.assertEqual(operators.normalize_phone_number('02188776655'), '02188776655')
+
+    def test_longest_prefix_wins(self):
+        index = operators.PrefixIndex([('091', 1), ('0912', 2), ('09123', 3)])
+        self.assertEqual(index.lookup('09123456789'), 3)
+        self.assertEqual(index.lookup('09129999999'), 2)
+        self.assertEqual(index.lookup('09100000000'), 1)
+        self.assertIsNone(index.lookup('02188776655'))
+
+    def test_sale_records_operator_without_extra_queries(self):
+        mci = Operator.objects.get(code='mci')
+        operators.resolve('09120000000')
+        irancell = Operator.objects.get(code='irancell')
+        with self.assertNumQueries(0):
+            self.assertEqual(operators.resolve('09351234567'), irancell.pk)
+
+        for fast in (False, True):
+            with override_settings(RECHARGE_FAST_TOP_UP=fast):
+                response = top_up(self.client, self.seller.id, '1.00', '+98 912 345 6789')
+            self.assertEqual(response.status_code, 200, response.content)
+        sales = self.seller.transactions.filter(transaction_type='TOPUP_SALE')
+        self.assertEqual([sale.operator_id for sale in sales], [mci.pk, mci.pk])
+        self.assertTrue(all(sale.description.endswith('09123456789') for sale in sales))
+
+    def test_prefixes_are_reloaded_before_the_sale_transaction(self):
+        _, reservation = ledger.reserve(self.seller.id, Decimal('1.00'), '09123456789')
+        sales = [
+            lambda: top_up(self.client, self.seller.id, '1.00'),
+            lambda: ledger.sell_batch({self.seller.id: [(0, Decimal('1.00'), '09123456789')]}),
+            lambda: ledger.commit_reservation(reservation),
+        ]
+        for sell in sales:
+            operators.reset()
+            with CaptureQueriesContext(connection) as queries:
+                sell()
+            statements = [query['sql'] for query in queries]
+            reload = next(i for i, sql in enumerate(statements) if 'recharge_operatorprefix' in sql)
+            self.assertFalse([sql for sql in statements[:reload] if sql.startswith('SAVEPOINT')], statements)
+
+    def test_index_follows_prefix_changes(self):
+        operator = Operator.objects.create(name='Test Operator', code='test')
+        self.assertIsNone(operators.resolve('0999123456'))
+        with self.captureOnCommitCallbacks(execute=True):
+            OperatorPrefix.objects.create(operator=operator, prefix='0999')
+        self.assertEqual(operators.resolve('0999123456'), operator.pk)
+
+
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Stats Seller', credit=Decimal('0.00'))
+        self.other = Seller.objects.create(name='Other Stats Seller', credit=Decimal('0.00'))
+        ledger.add_credit(self.seller.id, Decimal('100.00'))
+        ledger.add_credit_batch([(self.seller.id, Decimal('50.00'), ''), (self.other.id, Decimal('20.00'), '')])
+        ledger.sell(self.seller.id, Decimal('10.00'), '09123456789')
+        ledger.sell_batch({
+            self.seller.id: [(0, Decimal('5.00'), '09123456789')],
+            self.other.id: [(1, Decimal('1.50'), '09351234567')],
+        })
+        _, reservation = ledger.reserve(self.seller.id, Decimal('2.00'), '09123456789')
+        ledger.commit_reservation(reservation, 'ref')
+        daily_stats.refresh()
+
+    def _stats(self):
+        return {
+            (row.seller_id, row.date, row.transaction_type): (row.transaction_count, row.total_amount)
+            for row in SellerDailyStats.objects.all()
+        }
+
+    def test_every_ledger_write_is_counted(self):
+        today = timezone.localdate()
+        stats = self._stats()
+        self.assertEqual(stats[(self.seller.id, today, 'CREDIT_INCREASE')], (2, Decimal('150.00')))
+        self.assertEqual(stats[(self.seller.id, today, 'TOPUP_SALE')], (3, Decimal('-17.00')))
+        self.assertEqual(stats[(self.other.id, today, 'TOPUP_SALE')], (1, Decimal('-1.50')))
+
+        daily_stats.rebuild()
+        self.assertEqual(self._stats(), stats)
+        call_command('rebuild_daily_stats', '--days', '1', stdout=io.StringIO())
+        self.assertEqual(self._stats(), stats)
+
+    def test_archived_rows_are_read_by_period(self):
+        stats = self._stats()
+        archive.archive_before(timezone.now() + timedelta(seconds=1))
+        self.assertFalse(Transaction.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            daily_stats.refresh()
+        self.assertEqual(self._stats(), stats)
+        archive_reads = [q['sql'] for q in queries.captured_queries if 'FROM "recharge_transaction_archive"' in q['sql']]
+        self.assertEqual(len(archive_reads), 1)
+        self.assertIn('"period" >=', archive_reads[0])
+
+    def test_sales_do_not_touch_the_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        self.assertFalse([q for q in queries.captured_queries if 'recharge_sellerdailystats' in q['sql']])
+        self.assertEqual(self._stats()[(self.seller.id, timezone.localdate(), 'TOPUP_SALE')][0], 3)
+        daily_stats.refresh()
+        self.assertEqual(self._stats()[(self.seller.id, timezone.localdate(), 'TOPUP_SALE')][0], 4)
+
+    def test_report_api(self):
+        today = timezone.localdate()
+        response = self.client.get('/api/reports/daily-sales/', {
+            'date_from': today.isoformat(), 'transaction_type': 'TOPUP_SALE'
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual(
+            [(row['seller_id'], row['transaction_count'], row['total_amount']) for row in results],
+            [(self.seller.id, 3, '-17.00'), (self.other.id, 1, '-1.50')]
+        )
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/reports/daily-sales/', {'date_from': today.isoformat(), 'seller_id': self.other.id})
+        self.assertEqual(self.client.get('/api/reports/daily-sales/').status_code, 400)
+        response = self.client.get('/api/reports/daily-sales/', {
+            'date_from': (today - timedelta(days=400)).isoformat(), 'date_to': today.isoformat()
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_seller_admin_columns(self):
+        admin = SellerAdmin(Seller, admin_site)
+        seller = admin.get_queryset(None).get(pk=self.seller.pk)
+        self.assertEqual(admin.sales_today(seller), 3)
+        self.assertEqual(admin.sales_amount_today(seller), Decimal('17.00'))
+
+
+@override_settings(RECHARGE_OUTBOX={'ENABLED': True}, RECHARGE_OUTBOX_SINK={'BACKEND': 'recharge.outbox.MemorySink'})
+class OutboxEventTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Outbox Seller', credit=Decimal('100.00'))
+
+    def test_events_are_written_with_the_ledger_row(self):
+        response = top_up(self.client, self.seller.id, '10.00')
+        self.assertEqual(response.status_code, 200, response.content)
+        sale = Transaction.objects.get(transaction_type='TOPUP_SALE')
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.event_type, outbox.TRANSACTION_CREATED)
+        self.assertEqual(event.payload['transaction_id'], sale.id)
+        self.assertEqual(event.payload['amount'], '-10.00')
+
+        # A rejected sale writes neither.
+        with self.assertRaises(InsufficientCredit):
+            ledger.sell(self.seller.id, Decimal('500.00'), '09123456789')
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+        with override_settings(RECHARGE_OUTBOX={'ENABLED': False}):
+            ledger.add_credit(self.seller.id, Decimal('5.00'))
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_approved_credit_requests_write_events(self):
+        requests = [CreditRequest.objects.create(seller=self.seller, amount=Decimal('5.00')) for _ in range(3)]
+        admin = CreditRequestAdmin(CreditRequest, admin_site)
+        with mock.patch.object(admin, 'message_user'):
+            admin.approve_requests(None, CreditRequest.objects.filter(pk__in=[r.pk for r in requests]))
+        payloads = [event.payload for event in OutboxEvent.objects.order_by('id')]
+        self.assertEqual(len(payloads), 3)
+        self.assertTrue(all(payload['transaction_type'] == 'CREDIT_INCREASE' for payload in payloads))
+
+    def test_dispatch_delivers_in_batches(self):
+        for _ in range(5):
+            ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        sink = outbox.get_sink()
+        with override_settings(RECHARGE_OUTBOX={'ENABLED': True, 'BATCH_SIZE': 2}):
+            self.assertEqual(outbox.dispatch_once(), (2, 0))
+            call_command('run_outbox', '--once', stdout=io.StringIO())
+        self.assertEqual(len(sink.events), 5)
+        self.assertEqual([event['id'] for event in sink.events], sorted(event['id'] for event in sink.events))
+        self.assertFalse(OutboxEvent.objects.exclude(status='DELIVERED').exists())
+        # Nothing is delivered twice.
+        self.assertEqual(outbox.dispatch_once(), (0, 0))
+
+    def test_failed_delivery_is_retried_later(self):
+        ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        sink = outbox.get_sink()
+        sink.fail = True
+        self.assertEqual(outbox.dispatch_once(), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('PENDING', 1))
+        self.assertIn('ConnectionError', event.last_error)
+        self.assertGreater(event.available_at, timezone.now())
+        # Not due yet.
+        sink.fail = False
+        self.assertEqual(outbox.dispatch_once(), (0, 0))
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.assertEqual(outbox.dispatch_once(), (1, 0))
+        self.assertEqual(OutboxEvent.objects.get().status, 'DELIVERED')
+
+    def test_gives_up_after_max_attempts(self):
+        ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        outbox.get_sink().fail = True
+        with override_settings(RECHARGE_OUTBOX={'ENABLED': True, 'MAX_ATTEMPTS': 2}):
+            outbox.dispatch_once()
+            OutboxEvent.objects.update(available_at=timezone.now())
+            outbox.dispatch_once()
+        self.assertEqual(OutboxEvent.objects.get().status, 'FAILED')
+
+    def test_purge_removes_delivered_and_failed_events(self):
+        for _ in range(3):
+            ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        delivered, failed, pending = OutboxEvent.objects.order_by('id')
+        long_ago = timezone.now() - timedelta(days=10)
+        OutboxEvent.objects.filter(pk=delivered.pk).update(status='DELIVERED', delivered_at=long_ago)
+        OutboxEvent.objects.filter(pk=failed.pk).update(status='FAILED', available_at=long_ago)
+        OutboxEvent.objects.filter(pk=pending.pk).update(available_at=long_ago)
+        self.assertEqual(outbox.purge(timedelta(days=7)), 2)
+        self.assertEqual(list(OutboxEvent.objects.values_list('pk', flat=True)), [pending.pk])
+
+    def test_worker_needs_a_sink(self):
+        ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        with override_settings(RECHARGE_OUTBOX_SINK={}):
+            with self.assertRaises(ImproperlyConfigured):
+                outbox.dispatch_once()
+        # The event was not claimed.
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('PENDING', 0))
+
+    def test_disabled_by_default(self):
+        with self.settings(RECHARGE_OUTBOX={}):
+            ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_file_sink(self):
+        import os
+        import tempfile
+        ledger.sell(self.seller.id, Decimal('1.00'), '09123456789')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.ndjson')
+            self.assertEqual(outbox.dispatch_once(outbox.FileSink(path)), (1, 0))
+            with open(path, encoding='utf-8') as events:
+                lines = [json.loads(line) for line in events]
+        self.assertEqual(lines[0]['payload']['seller_id'], self.seller.id)
+
+
+class CreditLeaseLedgerTests(TestCase):
+    def setUp(self):
+        self.seller = Seller.objects.create(name='Lease Seller', credit=Decimal('0.00'), credit_lease=Decimal('30.00'))
+        ledger.add_credit(self.seller.id, Decimal('100.00'))
+
+    def _sale(self, key, amount):
+        return (key, Decimal(amount), '09123456789')
+
+    def test_lease_moves_credit_and_sales_reduce_it(self):
+        lease, granted, seller_credit = ledger.lease_credit(self.seller.id, 'worker-1')
+        self.assertEqual((lease.amount, granted, seller_credit), (Decimal('30.00'), Decimal('30.00'), Decimal('70.00')))
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+        orphaned, balances = ledger.sell_from_leases(
+            {lease.pk: (self.seller.id, [self._sale(0, '5.00'), self._sale(1, '7.50')])}
+        )
+        self.assertEqual((orphaned, balances), ({}, {self.seller.id: Decimal('87.50')}))
+        self.assertEqual(Seller.objects.get(pk=self.seller.pk).total_credit, Decimal('87.50'))
+        lease.refresh_from_db()
+        self.assertEqual(lease.amount, Decimal('17.50'))
+        self.assertEqual(self.seller.transactions.filter(transaction_type='TOPUP_SALE').count(), 2)
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+        # Topping up counts what the holder still has on the lease.
+        _, granted, seller_credit = ledger.lease_credit(
+            self.seller.id, 'worker-1', lease_id=lease.pk, allowance=Decimal('17.50')
+        )
+        self.assertEqual((granted, seller_credit), (Decimal('12.50'), Decimal('57.50')))
+
+        self.assertTrue(ledger.return_lease(lease.pk))
+        self.assertFalse(ledger.return_lease(lease.pk))
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('87.50'))
+        self.assertTrue(reconciliation.reconcile(self.seller.id).ok)
+
+    def test_sales_of_a_returned_lease_are_handed_back(self):
+        lease, _, _ = ledger.lease_credit(self.seller.id, 'worker-1')
+        ledger.return_lease(lease.pk)
+        sales = [self._sale(0, '5.00')]
+        self.assertEqual(ledger.sell_from_leases({lease.pk: (self.seller.id, sales)}), ({self.seller.id: sales}, {}))
+        self.assertFalse(self.seller.transactions.filter(transaction_type='TOPUP_SALE').exists())
+
+    def test_lease_is_bounded_by_credit_and_opt_in(self):
+        Seller.objects.filter(pk=self.seller.pk).update(credit=Decimal('10.00'))
+        lease, granted, seller_credit = ledger.lease_credit(self.seller.id, 'worker-1', want=Decimal('50.00'))
+        self.assertEqual((granted, seller_credit), (Decimal('10.00'), Decimal('0.00')))
+        self.assertEqual(ledger.lease_credit(self.seller.id, 'worker-2'), (None, Decimal('0.00'), Decimal('0.00')))
+
+        other = Seller.objects.create(name='Unleased Seller', credit=Decimal('10.00'))
+        self.assertIsNone(ledger.lease_credit(other.id, 'worker-1'))
+        self.assertIsNone(ledger.lease_credit(999999, 'worker-1'))
+
+    def test_expired_leases_are_returned(self):
+        lease, _, _ = ledger.lease_credit(self.seller.id, 'worker-1', ttl=60)
+        self.assertEqual(ledger.release_expired_leases(), 0)
+        CreditLease.objects.filter(pk=lease.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = io.StringIO()
+        call_command('release_expired_leases', stdout=out)
+        self.assertIn('1 expired', out.getvalue())
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.credit, Decimal('100.00'))
+
+
+@override_settings(RECHARGE_CREDIT_LEASES={'ENABLED': True, 'MAX_WAIT_MS': 20})
+class CreditLeaseTopUpTests(TransactionTestCase):
+    def _top_up(self, seller, amount, statuses):
+        response = top_up(self.client, seller.id, amount)
+        statuses.append(response.status_code)
+        return response
+
+    def test_sales_are_served_from_the_lease_within_the_balance(self):
+        seller = Seller.objects.create(name='Leased API Seller', credit=Decimal('0.00'), credit_lease=Decimal('1000.00'))
+        ledger.add_credit(seller.id, Decimal('1000.00'))
+        statuses = []
+        threads = [threading.Thread(target=self._top_up, args=(seller, '75.00', statuses)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * 10)
+        lease = CreditLease.objects.get(seller=seller, status='ACTIVE')
+        self.assertEqual(lease.amount, Decimal('250.00'))
+        self.assertEqual(seller.transactions.filter(transaction_type='TOPUP_SALE').count(), 10)
+        self.assertTrue(reconciliation.reconcile(seller.id).ok)
+
+        # The whole balance is on the lease, so a larger sale falls through
+        # to the seller's own credit and is refused.
+        response = self._top_up(seller, '300.00', statuses)
+        self.assertEqual(response.status_code, 400, response.content)
+        response = self._top_up(seller, '200.00', statuses)
+        self.assertEqual(response.json()['remaining_credit'], 50.0)
+
+        leases.release_all()
+        seller.refresh_from_db()
+        self.assertFalse(CreditLease.objects.filter(seller=seller, status='ACTIVE').exists())
+        self.assertEqual(seller.credit, Decimal('50.00'))
+        self.assertTrue(reconciliation.reconcile(seller.id).ok)
+
+    def test_leased_credit_counts_in_every_balance(self):
+        cache.clear()
+        seller = Seller.objects.create(name='Leased Balance Seller', credit=Decimal('0.00'), credit_lease=Decimal('30.00'))
+        ledger.add_credit(seller.id, Decimal('100.00'))
+        response = self._top_up(seller, '10.00', [])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(CreditLease.objects.filter(seller=seller, status='ACTIVE').exists())
+
+        self.assertEqual(response.json()['remaining_credit'], 90.0)
+        balance = self.client.get(f'/api/sellers/{seller.id}/balance/').json()
+        self.assertEqual(Decimal(str(balance['credit'])), Decimal('90.00'))
+        self.assertEqual(Seller.objects.get(pk=seller.pk).total_credit, Decimal('90.00'))
+        admin = SellerAdmin(Seller, admin_site)
+        self.assertEqual(admin.total_credit(admin.get_queryset(None).get(pk=seller.pk)), Decimal('90.00'))
+
+        # Turning leasing off hands the lease back to the seller.
+        form_class = admin.get_form(None, seller)
+        seller = Seller.objects.get(pk=seller.pk)
+        data = {field: getattr(seller, field) for field in form_class.base_fields}
+        data['credit_lease'] = Decimal('0.00')
+        form = form_class(data, instance=seller)
+        self.assertTrue(form.is_valid(), form.errors)
+        admin.save_model(None, form.save(commit=False), form, change=True)
+        seller.refresh_from_db()
+        self.assertFalse(CreditLease.objects.filter(seller=seller, status='ACTIVE').exists())
+        self.assertEqual((seller.credit, seller.total_credit), (Decimal('90.00'), Decimal('90.00')))
+        self.assertTrue(reconciliation.reconcile(seller.id).ok)
+
+    def test_state_of_unleased_sellers_is_pruned(self):
+        manager = leases.LeaseManager()
+        self.addCleanup(manager.stop)
+        for seller_id in range(900000, 900005):
+            self.assertIsNone(manager.sell(seller_id, Decimal('1.00'), '09123456789'))
+        self.assertEqual(len(manager._unleased), 5)
+        self.assertEqual(len(manager._seller_locks), 5)
+
+        # Entries are kept while they still short-cut the lease lookup.
+        manager._return_idle()
+        self.assertEqual(len(manager._unleased), 5)
+        self.assertEqual(manager._seller_locks, {})
+
+        manager._unleased = dict.fromkeys(manager._unleased, 0.0)
+        manager._return_idle()
+        self.assertEqual(manager._unleased, {})
+
+    def test_sellers_without_a_lease_size_use_the_normal_path(self):
+        seller = Seller.objects.create(name='Plain API Seller', credit=Decimal('100.00'))
+        response = self._top_up(seller, '40.00', [])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['remaining_credit'], 60.0)
+        self.assertFalse(CreditLease.objects.exists())
+
+
+class ImportCreditsTests(TestCase):
+    def setUp(self):
+        self.existing = Seller.objects.create(name='Existing Seller', credit=Decimal('10.00'))
+
+    def test_chunks_are_applied_and_bad_rows_reported(self):
+        lines = io.StringIO(
+            'name,amount,description\n'
+            'Existing Seller,100.00,\n'
+            'New Seller,50,opening balance\n'
+            ',10\n'
+            'New Seller,25.50,\n'
+            'Bad Amount,-5\n'
+            'Bad Amount,1.005\n'
+            'Other New Seller,7\n'
+        )
+        reported = []
+        with CaptureQueriesContext(connection) as queries:
+            result = imports.import_credits(
+                lines, chunk_size=3, on_error=lambda line, row, message: reported.append((line, row['name']))
+            )
+
+        self.assertEqual((result.rows, result.imported, result.created_sellers), (7, 4, 2))
+        self.assertEqual(result.total_amount, Decimal('182.50'))
+        self.assertEqual([line for line, _ in result.errors], [4, 6, 7])
+        self.assertEqual(reported, [(4, ''), (6, 'Bad Amount'), (7, 'Bad Amount')])
+        self.assertFalse(Seller.objects.filter(name='Bad Amount').exists())
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.credit, Decimal('110.00'))
+        new_seller = Seller.objects.get(name='New Seller')
+        self.assertEqual(new_seller.credit, Decimal('75.50'))
+        self.assertEqual(
+            sorted(new_seller.transactions.values_list('description', flat=True)),
+            [imports.DESCRIPTION, 'opening balance']
+        )
+        # A seller lookup per chunk, not per row.
+        lookups = [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and '"name" IN' in q['sql']]
+        self.assertEqual(len(lookups), 3 + 2)
+
+    def test_sellers_created_meanwhile_are_not_counted(self):
+        # The first lookup misses 'Raced Seller', as if it was created right after.
+        Seller.objects.create(name='Raced Seller')
+        in_bulk = Seller.objects.in_bulk
+        lookups = iter([lambda names, **kwargs: {}])
+
+        def lookup(names, **kwargs):
+            return next(lookups, in_bulk)(names, **kwargs)
+
+        lines = io.StringIO('name,amount\nRaced Seller,5\nFresh Seller,5\n')
+        with mock.patch.object(Seller.objects, 'in_bulk', side_effect=lookup):
+            result = imports.import_credits(lines)
+        self.assertEqual((result.imported, result.created_sellers), (2, 1))
+        self.assertEqual(Seller.objects.get(name='Raced Seller').credit, Decimal('5.00'))
+
+    def test_unknown_sellers_can_be_rejected(self):
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch('sys.stdin', io.StringIO('name,amount\nExisting Seller,5\nNobody,5\n')):
+            call_command('import_credits', '-', '--no-create-sellers', stdout=out, stderr=err)
+        self.assertIn('1 of 2 rows imported', out.getvalue())
+        self.assertIn('line 3', err.getvalue())
+        self.assertFalse(Seller.objects.filter(name='Nobody').exists())
+
+        with self.assertRaises(CommandError):
+            with mock.patch('sys.stdin', io.StringIO('seller,credit\nExisting Seller,5\n')):
+                call_command('import_credits', '-', stdout=io.StringIO())
+
+    def test_admin_upload(self):
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.assertContains(self.client.get('/admin/recharge/seller/'), 'import-credits/')
+
+        upload = SimpleUploadedFile('credits.csv', '\ufeffname,amount\nفروشنده نو,30\nExisting Seller,x\n'.encode())
+        response = self.client.post('/admin/recharge/seller/import-credits/', {
+            'file': upload, 'create_sellers': 'on', 'description': '',
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        texts = [str(message) for message in response.context['messages']]
+        self.assertIn('1 سطر از 2 سطر ثبت شد', texts[0])
+        self.assertTrue(texts[1].startswith('سطر 3:'))
+        self.assertEqual(Seller.objects.get(name='فروشنده نو').credit, Decimal('30.00'))
@@ -1,6 +1,24 @@
 from django.urls import path
-from .views import TopUpAPIView
+from . import fast_views
+from .async_views import async_top_up
+from .views import (
+    DailySalesReportAPIView,
+    SellerBalanceAPIView,
+    SellerTransactionHistoryAPIView,
+    TopUpBatchAPIView,
+    seller_statement,
+)
 
 urlpatterns = [
-    path('top-up/', TopUpAPIView.as_view(), name='top-up'),
+    path('top-up/', fast_views.top_up, name='top-up'),
+    path('top-up/batch/', TopUpBatchAPIView.as_view(), name='top-up-batch'),
+    path('top-up/async/', async_top_up, name='top-up-async'),
+    path(
+        'sellers/<int:seller_id>/transactions/',
+        SellerTransactionHistoryAPIView.as_view(),
+        name='seller-transactions'
+    ),
+    path('sellers/<int:seller_id>/balance/', SellerBalanceAPIView.as_view(), name='seller-balance'),
+    path('sellers/<int:seller_id>/statement/', seller_statement, name='seller-statement'),
+    path('reports/daily-sales/', DailySalesReportAPIView.as_view(), name='daily-sales-report'),
 ]
\ No newline at end of file
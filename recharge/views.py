@@ -1,66 +1,375 @@
-from django.db import transaction
+import contextlib
+import logging
+
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Seller, Transaction
-from .serializers import TopUpSerializer
+from . import admission, balance_cache, group_commit, idempotency, leases, ledger, metrics, operators, statements
+from .exceptions import ConcurrentUpdate, InsufficientCredit, TooManyRequests
+from .models import ArchivedTransaction, Seller, SellerDailyStats, Transaction
+from .pagination import InvalidCursor, keyset_page
+from .serializers import (
+    DailyStatsQuerySerializer,
+    SellerDailyStatsSerializer,
+    StatementQuerySerializer,
+    TopUpBatchSerializer,
+    TopUpSerializer,
+    TransactionHistoryQuerySerializer,
+    TransactionSerializer,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class TopUpAPIView(APIView):
     def post(self, request, *args, **kwargs):
-        serializer = TopUpSerializer(data=request.data)
+        with metrics.top_up_probe() as probe:
+            with probe.phase('validate'):
+                serializer = TopUpSerializer(data=request.data)
+                valid = serializer.is_valid()
+
+            if not valid:
+                probe.outcome = 'invalid'
+                logger.debug("Invalid top-up request: %s", serializer.errors)
+                return Response(
+                    serializer.errors,
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            validated_data = serializer.validated_data
+            body, status_code, headers = perform_top_up(
+                probe,
+                validated_data['seller_id'],
+                validated_data['amount'],
+                validated_data['phone_number'],
+                request.headers.get(idempotency.HEADER)
+            )
+            return Response(body, status=status_code, headers=headers)
+
+
+def perform_top_up(probe, seller_id, amount, phone_number, idempotency_key):
+    """Sell a validated top-up and return the (body, status code, headers) to answer with.
+
+    Shared by TopUpAPIView and the fast path in fast_views, so both answer
+    every request the same way.
+    """
+    if idempotency_key is not None:
+        if not idempotency_key or len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+            probe.outcome = 'invalid'
+            return (
+                {idempotency.HEADER: [f"باید بین ۱ تا {idempotency.MAX_KEY_LENGTH} کاراکتر باشد."]},
+                status.HTTP_400_BAD_REQUEST,
+                None
+            )
+        stored = idempotency.lookup(seller_id, idempotency_key)
+        if stored is not None:
+            return _replay(probe, stored, amount, phone_number)
+
+    # Checked before anything waits on the seller's lock, so a bursting
+    # seller is turned away instead of tying up every worker thread.
+    try:
+        with admission.admit(seller_id):
+            return _sell(probe, seller_id, amount, phone_number, idempotency_key)
+    except TooManyRequests as e:
+        probe.outcome = 'throttled'
+        return (
+            {"error": "تعداد درخواست‌های این فروشنده بیش از حد مجاز است، کمی بعد دوباره تلاش کنید."},
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            {'Retry-After': str(e.retry_after)}
+        )
+
+
+def _sell(probe, seller_id, amount, phone_number, idempotency_key):
+    # Keyed requests store their response in the sale's own transaction,
+    # so they cannot be folded into a group commit or a lease flush.
+    grouped = idempotency_key is None and group_commit.is_enabled()
+    leased = idempotency_key is None and leases.is_enabled()
+    # Looked up before the transaction below, so a prefix reload never runs under the seller's lock.
+    operator_id = None if grouped else operators.resolve(phone_number)
+
+    try:
+        # Grouped and leased sales are committed by a background thread; a
+        # transaction held open here would only block it (on SQLite it
+        # holds the very write lock that thread needs).
+        with contextlib.nullcontext() if grouped or leased else probe.atomic():
+            try:
+                remaining_credit = None
+                if leased:
+                    with probe.phase('lease'):
+                        remaining_credit = leases.sell(seller_id, amount, phone_number)
+                # None: the seller does not use leases or its lease cannot cover the sale.
+                if remaining_credit is None:
+                    if grouped:
+                        with probe.phase('group_commit'):
+                            remaining_credit = group_commit.sell(seller_id, amount, phone_number)
+                    else:
+                        seller, _ = ledger.sell(seller_id, amount, phone_number, operator_id)
+                        remaining_credit = seller.total_credit
+                body = {
+                    "message": "شارژ با موفقیت انجام شد.",
+                    "remaining_credit": remaining_credit
+                }
+                status_code = status.HTTP_200_OK
+                probe.outcome = 'success'
+            except InsufficientCredit:
+                body = {"error": "اعتبار کافی نیست."}
+                status_code = status.HTTP_400_BAD_REQUEST
+                probe.outcome = 'insufficient_credit'
+
+            # Stored in the same transaction as the sale: if a concurrent
+            # retry with the same key commits first, this insert fails and
+            # our sale is rolled back with it.
+            if idempotency_key is not None:
+                idempotency.remember(
+                    seller_id, idempotency_key, idempotency.fingerprint(amount, phone_number), status_code, body
+                )
+
+        return body, status_code, None
+
+    except IntegrityError as e:
+        stored = idempotency.lookup(seller_id, idempotency_key) if idempotency_key else None
+        if stored is not None:
+            return _replay(probe, stored, amount, phone_number)
+
+        probe.outcome = 'error'
+        logger.exception("Top-up for seller %s failed", seller_id)
+        return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR, None
+    except ConcurrentUpdate:
+        probe.outcome = 'conflict'
+        return (
+            {"error": "اعتبار فروشنده همزمان در حال تغییر است، دوباره تلاش کنید."},
+            status.HTTP_409_CONFLICT,
+            None
+        )
+    except Seller.DoesNotExist:
+        probe.outcome = 'seller_not_found'
+        return {"error": "فروشنده یافت نشد."}, status.HTTP_404_NOT_FOUND, None
+    except TimeoutError:
+        # Only grouped and leased sales wait on another thread, and that
+        # thread may still commit the sale after we stop waiting.
+        probe.outcome = 'timeout'
+        logger.warning("Top-up for seller %s timed out waiting for its commit", seller_id)
+        return (
+            {"error": "نتیجه‌ی شارژ مشخص نیست؛ پیش از تکرار درخواست، تراکنش‌های فروشنده را بررسی کنید."},
+            status.HTTP_504_GATEWAY_TIMEOUT,
+            None
+        )
+    except Exception as e:
+        probe.outcome = 'error'
+        logger.exception("Top-up for seller %s failed", seller_id)
+        return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR, None
+
+
+def _replay(probe, stored, amount, phone_number):
+    # A key answers only the request it was first used with; another
+    # amount or number under it is a client bug, not a retry.
+    if not idempotency.matches(stored, idempotency.fingerprint(amount, phone_number)):
+        probe.outcome = 'invalid'
+        return (
+            {idempotency.HEADER: ["این کلید پیش‌تر برای درخواستی با مبلغ یا شماره‌ی دیگری استفاده شده است."]},
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            None
+        )
+    probe.outcome = 'replayed'
+    return stored.response, stored.status_code, {'Idempotent-Replayed': 'true'}
+
+
+class TopUpBatchAPIView(APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = TopUpBatchSerializer(data=request.data)
 
-    
         if not serializer.is_valid():
-            print("Serializer Errors:", serializer.errors)
             return Response(
-                serializer.errors, 
+                serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        validated_data = serializer.validated_data
-        seller_id = validated_data['seller_id']
-        amount = validated_data['amount']
-        phone_number = validated_data['phone_number']
+
+        items = serializer.validated_data['items']
+        results = [None] * len(items)
+        sales_by_seller = {}
+
+        for index, item in enumerate(items):
+            item_serializer = TopUpSerializer(data=item)
+            if not item_serializer.is_valid():
+                results[index] = {
+                    "index": index,
+                    "status": "rejected",
+                    "errors": item_serializer.errors,
+                }
+                continue
+            data = item_serializer.validated_data
+            sales_by_seller.setdefault(data['seller_id'], []).append(
+                (index, data['amount'], data['phone_number'])
+            )
 
         try:
-            with transaction.atomic():
-
-                seller = Seller.objects.select_for_update().get(pk=seller_id)
-                
-                if seller.credit < amount:
-                    return Response(
-                        {"error": "اعتبار کافی نیست."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                seller.credit -= amount
-                seller.save()
-                
-                Transaction.objects.create(
-                    seller=seller,
-                    amount=-amount,
-                    transaction_type='TOPUP_SALE',
-                    description=f"شارژ برای شماره {phone_number}"
-                )
-            
+            outcomes = ledger.sell_batch(sales_by_seller)
+        except Exception as e:
+            logger.exception("Batch top-up failed")
             return Response(
-                {
-                    "message": "شارژ با موفقیت انجام شد.", 
-                    "remaining_credit": seller.credit
-                },
-                status=status.HTTP_200_OK
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            
-        except Seller.DoesNotExist:
+
+        for index, outcome in outcomes.items():
+            if isinstance(outcome, InsufficientCredit):
+                results[index] = {"index": index, "status": "rejected", "error": "اعتبار کافی نیست."}
+            elif isinstance(outcome, Seller.DoesNotExist):
+                results[index] = {"index": index, "status": "rejected", "error": "فروشنده یافت نشد."}
+            else:
+                results[index] = {"index": index, "status": "accepted", "remaining_credit": outcome}
+
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+        return Response(
+            {
+                "accepted": accepted,
+                "rejected": len(results) - accepted,
+                "results": results,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class SellerTransactionHistoryAPIView(APIView):
+    def get(self, request, seller_id, *args, **kwargs):
+        query = TransactionHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                query.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        params = query.validated_data
+
+        filters = {'seller_id': seller_id, **query.timestamp_filters()}
+        if 'transaction_type' in params:
+            filters['transaction_type'] = params['transaction_type']
+        ledgers = [
+            Transaction.objects.filter(**filters),
+            ArchivedTransaction.objects.filter(**filters),
+        ]
+
+        try:
+            rows, next_cursor = keyset_page(ledgers, params.get('cursor'), params['limit'])
+        except InvalidCursor:
+            return Response(
+                {"cursor": ["نشانگر صفحه نامعتبر است."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Only an empty page needs the extra query to tell "no rows" from "no seller".
+        if not rows and not Seller.objects.filter(pk=seller_id).exists():
             return Response(
-                {"error": "فروشنده یافت نشد."}, 
+                {"error": "فروشنده یافت نشد."},
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            
-            print(f"An unexpected error occurred: {e}")
+
+        next_url = None
+        if next_cursor is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+
+        return Response(
+            {
+                "next": next_url,
+                "next_cursor": next_cursor,
+                "results": TransactionSerializer(rows, many=True).data,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class SellerBalanceAPIView(APIView):
+    def get(self, request, seller_id, *args, **kwargs):
+        credit = balance_cache.get(seller_id)
+        cached = credit is not None
+
+        if not cached:
+            try:
+                credit = Seller.objects.get(pk=seller_id).total_credit
+            except Seller.DoesNotExist:
+                return Response(
+                    {"error": "فروشنده یافت نشد."},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            balance_cache.store(seller_id, credit)
+
+        return Response(
+            {
+                "seller_id": seller_id,
+                "credit": credit,
+                "cached": cached,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class DailySalesReportAPIView(APIView):
+    def get(self, request, *args, **kwargs):
+        query = DailyStatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
             return Response(
-                {"error": str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+                query.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        params = query.validated_data
+
+        # Served from the precomputed daily totals: the cost grows with
+        # days x sellers, not with the number of ledger rows.
+        stats = SellerDailyStats.objects.filter(date__gte=params['date_from'], date__lte=params['date_to'])
+        if 'seller_id' in params:
+            stats = stats.filter(seller_id=params['seller_id'])
+        if 'transaction_type' in params:
+            stats = stats.filter(transaction_type=params['transaction_type'])
+        stats = stats.order_by('date', 'seller_id', 'transaction_type')
+
+        return Response(
+            {
+                "date_from": params['date_from'],
+                "date_to": params['date_to'],
+                "results": SellerDailyStatsSerializer(stats, many=True).data,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+@require_GET
+def seller_statement(request, seller_id):
+    # A plain Django view: DRF's Response would build the whole body in memory.
+    query = StatementQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = query.validated_data
+    date_from = params['date_from']
+    date_to = params.get('date_to') or timezone.now()
+    timestamp_filters = query.timestamp_filters()
+    if 'date_to' not in params:
+        timestamp_filters['timestamp__lte'] = date_to
+
+    try:
+        opening, last_id = statements.opening_balance(seller_id, date_from)
+    except Seller.DoesNotExist:
+        return JsonResponse(
+            {"error": "فروشنده یافت نشد."},
+            status=status.HTTP_404_NOT_FOUND,
+            json_dumps_params={'ensure_ascii': False}
+        )
+
+    rows = statements.statement_rows(seller_id, timestamp_filters, last_id, opening)
+    if params['format'] == 'ndjson':
+        response = StreamingHttpResponse(statements.as_ndjson(rows), content_type='application/x-ndjson')
+    else:
+        response = StreamingHttpResponse(statements.as_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = (
+        f'attachment; filename="statement-{seller_id}-{date_from:%Y%m%d}-{date_to:%Y%m%d}.{params["format"]}"'
+    )
+    response['X-Opening-Balance'] = str(opening)
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')